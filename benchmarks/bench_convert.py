@@ -0,0 +1,156 @@
+"""
+End-to-end benchmark for murakami-convert. For each test type it generates a
+synthetic archive with benchmarks.corpus, converts it in a fresh process, and
+reports throughput, peak RSS and the time spent in each pipeline stage. The
+results are printed and, with --output, written as JSON so that runs from
+different releases can be compared.
+
+Usage: python -m benchmarks.bench_convert [--files N] [--tests ndt5,ndt7]
+           [--formats csv,parquet] [--jobs N] [--output results.json]
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from murakami import __version__
+from benchmarks import corpus
+
+PATTERN = "%s-%%l-%%n-%%c-%%d.jsonl"
+
+
+class _Timed:
+    """
+    Wraps a pipeline stage's iterator and accumulates the time spent waiting
+    for it, which includes the time spent in the stages before it.
+    """
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+        self.elapsed = 0.0
+        self.items = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            item = next(self._iterator)
+        finally:
+            self.elapsed += time.perf_counter() - start
+        self.items += 1
+        return item
+
+
+def run_one(test, directory, output_format, jobs):
+    """
+    Convert a corpus directory the way murakami-convert does, timing each
+    stage, and return the measurements as a dict.
+    """
+    from scripts import convert
+
+    # Failed and variant inputs are expected; don't time their warnings.
+    logging.basicConfig(level=logging.ERROR)
+    output = os.path.join(os.path.dirname(directory), "out." + output_format)
+    errors = []
+    start = time.perf_counter()
+    discovered = _Timed(convert.discover([directory], prefix=None))
+    imported = _Timed(
+        convert.import_records(discovered,
+                               convert.tests[test],
+                               jobs=jobs,
+                               errors=errors))
+    annotated = _Timed(
+        convert.annotate(imported,
+                         PATTERN % corpus.FILE_PREFIXES[test]))
+    convert.exporters[output_format](output, (r for _, r in annotated))
+    wall = time.perf_counter() - start
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "files": discovered.items,
+        "records": annotated.items,
+        "errors": len(errors),
+        "wall_s": wall,
+        "files_per_s": discovered.items / wall if wall else None,
+        "peak_rss_kb": max(usage.ru_maxrss, children.ru_maxrss),
+        "output_bytes": os.path.getsize(output),
+        "stages_s": {
+            "discover": discovered.elapsed,
+            "import": imported.elapsed - discovered.elapsed,
+            "annotate": annotated.elapsed - imported.elapsed,
+            "export": wall - annotated.elapsed,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--tests", default=",".join(corpus.GENERATORS))
+    parser.add_argument("--formats", default="csv")
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    parser.add_argument("--variant-rate", type=float, default=0.1)
+    parser.add_argument("--output", help="Write the results to a JSON file.")
+    parser.add_argument("--run-one", nargs=4, metavar=("TEST", "DIRECTORY",
+                                                       "FORMAT", "JOBS"),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        test, directory, output_format, jobs = args.run_one
+        json.dump(run_one(test, directory, output_format, int(jobs)),
+                  sys.stdout)
+        return
+
+    results = []
+    for test in args.tests.split(","):
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = os.path.join(tmp, "corpus")
+            corpus.generate(test, directory, args.files, args.failure_rate,
+                            args.variant_rate)
+            for output_format in args.formats.split(","):
+                # Each run gets a fresh interpreter so peak RSS is its own.
+                output = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_convert",
+                     "--run-one", test, directory, output_format,
+                     str(args.jobs)],
+                    check=True,
+                    stdout=subprocess.PIPE,
+                    universal_newlines=True,
+                ).stdout
+                result = json.loads(output)
+                result.update(test=test, format=output_format,
+                              jobs=args.jobs)
+                results.append(result)
+                print("%-12s %-8s %8d files %10.0f files/s %8d KiB peak RSS "
+                      "%s" % (test, output_format, result["files"],
+                              result["files_per_s"], result["peak_rss_kb"],
+                              " ".join("%s=%.2fs" % s for s in
+                                       result["stages_s"].items())))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "murakami_version": __version__,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "timestamp": datetime.datetime.utcnow().isoformat(),
+                "files": args.files,
+                "failure_rate": args.failure_rate,
+                "variant_rate": args.variant_rate,
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark for the murakami-convert JSON decode path. It writes a directory of
+small ndt7 result files and reports how many files per second are decoded by
+the previous per-file `json.load` path and by `scripts.convert.read_json`,
+with and without orjson.
+
+Usage: python -m benchmarks.bench_decode [--files N] [--repeat N]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from scripts import convert
+
+RECORD = {
+    "TestName": "ndt7",
+    "TestStartTime": "2020-02-25T17:02:40.918022",
+    "TestEndTime": "2020-02-25T17:03:01.754734",
+    "MurakamiLocation": "Baltimore",
+    "MurakamiConnectionType": "wired",
+    "MurakamiNetworkType": "home",
+    "ServerName": "ndt-iupui-mlab3-mil04.measurement-lab.org",
+    "ServerIP": "213.242.77.165",
+    "ClientIP": "93.188.101.116",
+    "DownloadUUID": "ndt-cz99j_1580820576_000000000003708B",
+    "DownloadValue": 405.32368416128276,
+    "DownloadUnit": "Mbit/s",
+    "DownloadError": None,
+    "UploadValue": 26.85925099645699,
+    "UploadUnit": "Mbit/s",
+    "UploadError": None,
+    "DownloadRetransValue": 2.3442441873334583,
+    "DownloadRetransUnit": "%",
+    "MinRTTValue": 29.108,
+    "MinRTTUnit": "ms",
+}
+
+
+def stdlib_load(path):
+    """The decode path used by the importers before read_json()."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def measure(paths, decode, repeat):
+    """Return the best files-per-second rate of `decode` over `paths`."""
+    best = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in paths:
+            decode(path)
+        best = max(best, len(paths) / (time.perf_counter() - start))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(args.files):
+            path = os.path.join(tmp, "ndt7-%08d.jsonl" % i)
+            with open(path, "w") as f:
+                f.write(json.dumps(RECORD) + "\n")
+            paths.append(path)
+
+        results = [("json.load (before)", measure(paths, stdlib_load,
+                                                  args.repeat))]
+        accelerated = convert.orjson
+        convert.orjson = None
+        results.append(("read_json, stdlib", measure(paths,
+                                                     convert.read_json,
+                                                     args.repeat)))
+        convert.orjson = accelerated
+        if accelerated is not None:
+            results.append(("read_json, orjson",
+                            measure(paths, convert.read_json, args.repeat)))
+
+    for name, rate in results:
+        print("%-20s %10.0f files/s" % (name, rate))
+
+
+if __name__ == "__main__":
+    main()
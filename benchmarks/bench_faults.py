@@ -0,0 +1,265 @@
+"""
+Fault-injection benchmark for Murakami's exporters. It runs LocalExporter,
+SCPExporter and GCSExporter against the stand-ins in benchmarks.standins
+with injected latency, refused or failed uploads and dropped connections,
+and reports:
+* the latency distribution of each exporter's pushes, and how many of them
+raised rather than logging their failure
+* the results lost: pushed but never received, and whether the exporter
+recorded them as delivered (so they would never be sent again)
+* the effect on test timing, by running rounds of the fake test clients
+through MurakamiServer with and without the faults, comparing the length
+of each round and the gap between one test ending and the next starting
+
+No network access is needed. Each exporter's pushes run on their own thread,
+as the exporters are independent; a push that stalls holds up only its own
+exporter's series.
+
+Usage: python -m benchmarks.bench_faults [--pushes N] [--delay S]
+           [--error-rate R] [--drop-rate R] [--stall S]
+           [--exporters local,scp,gcs] [--rounds N] [--tests ndt7,ndt5]
+           [--export-policy immediate|deferred] [--output results.json]
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import tempfile
+import threading
+import time
+
+from murakami import __version__
+from murakami.exporter import content_hash
+from murakami.server import MurakamiServer
+from benchmarks import fake_clients
+from benchmarks.bench_pipeline import register_entry_points, server_config
+from benchmarks.standins import GCSStandin, SSHStandin
+
+
+def distribution(values):
+    """Summarises a list of durations in seconds, in milliseconds."""
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "mean_ms": statistics.mean(values) * 1000,
+        "p50_ms": statistics.median(values) * 1000,
+        "p95_ms": values[int(0.95 * (len(values) - 1))] * 1000,
+        "max_ms": values[-1] * 1000,
+    }
+
+
+def _received(exporter, tmp):
+    """The names of the files an exporter's destination holds."""
+    directory = {"local": "local", "scp": "ssh", "gcs": "gcs"}[exporter]
+    return set(os.listdir(os.path.join(tmp, directory)))
+
+
+def push_series(server, name, count, tmp):
+    """
+    Pushes `count` distinct results to one of the server's exporters, the
+    way MurakamiServer does, and returns the push latencies and outcomes.
+    """
+    exporter = server._exporters[name]
+    latencies = []
+    raised = 0
+    expected = {}
+    for i in range(count):
+        timestamp = (datetime.datetime.utcnow().strftime(
+            "%Y-%m-%dT%H:%M:%S.%f"))
+        data = json.dumps({"TestName": "ndt7", "Exporter": name, "Push": i})
+        expected[exporter._generate_filename("ndt7", timestamp)] = data
+        start = time.perf_counter()
+        try:
+            exporter.push("ndt7", data, timestamp)
+        except Exception:
+            # MurakamiServer logs exceptions escaping push() and carries on.
+            raised += 1
+        latencies.append(time.perf_counter() - start)
+
+    received = _received(name, tmp)
+    lost = [data for filename, data in expected.items()
+            if filename not in received]
+    marked = sum(1 for data in lost
+                 if content_hash(data) in (exporter._delivered or ()))
+    return {
+        "latency": distribution(latencies),
+        "raised": raised,
+        "lost": len(lost),
+        "lost_marked_delivered": marked,
+    }
+
+
+class ClientSpans:
+    """Records when each test's client work starts and ends."""
+    def __init__(self):
+        self.spans = []
+
+    def wrap(self, function):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.spans.append((start, time.perf_counter()))
+        return wrapper
+
+    def gaps(self):
+        """The time from each test's end to the next test's start within a
+        round, which is spent mostly in exporting the first test's result."""
+        return [b[0] - a[1] for a, b in zip(self.spans, self.spans[1:])
+                if b[0] > a[1]]
+
+
+def run_rounds(server, rounds):
+    """Runs rounds of tests and returns their durations and test gaps."""
+    timing = ClientSpans()
+    originals = {}
+    for name, runner in server._runners.items():
+        originals[name] = runner._start_test
+        runner._start_test = timing.wrap(runner._start_test)
+
+    durations, gaps = [], []
+    for _ in range(rounds):
+        timing.spans = []
+        start = time.perf_counter()
+        server._call_runners()
+        server._runs.runs()[0].wait()
+        durations.append(time.perf_counter() - start)
+        gaps.extend(timing.gaps())
+        # Let held-back exports go out before the next round.
+        held = server._held_exports
+        while held is not None and len(held):
+            time.sleep(0.05)
+
+    for name, runner in server._runners.items():
+        runner._start_test = originals[name]
+    return {"round": distribution(durations), "gap": distribution(gaps)}
+
+
+def run(args, tmp):
+    register_entry_points(os.path.join(tmp, "entry-points"))
+    os.environ["PATH"] = (fake_clients.install(os.path.join(tmp, "bin")) +
+                          os.pathsep + os.environ["PATH"])
+    os.environ["FAKE_CLIENT_DELAY"] = str(args.client_delay)
+
+    faults = {"stall": args.stall, "seed": args.seed}
+    standins = [
+        SSHStandin(os.path.join(tmp, "ssh"), **faults),
+        GCSStandin(os.path.join(tmp, "gcs"), **faults),
+    ]
+    for standin in standins:
+        standin.start()
+    ssh, gcs = standins
+    exporters = args.exporters.split(",")
+    server = MurakamiServer(
+        tests_per_day=0,
+        config=server_config(tmp, args.tests.split(","), exporters, ssh,
+                             gcs),
+        export_policy=args.export_policy,
+        export_quiet=args.export_quiet,
+    )
+    # With no scheduler and no HTTP server, start() only loads the plugins.
+    server.start()
+
+    def inject(faulty):
+        for standin in standins:
+            standin.delay = args.delay if faulty else 0.0
+            standin.error_rate = args.error_rate if faulty else 0.0
+            standin.drop_rate = args.drop_rate if faulty else 0.0
+
+    result = {"rounds": {}}
+    inject(False)
+    result["rounds"]["clean"] = run_rounds(server, args.rounds)
+    inject(True)
+    result["rounds"]["faulty"] = run_rounds(server, args.rounds)
+
+    pushes = {}
+
+    def series(name):
+        pushes[name] = push_series(server, name, args.pushes, tmp)
+
+    threads = [threading.Thread(target=series, args=(name, ))
+               for name in exporters]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result["pushes"] = pushes
+    result["injected"] = {
+        "scp": {"errors": ssh.errors, "drops": ssh.drops},
+        "gcs": {"errors": gcs.errors, "drops": gcs.drops},
+    }
+
+    server.stop()
+    for standin in standins:
+        standin.stop()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pushes", type=int, default=20,
+                        help="Results to push to each exporter.")
+    parser.add_argument("--delay", type=float, default=0.0,
+                        help="Seconds the stand-ins add to each upload.")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Share of uploads refused (SCP) or answered "
+                        "with 503 (GCS).")
+    parser.add_argument("--drop-rate", type=float, default=0.0,
+                        help="Share of uploads whose connection stalls and "
+                        "is then dropped.")
+    parser.add_argument("--stall", type=float, default=1.0,
+                        help="Seconds a dropped connection stalls.")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--exporters", default="local,scp,gcs")
+    parser.add_argument("--rounds", type=int, default=3,
+                        help="Rounds of tests to run with and without the "
+                        "faults.")
+    parser.add_argument("--tests", default="ndt5,ndt7")
+    parser.add_argument("--client-delay", type=float, default=0.2,
+                        help="Seconds each fake client takes.")
+    parser.add_argument("--export-policy", default="immediate",
+                        choices=["immediate", "deferred"])
+    parser.add_argument("--export-quiet", type=float, default=0.1,
+                        help="Quiet window for the deferred export policy.")
+    parser.add_argument("--output", help="Write the results to a JSON file.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as tmp:
+        result = run(args, tmp)
+
+    print("%-8s %6s %10s %10s %10s %10s %7s %6s %8s" % (
+        "exporter", "pushes", "mean ms", "p50 ms", "p95 ms", "max ms",
+        "raised", "lost", "silent"))
+    for name, s in result["pushes"].items():
+        latency = s["latency"]
+        print("%-8s %6d %10.1f %10.1f %10.1f %10.1f %7d %6d %8d" % (
+            name, latency["count"], latency["mean_ms"], latency["p50_ms"],
+            latency["p95_ms"], latency["max_ms"], s["raised"], s["lost"],
+            s["lost_marked_delivered"]))
+    print("injected: %s" % json.dumps(result["injected"]))
+    for label, timing in result["rounds"].items():
+        print("%-6s rounds: mean %.0f ms, max %.0f ms; gap between tests: "
+              "mean %s ms" % (
+                  label, timing["round"]["mean_ms"], timing["round"]["max_ms"],
+                  "%.0f" % timing["gap"]["mean_ms"]
+                  if timing["gap"]["count"] else "-"))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(dict(result,
+                           murakami_version=__version__,
+                           python=platform.python_version(),
+                           platform=platform.platform(),
+                           timestamp=datetime.datetime.utcnow().isoformat(),
+                           arguments=vars(args)), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+End-to-end benchmark for Murakami's own overhead. It runs MurakamiServer
+against the fake test clients in benchmarks.fake_clients, with a local
+exporter and the SCP and GCS exporters pointed at the stand-ins in
+benchmarks.standins, and fires the runners the way the scheduler does. It
+reports the latency and CPU time of each stage (queueing, each runner around
+its client, each client, the results buffer and each exporter's push), the
+daemon's RSS, and, with --output, writes the results as JSON.
+
+No network access is needed. When run from a source checkout that is not
+installed, the plugin entry points are registered from pyproject.toml.
+
+Usage: python -m benchmarks.bench_pipeline [--rounds N] [--delay S]
+           [--tests ndt7,speedtestmulti] [--exporters local,scp,gcs]
+           [--upload-delay S] [--output results.json]
+"""
+import argparse
+from collections import defaultdict
+import datetime
+import json
+import logging
+import os
+import platform
+import resource
+import statistics
+import tempfile
+import threading
+import time
+
+import pkg_resources
+import tomlkit
+
+from murakami import __version__
+import murakami.utils as utils
+from murakami.server import MurakamiServer
+from benchmarks import fake_clients
+from benchmarks.standins import GCSStandin, PASSWORD, SSHStandin, USERNAME
+
+TESTS = ["dash", "ndt5", "ndt7", "speedtestmulti", "speedtestsingle"]
+
+
+def register_entry_points(directory):
+    """
+    Makes the murakami.runners and murakami.exporters entry points available
+    to pkg_resources if murakami is not installed, by writing a dist-info
+    directory from pyproject.toml.
+    """
+    try:
+        pkg_resources.get_distribution("murakami")
+        return
+    except pkg_resources.DistributionNotFound:
+        pass
+    with open(os.path.join(fake_clients.REPOSITORY, "pyproject.toml")) as f:
+        plugins = tomlkit.parse(f.read())["tool"]["poetry"]["plugins"]
+    dist_info = os.path.join(directory, "murakami-%s.dist-info" % __version__)
+    os.makedirs(dist_info)
+    with open(os.path.join(dist_info, "METADATA"), "w") as f:
+        f.write("Metadata-Version: 2.1\nName: murakami\nVersion: %s\n" %
+                __version__)
+    with open(os.path.join(dist_info, "entry_points.txt"), "w") as f:
+        for group, entries in plugins.items():
+            f.write("[%s]\n" % group)
+            for name, value in entries.items():
+                f.write("%s = %s\n" % (name, value))
+    pkg_resources.working_set.add_entry(directory)
+
+
+def _thread_cpu():
+    return time.thread_time() if hasattr(time, "thread_time") else 0.0
+
+
+class Stages:
+    """Collects the wall and CPU time of each pipeline stage."""
+    def __init__(self):
+        self.wall = defaultdict(list)
+        self.cpu = defaultdict(list)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def add(self, stage, wall, cpu):
+        with self._lock:
+            self.wall[stage].append(wall)
+            self.cpu[stage].append(cpu)
+
+    def wrap(self, stage, function, on_client=None):
+        """Returns `function` wrapped to record its time under `stage`."""
+        def wrapper(*args, **kwargs):
+            start, start_cpu = time.perf_counter(), _thread_cpu()
+            self._local.client = 0.0
+            try:
+                return function(*args, **kwargs)
+            finally:
+                # Time spent waiting for a client is accounted to the client.
+                wall = time.perf_counter() - start - self._local.client
+                self.add(stage, wall, _thread_cpu() - start_cpu)
+        return wrapper
+
+    def wrap_client(self, function):
+        """Wraps utils.run_client to record each client's time and CPU."""
+        def wrapper(args, *rest, **kwargs):
+            start = time.perf_counter()
+            output = function(args, *rest, **kwargs)
+            wall = time.perf_counter() - start
+            self._local.client = getattr(self._local, "client", 0.0) + wall
+            rusage = output.rusage
+            self.add("client:" + os.path.basename(args[0]), wall,
+                     rusage.ru_utime + rusage.ru_stime)
+            return output
+        return wrapper
+
+    def summary(self):
+        result = {}
+        for stage in sorted(self.wall):
+            wall = sorted(self.wall[stage])
+            result[stage] = {
+                "count": len(wall),
+                "mean_ms": statistics.mean(wall) * 1000,
+                "p50_ms": statistics.median(wall) * 1000,
+                "p95_ms": wall[int(0.95 * (len(wall) - 1))] * 1000,
+                "max_ms": wall[-1] * 1000,
+                "cpu_mean_ms": statistics.mean(self.cpu[stage]) * 1000,
+            }
+        return result
+
+
+def _rss_kb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError):
+        return None
+
+
+def server_config(tmp, tests, exporters, ssh, gcs):
+    """
+    Returns a MurakamiServer configuration enabling the named tests and
+    exporters, with the SCP and GCS exporters delivering to the running
+    stand-ins, and points the GCS client at its stand-in.
+    """
+    os.environ.update(gcs.environment())
+
+    def state(name):
+        return {"dedup_path": os.path.join(tmp, "delivered-%s.log" % name)}
+
+    config = {
+        "tests": {
+            name: {"enabled": "y" if name in tests else "n"}
+            for name in TESTS + ["latency"]
+        },
+        "exporters": {},
+    }
+    if "local" in exporters:
+        os.makedirs(os.path.join(tmp, "local"))
+        config["exporters"]["local"] = dict(
+            state("local"), type="local", path=os.path.join(tmp, "local"))
+    if "scp" in exporters:
+        config["exporters"]["scp"] = dict(
+            state("scp"), type="scp", target="127.0.0.1:/results",
+            port=ssh.port, username=USERNAME, password=PASSWORD)
+    if "gcs" in exporters:
+        config["exporters"]["gcs"] = dict(
+            state("gcs"), type="gcs", target="gs://murakami-bench/results",
+            key=gcs.write_key(os.path.join(tmp, "gcs-key.json")))
+    return config
+
+
+def run(args, tmp):
+    register_entry_points(os.path.join(tmp, "entry-points"))
+    os.environ["PATH"] = (fake_clients.install(os.path.join(tmp, "bin")) +
+                          os.pathsep + os.environ["PATH"])
+    os.environ["FAKE_CLIENT_DELAY"] = str(args.delay)
+    os.environ["FAKE_CLIENT_CPU"] = str(args.cpu)
+    os.environ["FAKE_CLIENT_FAILURE_RATE"] = str(args.failure_rate)
+
+    ssh = SSHStandin(os.path.join(tmp, "ssh"), delay=args.upload_delay)
+    gcs = GCSStandin(os.path.join(tmp, "gcs"), delay=args.upload_delay)
+    ssh.start()
+    gcs.start()
+    config = server_config(tmp, args.tests.split(","),
+                           args.exporters.split(","), ssh, gcs)
+
+    stages = Stages()
+    utils.run_client = stages.wrap_client(utils.run_client)
+    server = MurakamiServer(tests_per_day=0, config=config)
+    # With no scheduler and no HTTP server, start() only loads the plugins.
+    server.start()
+    for name, runner in server._runners.items():
+        runner._start_test = stages.wrap("runner:" + name, runner._start_test)
+    for name, exporter in server._exporters.items():
+        exporter.push = stages.wrap("export:" + name, exporter.push)
+    server._results.add = stages.wrap("results_buffer", server._results.add)
+
+    rss = []
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        server._call_runners()
+        run = server._runs.runs()[0]
+        run.wait()
+        stages.add("round", time.perf_counter() - start, 0.0)
+        rss.append(_rss_kb())
+
+    server.stop()
+    ssh.stop()
+    gcs.stop()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        "stages": stages.summary(),
+        "uploads": {"scp": ssh.received, "gcs": gcs.received},
+        "rss_kb": {"first_round": rss[0], "last_round": rss[-1],
+                   "peak": usage.ru_maxrss},
+        "daemon_cpu_s": usage.ru_utime + usage.ru_stime,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--delay", type=float, default=0.2,
+                        help="Seconds each fake client takes.")
+    parser.add_argument("--cpu", type=float, default=0.0,
+                        help="Seconds of CPU each fake client burns.")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--tests", default=",".join(TESTS))
+    parser.add_argument("--exporters", default="local,scp,gcs")
+    parser.add_argument("--upload-delay", type=float, default=0.0,
+                        help="Seconds the stand-ins take per upload.")
+    parser.add_argument("--output", help="Write the results to a JSON file.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as tmp:
+        result = run(args, tmp)
+
+    print("%-28s %6s %10s %10s %10s %10s" % ("stage", "count", "mean ms",
+                                             "p95 ms", "max ms", "cpu ms"))
+    for stage, s in result["stages"].items():
+        print("%-28s %6d %10.2f %10.2f %10.2f %10.2f" % (
+            stage, s["count"], s["mean_ms"], s["p95_ms"], s["max_ms"],
+            s["cpu_mean_ms"]))
+    print("uploads: %(scp)d scp, %(gcs)d gcs" % result["uploads"])
+    print("RSS: %(first_round)s KiB after the first round, %(last_round)s KiB "
+          "after the last, %(peak)s KiB peak" % result["rss_kb"])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(dict(result,
+                           murakami_version=__version__,
+                           python=platform.python_version(),
+                           platform=platform.platform(),
+                           timestamp=datetime.datetime.utcnow().isoformat(),
+                           arguments=vars(args)), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Generators for synthetic archives of Murakami test results, in each of the
+formats read by murakami-convert. Files are named the way MurakamiExporter
+names them, and a configurable share of them are failures (truncated files or
+failed tests) or schema variants (error rows and missing fields).
+"""
+import datetime
+import json
+import os
+import random
+
+LOCATIONS = ["baltimore", "corciano", "detroit", "oakland", "tucson"]
+NETWORK_TYPES = ["home", "library", "school"]
+CONNECTION_TYPES = ["wired", "wifi"]
+START = datetime.datetime(2019, 1, 1)
+
+
+def _server(rng):
+    site = rng.choice(["iad03", "mil04", "lga05", "sea02", "den04"])
+    return "ndt-iupui-mlab%d-%s.measurement-lab.org" % (rng.randint(1, 4),
+                                                        site)
+
+
+def _ip(rng):
+    return "%d.%d.%d.%d" % tuple(rng.randint(1, 254) for _ in range(4))
+
+
+def _ndt(rng, name, start, variant):
+    record = {
+        "TestName": name,
+        "TestStartTime": start.strftime("%Y-%m-%dT%H:%M:%S.%f"),
+        "TestEndTime": (start + datetime.timedelta(seconds=20)).strftime(
+            "%Y-%m-%dT%H:%M:%S.%f"),
+        "MurakamiLocation": rng.choice(LOCATIONS),
+        "MurakamiConnectionType": rng.choice(CONNECTION_TYPES),
+        "MurakamiNetworkType": rng.choice(NETWORK_TYPES),
+        "MurakamiDeviceID": "device-%d" % rng.randint(1, 20),
+        "ServerName": _server(rng),
+        "ServerIP": _ip(rng),
+        "ClientIP": _ip(rng),
+        "DownloadUUID": "ndt-%08x_%d" % (rng.getrandbits(32),
+                                         rng.randint(1e9, 2e9)),
+        "DownloadValue": rng.lognormvariate(4, 1),
+        "DownloadUnit": "Mbit/s",
+        "UploadValue": rng.lognormvariate(2.5, 1),
+        "UploadUnit": "Mbit/s",
+        "DownloadRetransValue": rng.random() * 5,
+        "DownloadRetransUnit": "%",
+        "MinRTTValue": rng.lognormvariate(3, 0.5),
+        "MinRTTUnit": "ms",
+    }
+    if name == "ndt7":
+        record["DownloadError"] = None
+        record["UploadError"] = None
+    if variant:
+        if name == "ndt7":
+            failed = rng.choice(["DownloadError", "UploadError"])
+            record[failed] = "read tcp: i/o timeout"
+            record[failed.replace("Error", "Value")] = None
+        else:
+            for field in ("MinRTTValue", "MinRTTUnit", "DownloadRetransValue",
+                          "DownloadRetransUnit"):
+                del record[field]
+    return record
+
+
+def ndt5(rng, start, variant, failed):
+    record = _ndt(rng, "ndt5", start, variant)
+    if failed:
+        record["TestError"] = "recvResultsAndLogout failed: i/o timeout"
+    return record
+
+
+def ndt7(rng, start, variant, failed):
+    record = _ndt(rng, "ndt7", start, variant)
+    if failed:
+        record["TestError"] = "ndt7-client exited with errors"
+    return record
+
+
+def speedtest(rng, start, variant, failed):
+    record = {
+        "download": rng.lognormvariate(18, 1),
+        "upload": rng.lognormvariate(16.5, 1),
+        "ping": rng.lognormvariate(3, 0.5),
+        "server": {
+            "url": "http://speedtest.example.net:8080/speedtest/upload.php",
+            "lat": "39.2904",
+            "lon": "-76.6122",
+            "name": "Baltimore, MD",
+            "country": "United States",
+            "cc": "US",
+            "sponsor": "Example ISP",
+            "id": str(rng.randint(1000, 40000)),
+            "host": "speedtest.example.net:8080",
+            "d": rng.random() * 50,
+            "latency": rng.lognormvariate(3, 0.5),
+        },
+        "timestamp": start.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        "bytes_sent": rng.randint(1e6, 1e8),
+        "bytes_received": rng.randint(1e6, 1e9),
+        "share": None,
+        "client": {
+            "ip": _ip(rng),
+            "lat": "39.2904",
+            "lon": "-76.6122",
+            "isp": "Example ISP",
+            "isprating": "3.7",
+            "rating": "0",
+            "ispdlavg": "0",
+            "ispulavg": "0",
+            "loggedin": "0",
+            "country": "US",
+        },
+    }
+    if variant:
+        del record["client"]
+    return record
+
+
+def dash_legacy(rng, start, variant, failed):
+    record = {
+        "test_name": "dash",
+        "test_runtime": rng.random() * 60,
+        "test_start_time": start.strftime("%Y-%m-%d %H:%M:%S"),
+        "test_keys": {
+            "simple": {
+                "connect_latency": rng.random() / 10,
+                "median_bitrate": rng.randint(1000, 50000),
+                "min_playout_delay": rng.random(),
+            },
+        },
+        "probe_asn": "AS%d" % rng.randint(1000, 60000),
+        "probe_cc": "US",
+    }
+    if variant:
+        # Not a DASH measurement; the importer skips these.
+        del record["test_name"]
+    return record
+
+
+def ndt_legacy(rng, start, variant, failed):
+    record = {
+        "test_name": "ndt",
+        "test_start_time": start.strftime("%Y-%m-%d %H:%M:%S"),
+        "test_keys": {
+            "server_address": _server(rng),
+            "simple": {
+                "download": rng.lognormvariate(10, 1),
+                "upload": rng.lognormvariate(9, 1),
+                "ping": rng.lognormvariate(3, 0.5),
+            },
+            "advanced": {
+                "avg_rtt": rng.lognormvariate(3.2, 0.5),
+                "max_rtt": rng.lognormvariate(4, 0.5),
+                "min_rtt": rng.lognormvariate(3, 0.5),
+                "congestion_limited": rng.random(),
+                "packet_loss": rng.random() / 100,
+                "sender_limited": rng.random(),
+                "receiver_limited": rng.random(),
+            },
+        },
+        "probe_asn": "AS%d" % rng.randint(1000, 60000),
+        "probe_cc": "US",
+    }
+    if variant:
+        del record["probe_asn"]
+    return record
+
+
+GENERATORS = {
+    "speedtest": speedtest,
+    "dash_legacy": dash_legacy,
+    "ndt_legacy": ndt_legacy,
+    "ndt5": ndt5,
+    "ndt7": ndt7,
+}
+
+# The test name MurakamiExporter puts at the start of each result filename.
+FILE_PREFIXES = {
+    "speedtest": "speedtest-cli-multi-stream",
+    "dash_legacy": "dash",
+    "ndt_legacy": "ndt",
+    "ndt5": "ndt5",
+    "ndt7": "ndt7",
+}
+
+
+def generate(test, directory, files, failure_rate=0.05, variant_rate=0.1,
+             seed=0):
+    """
+    Write `files` synthetic results for `test` to `directory`. A
+    `failure_rate` share of them are failures, half of them truncated and
+    half failed tests, and a `variant_rate` share use an alternative schema.
+    Returns the list of paths written.
+    """
+    rng = random.Random(seed)
+    generator = GENERATORS[test]
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(files):
+        start = START + datetime.timedelta(seconds=rng.randint(0, 3e7))
+        failed = rng.random() < failure_rate
+        variant = rng.random() < variant_rate
+        record = generator(rng, start, variant, failed)
+        data = json.dumps(record) + "\n"
+        if failed and rng.random() < 0.5:
+            data = data[:len(data) // 2]
+        name = "%s-%s-%s-%s-%s.jsonl" % (
+            FILE_PREFIXES[test],
+            rng.choice(LOCATIONS),
+            rng.choice(NETWORK_TYPES),
+            rng.choice(CONNECTION_TYPES),
+            (start + datetime.timedelta(microseconds=i)).strftime(
+                "%Y-%m-%dT%H:%M:%S.%f"),
+        )
+        path = os.path.join(directory, name)
+        with open(path, "w") as f:
+            f.write(data)
+        paths.append(path)
+    return paths
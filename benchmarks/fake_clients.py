@@ -0,0 +1,123 @@
+"""
+Stand-ins for the test clients Murakami's runners execute: `ndt5-client`,
+`ndt7-client`, `speedtest-cli` and `dash-client`. Each prints output in the
+format of the real client after a delay, without using the network.
+
+The behaviour is controlled through the environment:
+* `FAKE_CLIENT_DELAY`: seconds to wait before printing (default: 1)
+* `FAKE_CLIENT_CPU`: seconds of CPU to burn during that time (default: 0)
+* `FAKE_CLIENT_FAILURE_RATE`: share of runs that fail (default: 0)
+
+Usage: python -m benchmarks.fake_clients DIRECTORY
+    Installs the fake clients as executables in DIRECTORY, to be put first
+    on the PATH of the process running Murakami.
+"""
+import datetime
+import json
+import os
+import random
+import stat
+import sys
+import time
+
+from benchmarks import corpus
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _ndt(rng):
+    return {
+        "ServerFQDN": corpus._server(rng),
+        "ServerIP": corpus._ip(rng),
+        "ClientIP": corpus._ip(rng),
+        "DownloadUUID": "ndt-%08x_%d" % (rng.getrandbits(32),
+                                         rng.randint(1e9, 2e9)),
+        "Download": {"Value": rng.lognormvariate(4, 1), "Unit": "Mbit/s"},
+        "Upload": {"Value": rng.lognormvariate(2.5, 1), "Unit": "Mbit/s"},
+        "DownloadRetrans": {"Value": rng.random() * 5, "Unit": "%"},
+        "MinRTT": {"Value": rng.lognormvariate(3, 0.5), "Unit": "ms"},
+    }
+
+
+def _ndt_failure(rng):
+    test = rng.choice(["download", "upload"])
+    return json.dumps({"Key": "error",
+                       "Value": {"Test": test,
+                                 "Failure": "read tcp: i/o timeout"}})
+
+
+def ndt5(rng, failed):
+    if failed:
+        return 1, _ndt_failure(rng), ""
+    return 0, json.dumps(_ndt(rng)), ""
+
+
+def ndt7(rng, failed):
+    if failed:
+        return 1, _ndt_failure(rng), ""
+    return 0, json.dumps(_ndt(rng)), ""
+
+
+def speedtest(rng, failed):
+    if failed:
+        return 1, "", "Cannot retrieve speedtest configuration"
+    record = corpus.speedtest(rng, datetime.datetime.utcnow(), False, False)
+    return 0, json.dumps(record), ""
+
+
+def dash(rng, failed):
+    if failed:
+        return 1, "", "dash-client: connection refused"
+    record = corpus.dash_legacy(rng, datetime.datetime.utcnow(), False, False)
+    return 0, "\n".join(["starting", json.dumps(record)]), ""
+
+
+CLIENTS = {
+    "ndt5-client": ndt5,
+    "ndt7-client": ndt7,
+    "speedtest-cli": speedtest,
+    "dash-client": dash,
+}
+
+
+def run(name):
+    """Behaves like the client `name`, and returns its exit status."""
+    delay = float(os.environ.get("FAKE_CLIENT_DELAY", 1))
+    cpu = float(os.environ.get("FAKE_CLIENT_CPU", 0))
+    failure_rate = float(os.environ.get("FAKE_CLIENT_FAILURE_RATE", 0))
+    rng = random.Random()
+
+    start = time.monotonic()
+    end_cpu = time.process_time() + min(cpu, delay)
+    while time.process_time() < end_cpu:
+        pass
+    time.sleep(max(0, delay - (time.monotonic() - start)))
+
+    status, stdout, stderr = CLIENTS[name](rng, rng.random() < failure_rate)
+    if stdout:
+        print(stdout)
+    if stderr:
+        print(stderr, file=sys.stderr)
+    return status
+
+
+def install(directory, python=sys.executable):
+    """Writes the fake clients as executables in `directory`."""
+    os.makedirs(directory, exist_ok=True)
+    for name in CLIENTS:
+        path = os.path.join(directory, name)
+        with open(path, "w") as f:
+            f.write("#!%s\n"
+                    "import sys\n"
+                    "sys.path.insert(0, %r)\n"
+                    "from benchmarks.fake_clients import run\n"
+                    "sys.exit(run(%r))\n" % (python, REPOSITORY, name))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP
+                 | stat.S_IXOTH)
+    return directory
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit(__doc__.split("Usage: ")[1])
+    install(sys.argv[1])
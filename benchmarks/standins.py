@@ -0,0 +1,323 @@
+"""
+Local stand-ins for the remote services Murakami's exporters deliver to: an
+SSH server that accepts `scp -t` uploads, and an HTTP server that speaks
+enough of the Google Cloud Storage JSON API (and OAuth token endpoint) for
+GCSExporter. Uploads are written to a local directory, and faults can be
+injected to stand in for a bad link or service:
+* `delay`: seconds added to each upload, for a slow link
+* `error_rate`: share of uploads refused: the SSH server drops the connection
+as soon as it is accepted, and the GCS server replies 503
+* `drop_rate`: share of uploads lost in transit: the server stalls for
+`stall` seconds and then closes the connection without replying
+The faults can be changed while a stand-in is running.
+"""
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import os
+import random
+import socket
+import socketserver
+import threading
+import time
+import urllib.parse
+
+import paramiko
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+USERNAME = "murakami"
+PASSWORD = "murakami"
+
+
+ERROR = "error"
+DROP = "drop"
+
+
+class _Standin:
+    """
+    Common start/stop and fault handling; `received` counts completed
+    uploads, and `errors` and `drops` the faults injected.
+    """
+    def __init__(self, directory, delay=0.0, error_rate=0.0, drop_rate=0.0,
+                 stall=1.0, seed=None):
+        self.directory = directory
+        self.delay = delay
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.stall = stall
+        self.received = 0
+        self.errors = 0
+        self.drops = 0
+        self.port = None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _fault(self):
+        """Picks the fault to inject into an upload, ERROR, DROP or None."""
+        with self._lock:
+            draw = self._random.random()
+            if draw < self.error_rate:
+                self.errors += 1
+                return ERROR
+            if draw < self.error_rate + self.drop_rate:
+                self.drops += 1
+                return DROP
+        return None
+
+    def _store(self, name, data):
+        if self.delay:
+            time.sleep(self.delay)
+        with open(os.path.join(self.directory, os.path.basename(name)),
+                  "wb") as f:
+            f.write(data)
+        with self._lock:
+            self.received += 1
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _SSHServer(paramiko.ServerInterface):
+    def __init__(self):
+        self.command = None
+        self.ready = threading.Event()
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def get_allowed_auths(self, username):
+        return "password,publickey"
+
+    def check_auth_password(self, username, password):
+        if (username, password) == (USERNAME, PASSWORD):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_FAILED
+
+    def check_channel_exec_request(self, channel, command):
+        self.command = command
+        self.ready.set()
+        return True
+
+
+class _ChannelReader:
+    def __init__(self, channel):
+        self._channel = channel
+        self._buffer = b""
+
+    def _fill(self):
+        data = self._channel.recv(65536)
+        if not data:
+            raise EOFError
+        self._buffer += data
+
+    def readline(self):
+        while b"\n" not in self._buffer:
+            self._fill()
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return line
+
+    def read(self, size):
+        while len(self._buffer) < size:
+            self._fill()
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class SSHStandin(_Standin):
+    """
+    An SSH server on localhost which accepts password authentication with
+    USERNAME and PASSWORD, and `scp -t` uploads of single files.
+    """
+    def __init__(self, directory, **faults):
+        super().__init__(directory, **faults)
+        self._host_key = paramiko.RSAKey.generate(2048)
+        self._socket = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        self._socket = socket.socket()
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(("127.0.0.1", 0))
+        self._socket.listen(16)
+        self._socket.settimeout(0.2)
+        self.port = self._socket.getsockname()[1]
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._thread.join()
+        self._socket.close()
+
+    def _serve(self):
+        while not self._stopping.is_set():
+            try:
+                client, _ = self._socket.accept()
+            except socket.timeout:
+                continue
+            threading.Thread(target=self._session, args=(client, ),
+                             daemon=True).start()
+
+    def _session(self, client):
+        # The exporter opens a connection per upload, so faults are
+        # injected per connection.
+        fault = self._fault()
+        if fault is not None:
+            if fault == DROP:
+                time.sleep(self.stall)
+            client.close()
+            return
+        transport = paramiko.Transport(client)
+        transport.add_server_key(self._host_key)
+        server = _SSHServer()
+        try:
+            transport.start_server(server=server)
+            while transport.is_active():
+                channel = transport.accept(5)
+                if channel is None:
+                    break
+                if server.ready.wait(5):
+                    self._scp(channel, server.command)
+                server.ready.clear()
+        except (paramiko.SSHException, EOFError, OSError):
+            pass
+        finally:
+            transport.close()
+
+    def _scp(self, channel, command):
+        if not command.startswith(b"scp ") or b" -t " not in command:
+            channel.send_exit_status(1)
+            channel.close()
+            return
+        reader = _ChannelReader(channel)
+        channel.sendall(b"\0")
+        try:
+            while True:
+                line = reader.readline()
+                if line.startswith(b"C"):
+                    _, size, name = line[1:].split(b" ", 2)
+                    channel.sendall(b"\0")
+                    data = reader.read(int(size) + 1)[:-1]
+                    self._store(name.decode(), data)
+                channel.sendall(b"\0")
+        except EOFError:
+            pass
+        channel.send_exit_status(0)
+        channel.close()
+
+
+class _GCSHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        url = urllib.parse.urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if url.path == "/token":
+            self._reply(200, {"access_token": "standin",
+                              "expires_in": 3600,
+                              "token_type": "Bearer"})
+            return
+        parts = url.path.split("/")
+        # /upload/storage/v1/b/<bucket>/o?uploadType=multipart
+        if parts[1:4] != ["upload", "storage", "v1"] or len(parts) < 7:
+            self._reply(404, {"error": {"code": 404}})
+            return
+        message = BytesParser().parsebytes(
+            b"Content-Type: " + self.headers["Content-Type"].encode() +
+            b"\r\n\r\n" + body)
+        metadata, content = message.get_payload()
+        name = json.loads(metadata.get_payload())["name"]
+        data = content.get_payload(decode=True)
+        standin = self.server.standin
+        fault = standin._fault()
+        if fault == ERROR:
+            self._reply(503, {"error": {"code": 503,
+                                        "message": "Service Unavailable"}})
+            return
+        if fault == DROP:
+            time.sleep(standin.stall)
+            self.close_connection = True
+            return
+        standin._store(name, data)
+        self._reply(200, {"kind": "storage#object",
+                          "bucket": parts[5],
+                          "name": name,
+                          "size": str(len(data))})
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class GCSStandin(_Standin):
+    """
+    An HTTP server on localhost standing in for Google Cloud Storage's
+    multipart upload endpoint and OAuth token endpoint. Point the client at it
+    with environment(), and use write_key() for a service account key whose
+    tokens it issues.
+    """
+    def __init__(self, directory, **faults):
+        super().__init__(directory, **faults)
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        self._server = _ThreadingHTTPServer(("127.0.0.1", 0), _GCSHandler)
+        self._server.standin = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self.port
+
+    def environment(self):
+        """The environment variables that redirect the GCS client here."""
+        return {"STORAGE_EMULATOR_HOST": self.url}
+
+    def write_key(self, path):
+        """Writes a service account key file using this stand-in."""
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        pem = key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ).decode()
+        with open(path, "w") as f:
+            json.dump({
+                "type": "service_account",
+                "project_id": "murakami-standin",
+                "private_key_id": "standin",
+                "private_key": pem,
+                "client_email": "murakami@murakami-standin.example",
+                "client_id": "0",
+                "token_uri": self.url + "/token",
+            }, f)
+        return path
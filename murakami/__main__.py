@@ -8,16 +8,17 @@ Results are saved as individual files in JSON new line format (.jsonl).
 """
 from collections import ChainMap, OrderedDict
 from collections.abc import Mapping
+import atexit
 import logging
 import os
 import signal
 
 import configargparse
-import livejson
 import tomlkit
 
 import murakami.defaults as defaults
 from murakami.server import MurakamiServer
+from murakami.state import DynamicState
 
 logger = logging.getLogger(__name__)
 
@@ -172,6 +173,78 @@ def main():
         default=False,
         help="Enable webthings support.",
     )
+    parser.add(
+        "--api",
+        action="store_true",
+        dest="api",
+        default=False,
+        help="Serve the HTTP API even if webthings support is disabled.",
+    )
+    parser.add(
+        "--results-size",
+        dest="results_size",
+        type=int,
+        default=defaults.RESULTS_BUFFER_SIZE,
+        help="Number of recent results per test kept in memory for the API "
+        "(default: " + str(defaults.RESULTS_BUFFER_SIZE) + ").",
+    )
+    parser.add(
+        "--lease",
+        default=None,
+        dest="lease",
+        help="Take turns running tests with other devices on this network by "
+        "holding this lease: a lease service URL such as "
+        "http://murakami-1.local/leases/site, or the path of a lock file on a "
+        "shared volume (default: none).",
+    )
+    parser.add(
+        "--lease-ttl",
+        dest="lease_ttl",
+        type=float,
+        default=defaults.LEASE_TTL,
+        help="Seconds after which a lease that is not renewed expires "
+        "(default: " + str(defaults.LEASE_TTL) + ").",
+    )
+    parser.add(
+        "--lease-server",
+        action="store_true",
+        dest="lease_server",
+        default=False,
+        help="Serve the lease service for other devices from the HTTP API.",
+    )
+    parser.add(
+        "--precheck",
+        default=None,
+        dest="precheck",
+        help="Before each batch of tests, resolve and connect to this "
+        "host[:port], such as locate.measurementlab.net:443, and defer the "
+        "tests while that fails (default: none).",
+    )
+    parser.add(
+        "--precheck-timeout",
+        dest="precheck_timeout",
+        type=float,
+        default=defaults.PRECHECK_TIMEOUT,
+        help="Seconds the connectivity pre-check may take (default: " +
+        str(defaults.PRECHECK_TIMEOUT) + ").",
+    )
+    parser.add(
+        "--export-policy",
+        dest="export_policy",
+        default=defaults.EXPORT_POLICY,
+        choices=["immediate", "deferred"],
+        help="When to push results to remote exporters: as soon as each test "
+        "finishes, or deferred until no test has run for the quiet window "
+        "(default: " + defaults.EXPORT_POLICY + ").",
+    )
+    parser.add(
+        "--export-quiet-window",
+        dest="export_quiet",
+        type=float,
+        default=defaults.EXPORT_QUIET_WINDOW,
+        help="Seconds without tests before deferred exports are sent "
+        "(default: " + str(defaults.EXPORT_QUIET_WINDOW) + ").",
+    )
     parser.add(
         "--location",
         default=None,
@@ -213,7 +286,8 @@ def main():
     else:
         config = config_from_env
     if settings.webthings:
-        state = livejson.File(settings.dynamic, pretty=True)
+        state = DynamicState(settings.dynamic)
+        atexit.register(state.flush)
         config = ChainMap(state, config)
 
     server = MurakamiServer(
@@ -230,6 +304,15 @@ def main():
         connection_type=settings.connection_type,
         device_id=settings.device_id,
         config=config,
+        api=settings.api,
+        results_size=settings.results_size,
+        lease_url=settings.lease,
+        lease_ttl=settings.lease_ttl,
+        lease_server=settings.lease_server,
+        precheck=settings.precheck,
+        precheck_timeout=settings.precheck_timeout,
+        export_policy=settings.export_policy,
+        export_quiet=settings.export_quiet,
     )
 
     # reload server on HUP and TERM signal
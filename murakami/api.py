@@ -0,0 +1,200 @@
+"""
+This module contains Murakami's HTTP API, which is served alongside the
+WebThings endpoints, or on its own if WebThings is disabled.
+"""
+from collections import deque
+import hashlib
+import json
+import threading
+import uuid
+
+import tornado.web
+
+import murakami.defaults as defaults
+
+
+class ResultBuffer:
+    """
+    Keeps the most recent results of each test in memory, in a bounded ring
+    buffer per test, so they can be served without reading exported files.
+
+    ####Arguments
+    * `size`: The number of results to keep for each test
+    """
+    def __init__(self, size=defaults.RESULTS_BUFFER_SIZE):
+        self._size = size
+        self._results = {}
+        self._lock = threading.Lock()
+        # The version restarts from 0 with the daemon, so etags also include
+        # a token unique to this buffer.
+        self.token = uuid.uuid4().hex
+        self.version = 0
+
+    def add(self, test_name="", data=None, timestamp=None):
+        """Adds a result, with the same arguments as an exporter's push()."""
+        try:
+            result = json.loads(data)
+        except (TypeError, ValueError):
+            result = data
+        with self._lock:
+            if test_name not in self._results:
+                self._results[test_name] = deque(maxlen=self._size)
+            self._results[test_name].append({
+                "test": test_name,
+                "timestamp": timestamp,
+                "result": result,
+            })
+            self.version += 1
+
+    def query(self, test=None, since=None, until=None):
+        """
+        Returns the buffered results, newest first, optionally only those of
+        one test and with timestamps in [since, until). Timestamps are
+        compared as ISO 8601 strings, so a date alone may be given.
+        """
+        with self._lock:
+            if test is not None:
+                results = list(self._results.get(test, ()))
+            else:
+                results = [r for q in self._results.values() for r in q]
+        if since is not None:
+            results = [r for r in results if (r["timestamp"] or "") >= since]
+        if until is not None:
+            results = [r for r in results if (r["timestamp"] or "") < until]
+        results.sort(key=lambda r: r["timestamp"] or "", reverse=True)
+        return results
+
+
+class ResultsHandler(tornado.web.RequestHandler):
+    """
+    Serves recent results from a ResultBuffer as JSON. Accepts the `test`,
+    `since`, `until`, `offset` and `limit` query arguments, and answers
+    If-None-Match requests with 304 Not Modified while nothing has changed.
+    """
+    def initialize(self, results):
+        self._results = results
+
+    def compute_etag(self):
+        query = sorted(self.request.query_arguments.items())
+        digest = hashlib.sha1(
+            repr((self._results.token, self._results.version,
+                  query)).encode()).hexdigest()
+        return '"%s"' % digest
+
+    def get(self):
+        # The etag only depends on the buffer and the query, so it is
+        # checked before building the response; tornado then skips hashing
+        # the body as the header is already set.
+        self.set_etag_header()
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+
+        try:
+            offset = max(int(self.get_argument("offset", 0)), 0)
+            limit = min(max(int(self.get_argument("limit",
+                                                  defaults.RESULTS_PAGE_SIZE)),
+                            0), defaults.RESULTS_MAX_PAGE_SIZE)
+        except ValueError:
+            raise tornado.web.HTTPError(400, "offset and limit must be "
+                                        "integers")
+
+        results = self._results.query(test=self.get_argument("test", None),
+                                      since=self.get_argument("since", None),
+                                      until=self.get_argument("until", None))
+        page = {
+            "total": len(results),
+            "offset": offset,
+            "limit": limit,
+            "results": results[offset:offset + limit],
+        }
+        if offset + limit < len(results):
+            page["next_offset"] = offset + limit
+
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps(page))
+
+
+class RunsHandler(tornado.web.RequestHandler):
+    """
+    Queues an immediate run of the runners named by the `test` arguments, or
+    of all runners, on POST, and lists the known runs on GET. The run returned
+    may be one that was already queued or in progress.
+    """
+    def initialize(self, runs):
+        self._runs = runs
+
+    def get(self):
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps([run.as_dict() for run in self._runs.runs()]))
+
+    def post(self):
+        try:
+            run = self._runs.request(self.get_arguments("test"))
+        except KeyError as exc:
+            raise tornado.web.HTTPError(404, "No runner named %s" % exc.args[0])
+        self.set_status(202)
+        self.set_header("Location",
+                        "%s/%s" % (self.request.path.rstrip("/"), run.id))
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps(run.as_dict()))
+
+
+class RunHandler(tornado.web.RequestHandler):
+    """Returns the status and, once done, the results of a run."""
+    def initialize(self, runs):
+        self._runs = runs
+
+    def get(self, run_id):
+        run = self._runs.get(run_id)
+        if run is None:
+            raise tornado.web.HTTPError(404)
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps(run.as_dict()))
+
+
+class LeaseHandler(tornado.web.RequestHandler):
+    """
+    The lease service used to coordinate tests between devices (see
+    murakami.lease). POST a JSON object with `holder` and `ttl` to take or
+    renew a lease, which answers 409 Conflict while another device holds it,
+    and DELETE with a `holder` argument to release it.
+    """
+    def initialize(self, leases):
+        self._leases = leases
+
+    def post(self, name):
+        try:
+            body = json.loads(self.request.body)
+            holder = str(body["holder"])
+            ttl = float(body.get("ttl", defaults.LEASE_TTL))
+        except (ValueError, KeyError, TypeError):
+            raise tornado.web.HTTPError(400, "holder and ttl are required")
+        granted, holder, ttl = self._leases.acquire(name, holder, ttl)
+        if not granted:
+            self.set_status(409)
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps({"holder": holder, "ttl": ttl}))
+
+    def delete(self, name):
+        self._leases.release(name, self.get_argument("holder"))
+        self.set_status(204)
+
+
+def routes(results, runs=None, leases=None):
+    """
+    Returns the API's routes, in the form accepted by WebThingServer's
+    `additional_routes`.
+    """
+    api_routes = [
+        [r"/results/?", ResultsHandler, dict(results=results)],
+    ]
+    if runs is not None:
+        api_routes += [
+            [r"/runs/?", RunsHandler, dict(runs=runs)],
+            [r"/runs/([0-9a-f]+)/?", RunHandler, dict(runs=runs)],
+        ]
+    if leases is not None:
+        api_routes.append(
+            [r"/leases/([\w.-]+)/?", LeaseHandler, dict(leases=leases)])
+    return api_routes
@@ -0,0 +1,89 @@
+"""
+This module contains the connectivity pre-check run before each batch of
+tests: a DNS lookup and a TCP connect to a well-known host, within a
+sub-second budget. When the uplink is down it fails fast, so that the batch
+can be deferred instead of every client waiting out its own timeouts.
+"""
+import logging
+import socket
+import threading
+import time
+
+import murakami.defaults as defaults
+
+_logger = logging.getLogger(__name__)
+
+
+def parse_target(target, default_port=defaults.PRECHECK_PORT):
+    """Splits a "host[:port]" target, which may be a bracketed IPv6
+    address, into a (host, port) tuple."""
+    host, sep, port = target.strip().rpartition(":")
+    if not sep or (":" in host and not host.endswith("]")):
+        host, port = target.strip(), default_port
+    return host.strip("[]"), int(port)
+
+
+def _resolve(host, port, timeout):
+    """
+    Resolves `host` within `timeout` seconds. getaddrinfo() cannot be
+    interrupted, so it runs on a daemon thread that is abandoned on timeout.
+    """
+    result = {}
+
+    def lookup():
+        try:
+            result["addresses"] = socket.getaddrinfo(
+                host, port, type=socket.SOCK_STREAM)
+        except OSError as exc:
+            result["error"] = exc
+
+    thread = threading.Thread(target=lookup, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise socket.timeout("DNS lookup timed out")
+    if "error" in result:
+        raise result["error"]
+    return result["addresses"]
+
+
+class Precheck:
+    """
+    A quick connectivity check: resolving the target and connecting to it
+    must both complete within the timeout.
+
+    ####Arguments
+    * `target`: The "host[:port]" to resolve and connect to
+    * `timeout`: The seconds both steps may take together
+    """
+    def __init__(self, target, timeout=defaults.PRECHECK_TIMEOUT):
+        self.target = target
+        self.host, self.port = parse_target(target)
+        self.timeout = timeout
+
+    def check(self):
+        """
+        Runs the check, returning a dict with whether it passed ("ok"), the
+        step it failed at and why, and how long each step took, in seconds.
+        """
+        result = {"ok": False, "target": self.target, "step": "dns",
+                  "error": None, "dns_time": None, "connect_time": None}
+        start = time.monotonic()
+        try:
+            addresses = _resolve(self.host, self.port, self.timeout)
+            resolved = time.monotonic()
+            result["dns_time"] = resolved - start
+            result["step"] = "connect"
+            family, kind, proto, _, address = addresses[0]
+            with socket.socket(family, kind, proto) as sock:
+                sock.settimeout(max(0.0, self.timeout - (resolved - start)))
+                sock.connect(address)
+            result["connect_time"] = time.monotonic() - resolved
+        except (OSError, IndexError) as exc:
+            result["error"] = str(exc) or type(exc).__name__
+            _logger.debug("Connectivity pre-check failed at %s: %s",
+                          result["step"], result["error"])
+            return result
+        result["ok"] = True
+        result["step"] = None
+        return result
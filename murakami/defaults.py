@@ -7,6 +7,23 @@ HTTP_PORT = 80
 TESTS_PER_DAY = 4
 EXPORT_PATH = "/var/cache/murakami"
 DYNAMIC_FILE = "/var/lib/murakami/config.json"
+DYNAMIC_WRITE_DELAY = 1.0
 CONFIG_FILES = [
     "/etc/murakami/murakami.toml", "~/.config/murakami/murakami.toml"
 ]
+STATE_PATH = "/var/lib/murakami"
+DELIVERY_LOG_SIZE = 10000
+RESULTS_BUFFER_SIZE = 100
+RESULTS_PAGE_SIZE = 20
+RESULTS_MAX_PAGE_SIZE = 1000
+RUNS_HISTORY = 100
+LEASE_TTL = 900
+LEASE_TIMEOUT = 5
+LEASE_BACKOFF = 30
+LEASE_MAX_BACKOFF = 900
+PRECHECK_PORT = 443
+PRECHECK_TIMEOUT = 0.8
+PRECHECK_BACKOFF = 60
+PRECHECK_MAX_BACKOFF = 3600
+EXPORT_POLICY = "immediate"
+EXPORT_QUIET_WINDOW = 10
@@ -2,8 +2,107 @@
 This module includes the wrapper for all result exporters, which defines their
 interface.
 """
+from collections import OrderedDict
 from datetime import datetime
+import hashlib
+import logging
+import os
+import threading
+
+import murakami.defaults as defaults
 from murakami.errors import ExporterError
+import murakami.utils as utils
+
+_logger = logging.getLogger(__name__)
+
+
+def content_hash(data):
+    """
+    Return the hex SHA-256 digest identifying a test result's content.
+
+    ####Arguments
+    * `data`: The test result, as a string or bytes.
+    """
+    if data is None:
+        data = ""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+class DeliveryLog:
+    """
+    A bounded, persisted record of the content hashes an exporter has already
+    delivered. The most recent `size` hashes are kept in memory; each new hash
+    is appended to `path`, which is compacted once it grows past twice that.
+    It is safe to share between threads.
+
+    ####Arguments
+    * `path`: The file to persist hashes to, or None to keep them in memory
+    * `size`: The maximum number of hashes to remember
+    """
+    def __init__(self, path=None, size=defaults.DELIVERY_LOG_SIZE):
+        self._path = path
+        self._size = size
+        self._hashes = OrderedDict()
+        self._lines = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if self._path is None or not os.path.exists(self._path):
+            return
+        try:
+            with open(self._path) as f:
+                for line in f:
+                    digest = line.strip()
+                    if digest:
+                        self._lines += 1
+                        self._remember(digest)
+        except OSError as err:
+            _logger.warning("Cannot read delivery log %s: %s", self._path,
+                            err)
+
+    def _remember(self, digest):
+        self._hashes.pop(digest, None)
+        self._hashes[digest] = True
+        while len(self._hashes) > self._size:
+            self._hashes.popitem(last=False)
+
+    def _compact(self):
+        # Called from add(), with the lock held.
+        tmp_path = self._path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.writelines(digest + "\n" for digest in self._hashes)
+        os.replace(tmp_path, self._path)
+        self._lines = len(self._hashes)
+
+    def __contains__(self, digest):
+        with self._lock:
+            return digest in self._hashes
+
+    def __len__(self):
+        with self._lock:
+            return len(self._hashes)
+
+    def add(self, digest):
+        """Record `digest` as delivered, persisting it if possible."""
+        with self._lock:
+            self._remember(digest)
+            if self._path is None:
+                return
+            try:
+                os.makedirs(os.path.dirname(self._path) or ".",
+                            exist_ok=True)
+                if self._lines >= 2 * self._size:
+                    self._compact()
+                else:
+                    with open(self._path, "a") as f:
+                        f.write(digest + "\n")
+                    self._lines += 1
+            except OSError as err:
+                _logger.warning("Cannot write delivery log %s: %s",
+                                self._path, err)
 
 
 class MurakamiExporter:
@@ -20,6 +119,10 @@ class MurakamiExporter:
     * `config`: A configuration dictionary passed to this instance from
     MurakamiServer
     """
+    # Whether pushes go over the network, and so may be held back while
+    # tests are running (see murakami.exportqueue).
+    remote = True
+
     def __init__(
             self,
             name="",
@@ -33,6 +136,18 @@ class MurakamiExporter:
         self._network_type = network_type
         self._connection_type = connection_type
         self._config = config
+        self._delivered = None
+        if config is None or utils.is_enabled(config.get("dedup", True)):
+            if config is None:
+                config = {}
+            self._delivered = DeliveryLog(
+                path=config.get(
+                    "dedup_path",
+                    os.path.join(defaults.STATE_PATH,
+                                 "delivered-%s.log" % name)),
+                size=int(config.get("dedup_size",
+                                    defaults.DELIVERY_LOG_SIZE)),
+            )
 
     def push(self, test_name="", data=None, timestamp=None):
         """
@@ -45,6 +160,22 @@ class MurakamiExporter:
         """
         raise ExporterError(self.name, "No push() function implemented.")
 
+    def _is_delivered(self, data):
+        """Returns True if this exporter has already delivered `data`."""
+        if self._delivered is None:
+            return False
+        digest = content_hash(data)
+        if digest in self._delivered:
+            _logger.info("Exporter %s already delivered %s, skipping.",
+                         self.name, digest)
+            return True
+        return False
+
+    def _mark_delivered(self, data):
+        """Records that this exporter has successfully delivered `data`."""
+        if self._delivered is not None:
+            self._delivered.add(content_hash(data))
+
     def _generate_filename(self, test_name="", timestamp=None):
         if timestamp is None:
             timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%f")
@@ -48,6 +48,9 @@ class GCSExporter(MurakamiExporter):
             logger.error("GCS: target must be provided.")
             return
 
+        if self._is_delivered(data):
+            return
+
         # Get a Google Cloud Storage Client object from the provided key.
         self.client = storage.Client.from_service_account_json(self.key)
 
@@ -72,5 +75,6 @@ class GCSExporter(MurakamiExporter):
                 bucket_name, object_name)
 
             self.upload(data, bucket_name, object_name)
+            self._mark_delivered(data)
         except ValueError as e:
             logger.error('Error while uploading to GCS: %s', e)
\ No newline at end of file
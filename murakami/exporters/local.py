@@ -11,6 +11,8 @@ logger = logging.getLogger(__name__)
 
 class LocalExporter(MurakamiExporter):
     """This exporter saves data to a local directory."""
+    remote = False
+
     def __init__(
             self,
             name="",
@@ -30,6 +32,8 @@ class LocalExporter(MurakamiExporter):
         self._path = config.get("path", defaults.EXPORT_PATH)
 
     def push(self, test_name="", data=None, timestamp=None):
+        if self._is_delivered(data):
+            return
         try:
             dst_path = os.path.join(
                 self._path, self._generate_filename(test_name, timestamp))
@@ -40,3 +44,4 @@ class LocalExporter(MurakamiExporter):
             logger.error("Exporting to local file failed: %s", err)
         else:
             output.close()
+            self._mark_delivered(data)
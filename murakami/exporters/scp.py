@@ -54,6 +54,9 @@ class SCPExporter(MurakamiExporter):
             logger.error("scp.target must be 'host:/path/to/destination'")
             return
 
+        if self._is_delivered(data):
+            return
+
         ssh = SSHClient()
         ssh.set_missing_host_key_policy(AutoAddPolicy)
 
@@ -74,6 +77,7 @@ class SCPExporter(MurakamiExporter):
                 buf = io.StringIO(data)
                 buf.seek(0)
                 scp.putfo(buf, dst_path)
+            self._mark_delivered(data)
         except Exception as err:
             logger.error("SCP exporter failed: %s", err)
         finally:
@@ -0,0 +1,89 @@
+"""
+This module contains the queue that holds back pushes to remote exporters
+while tests are running, so that uploading one test's results does not share
+the link with the next test. Queued pushes are sent in one burst once no test
+has run for a quiet window.
+"""
+from collections import deque
+import logging
+import threading
+
+import murakami.defaults as defaults
+
+_logger = logging.getLogger(__name__)
+
+IMMEDIATE = "immediate"
+DEFERRED = "deferred"
+POLICIES = (IMMEDIATE, DEFERRED)
+
+
+class ExportQueue:
+    """
+    Holds pushes while tests run. `busy()` is called when a test run starts
+    and `idle()` when the test queue empties; pushes made while idle, and not
+    held behind others, go out right away.
+
+    ####Arguments
+    * `push_cb`: Called with each push's exporter, test name, data and
+    timestamp to deliver it
+    * `quiet`: Seconds without tests to wait before sending queued pushes
+    """
+    def __init__(self, push_cb, quiet=defaults.EXPORT_QUIET_WINDOW):
+        self._push_cb = push_cb
+        self._quiet = quiet
+        self._pending = deque()
+        self._busy = False
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def push(self, exporter, test_name="", data=None, timestamp=None):
+        """Delivers a push now if no test is running, or queues it."""
+        item = (exporter, test_name, data, timestamp)
+        with self._lock:
+            if self._busy or self._timer is not None or self._pending:
+                _logger.debug("Holding back %s push for test %s.",
+                              exporter.name, test_name)
+                self._pending.append(item)
+                return
+        self._push_cb(*item)
+
+    def busy(self):
+        """Holds pushes until the next call to idle()."""
+        with self._lock:
+            self._busy = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def idle(self):
+        """Sends the queued pushes once `quiet` seconds pass without tests."""
+        with self._lock:
+            self._busy = False
+            if self._pending and self._timer is None:
+                self._timer = threading.Timer(self._quiet, self._flush_idle)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush_idle(self):
+        with self._lock:
+            self._timer = None
+        self.flush(stop_when_busy=True)
+
+    def flush(self, stop_when_busy=False):
+        """
+        Sends the queued pushes in order. With `stop_when_busy`, stops early
+        if a test run starts, leaving the rest for its end.
+        """
+        sent = 0
+        while True:
+            with self._lock:
+                if not self._pending or (stop_when_busy and self._busy):
+                    break
+                item = self._pending.popleft()
+            self._push_cb(*item)
+            sent += 1
+        if sent:
+            _logger.info("Sent %d held-back exports.", sent)
@@ -0,0 +1,314 @@
+"""
+This module contains the leases used to coordinate tests between Murakami
+devices sharing an uplink, so that only one of them runs tests at a time. A
+lease is held either in a lock file on a volume shared by the devices, or by
+a lease service that one of the devices runs as part of its HTTP API.
+"""
+from contextlib import contextmanager
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import murakami.defaults as defaults
+
+_logger = logging.getLogger(__name__)
+
+
+class LeaseUnavailable(Exception):
+    """Raised when the lease file or service cannot be reached."""
+
+
+class _Lease:
+    """
+    The interface common to leases: `acquire()` and `renew()` return whether
+    this holder has the lease, and raise LeaseUnavailable if that cannot be
+    determined; `release()` gives it up.
+    """
+    def __init__(self, holder, ttl=defaults.LEASE_TTL):
+        self.holder = holder
+        self.ttl = ttl
+
+    def renew(self):
+        return self.acquire()
+
+    @contextmanager
+    def kept_alive(self):
+        """Renews the held lease every third of its TTL while in the
+        context, and releases it on exit."""
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(self.ttl / 3):
+                try:
+                    if not self.renew():
+                        _logger.warning("Lost the test lease to another "
+                                        "device.")
+                except LeaseUnavailable as exc:
+                    _logger.warning("Cannot renew the test lease: %s", exc)
+
+        thread = threading.Thread(target=renew, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+            try:
+                self.release()
+            except LeaseUnavailable as exc:
+                _logger.warning("Cannot release the test lease: %s", exc)
+
+
+class FileLease(_Lease):
+    """
+    A lease held in a lock file, which must be on a volume shared by all
+    devices. The file holds the holder's name and TTL, and is written to a
+    temporary file and then linked into place, which fails if a lease exists.
+    The lease expires its TTL after the file's modification time, compared
+    with that of a file this device writes, so that expiry goes by the
+    shared volume's clock and the devices' clocks need not agree. An expired
+    file is renamed away before being replaced, and put back if it turns out
+    to be a newer lease than the expired one, so only one device can take it
+    over.
+
+    ####Arguments
+    * `path`: The path of the lock file
+    * `holder`: The name of this device
+    * `ttl`: Seconds after which an unrenewed lease expires
+    """
+    def __init__(self, path, holder, ttl=defaults.LEASE_TTL):
+        super().__init__(holder, ttl)
+        self.path = path
+
+    def _load(self, path):
+        """
+        Reads a lease file, adding the time it expires by the shared
+        volume's clock and a version that changes whenever it is written.
+        """
+        with open(path) as f:
+            stat = os.fstat(f.fileno())
+            try:
+                lease = json.load(f)
+            except ValueError:
+                # Being written by another device; treat it as held.
+                lease = {"holder": None}
+        lease["expires"] = stat.st_mtime + lease.get("ttl", self.ttl)
+        lease["version"] = [stat.st_ino, stat.st_mtime_ns]
+        return lease
+
+    def _read(self):
+        try:
+            return self._load(self.path)
+        except FileNotFoundError:
+            return None
+        except OSError as exc:
+            raise LeaseUnavailable(str(exc))
+
+    def _now(self):
+        """Returns the current time by the shared volume's clock: the
+        modification time of a file written to it."""
+        probe = "%s.%s.%d.now" % (self.path, self.holder, os.getpid())
+        try:
+            with open(probe, "w") as f:
+                f.write(self.holder)
+            return os.stat(probe).st_mtime
+        except OSError as exc:
+            raise LeaseUnavailable(str(exc))
+        finally:
+            if os.path.exists(probe):
+                os.unlink(probe)
+
+    def _write(self, replace=False):
+        """
+        Writes this holder's lease to a temporary file and moves it into
+        place, so that other devices never read a partly written lease.
+        Unless `replace` is True, raises FileExistsError if a lease exists.
+        """
+        lease = {"holder": self.holder, "ttl": self.ttl}
+        tmp = "%s.%s.%d.tmp" % (self.path, self.holder, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(lease, f)
+        try:
+            if replace:
+                os.replace(tmp, self.path)
+            else:
+                os.link(tmp, self.path)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    def acquire(self):
+        try:
+            self._write()
+            return True
+        except FileExistsError:
+            pass
+        except OSError as exc:
+            raise LeaseUnavailable(str(exc))
+
+        lease = self._read()
+        if lease is None:
+            return self.acquire()
+        if lease["holder"] == self.holder:
+            return self.renew()
+        if lease["expires"] > self._now():
+            return False
+
+        stale = "%s.%s.stale" % (self.path, self.holder)
+        try:
+            os.rename(self.path, stale)
+            # Another device may have taken the lease over since it was
+            # read, in which case the live lease was just moved aside.
+            moved = self._load(stale)
+        except FileNotFoundError:
+            # Another device took it over first.
+            return False
+        except OSError as exc:
+            raise LeaseUnavailable(str(exc))
+        if moved != lease:
+            try:
+                os.link(stale, self.path)
+            except FileExistsError:
+                pass
+            except OSError as exc:
+                raise LeaseUnavailable(str(exc))
+            finally:
+                os.unlink(stale)
+            return False
+        _logger.info("Taking over the test lease from %s, which expired.",
+                     lease["holder"])
+        os.unlink(stale)
+        return self.acquire()
+
+    def renew(self):
+        lease = self._read()
+        if lease is None or lease["holder"] != self.holder:
+            return False
+        try:
+            self._write(replace=True)
+        except OSError as exc:
+            raise LeaseUnavailable(str(exc))
+        return True
+
+    def release(self):
+        lease = self._read()
+        if lease is not None and lease["holder"] == self.holder:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            except OSError as exc:
+                raise LeaseUnavailable(str(exc))
+
+
+class HTTPLease(_Lease):
+    """
+    A lease held through the lease service in another device's HTTP API
+    (see LeaseTable).
+
+    ####Arguments
+    * `url`: The URL of the lease, e.g. http://murakami-1.local/leases/site
+    * `holder`: The name of this device
+    * `ttl`: Seconds after which an unrenewed lease expires
+    """
+    def __init__(self, url, holder, ttl=defaults.LEASE_TTL):
+        super().__init__(holder, ttl)
+        self.url = url
+
+    def _request(self, method, body=None):
+        url = self.url
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+        else:
+            url += "?" + urllib.parse.urlencode({"holder": self.holder})
+        request = urllib.request.Request(
+            url, data=data, method=method,
+            headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request,
+                                        timeout=defaults.LEASE_TIMEOUT):
+                return True
+        except urllib.error.HTTPError as exc:
+            if exc.code == 409:
+                return False
+            raise LeaseUnavailable("lease service replied %d" % exc.code)
+        except (urllib.error.URLError, OSError) as exc:
+            raise LeaseUnavailable(str(exc))
+
+    def acquire(self):
+        return self._request("POST", {"holder": self.holder, "ttl": self.ttl})
+
+    def release(self):
+        self._request("DELETE")
+
+
+class LeaseTable:
+    """
+    The state of the lease service: at most one unexpired holder for each
+    lease name. Expiry uses this device's clock only, so the devices' clocks
+    need not agree.
+    """
+    def __init__(self):
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, name, holder, ttl):
+        """Grants or renews the lease, returning (granted, holder,
+        seconds left)."""
+        now = time.monotonic()
+        with self._lock:
+            current = self._leases.get(name)
+            if (current is not None and current[0] != holder
+                    and current[1] > now):
+                return False, current[0], current[1] - now
+            self._leases[name] = (holder, now + ttl)
+            return True, holder, ttl
+
+    def release(self, name, holder):
+        with self._lock:
+            current = self._leases.get(name)
+            if current is not None and current[0] == holder:
+                del self._leases[name]
+
+
+class Backoff:
+    """
+    Exponentially growing, randomised delays between attempts to get the
+    lease, so that devices that missed it don't retry in lockstep.
+    """
+    def __init__(self, base=defaults.LEASE_BACKOFF,
+                 maximum=defaults.LEASE_MAX_BACKOFF):
+        self._base = base
+        self._maximum = maximum
+        self._attempts = 0
+
+    def next(self):
+        delay = min(self._maximum, self._base * 2**self._attempts)
+        self._attempts += 1
+        return random.uniform(delay / 2, delay)
+
+    def reset(self):
+        self._attempts = 0
+
+
+def default_holder(device_id=None):
+    """Returns a name for this device: its device ID, or its hostname."""
+    return device_id or socket.gethostname()
+
+
+def from_url(url, holder, ttl=defaults.LEASE_TTL):
+    """Returns an HTTPLease for http(s) URLs, and a FileLease otherwise."""
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme in ("http", "https"):
+        return HTTPLease(url, holder, ttl)
+    if parsed.scheme == "file":
+        return FileLease(parsed.path, holder, ttl)
+    return FileLease(url, holder, ttl)
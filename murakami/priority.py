@@ -0,0 +1,218 @@
+"""
+This module applies a runner's CPU affinity and priority options to its test
+client, so that the client competes less with the Murakami daemon and other
+processes on the device for the duration of a test.
+"""
+from contextlib import contextmanager
+import logging
+import os
+import resource
+import shutil
+import threading
+
+_logger = logging.getLogger(__name__)
+
+IONICE_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+
+# Added in Python 3.8.
+_get_native_id = getattr(threading, "get_native_id", None)
+
+
+def parse_cpus(cpus):
+    """
+    Parses a CPU list such as "2,3" or "0-1,3" (or a list of ints) into a
+    sorted list of CPU numbers. Raises ValueError if it is malformed.
+    """
+    if isinstance(cpus, (list, tuple)):
+        return sorted(set(int(c) for c in cpus))
+    result = set()
+    for part in str(cpus).split(","):
+        part = part.strip()
+        if "-" in part:
+            first, last = part.split("-", 1)
+            result.update(range(int(first), int(last) + 1))
+        elif part:
+            result.add(int(part))
+    if not result:
+        raise ValueError("empty CPU list %r" % cpus)
+    return sorted(result)
+
+
+def _ionice_class(name):
+    name = str(name).lower()
+    if name not in IONICE_CLASSES:
+        raise ValueError("unknown I/O class %r" % name)
+    return name
+
+
+def _option(config, key, parse):
+    value = config.get(key)
+    if value is None or value == "":
+        return None
+    try:
+        return parse(value)
+    except ValueError as exc:
+        _logger.warning("Ignoring invalid %s option: %s", key, exc)
+        return None
+
+
+def _format_cpus(cpus):
+    return ",".join(str(c) for c in cpus)
+
+
+def _can_raise_priority(nice):
+    if os.geteuid() == 0:
+        return True
+    # Unprivileged processes may go down to 20 - RLIMIT_NICE.
+    soft, _ = resource.getrlimit(resource.RLIMIT_NICE)
+    return soft != resource.RLIM_INFINITY and nice >= 20 - soft
+
+
+class ClientPriority:
+    """
+    Reads a runner's `cpu_affinity`, `nice`, `ionice_class`, `ionice_level`
+    and `daemon_nice` options, applies them to a client's command line with
+    taskset, nice and ionice, and reports the settings that were in effect.
+    Options that are malformed, not permitted or not supported on this
+    system are skipped with a warning.
+
+    ####Arguments
+    * `config`: The runner's configuration dictionary
+    """
+    def __init__(self, config):
+        config = config or {}
+        self.client_nice = None
+        self.ionice_level = None
+        self.cpus = _option(config, "cpu_affinity", parse_cpus)
+        self.nice = _option(config, "nice", int)
+        self.daemon_nice = _option(config, "daemon_nice", int)
+        self.ionice_class = _option(config, "ionice_class", _ionice_class)
+        if self.ionice_class is not None:
+            self.ionice_level = _option(config, "ionice_level", int)
+
+        if self.cpus is not None:
+            available = os.sched_getaffinity(0)
+            if shutil.which("taskset") is None:
+                _logger.warning("taskset is not installed, ignoring "
+                                "cpu_affinity.")
+                self.cpus = None
+            elif not set(self.cpus) <= available:
+                _logger.warning("cpu_affinity %s is not within the CPUs "
+                                "available (%s), ignoring it.",
+                                _format_cpus(self.cpus),
+                                _format_cpus(sorted(available)))
+                self.cpus = None
+        if self.nice is not None and not (
+                self.nice >= os.getpriority(os.PRIO_PROCESS, 0)
+                or _can_raise_priority(self.nice)):
+            _logger.warning("Not permitted to raise the client's priority to "
+                            "nice %d, ignoring it.", self.nice)
+            self.nice = None
+        if self.ionice_class is not None:
+            if shutil.which("ionice") is None:
+                _logger.warning("ionice is not installed, ignoring "
+                                "ionice_class.")
+                self.ionice_class = self.ionice_level = None
+            elif self.ionice_class == "realtime" and os.geteuid() != 0:
+                _logger.warning("Not permitted to use the realtime I/O "
+                                "class, ignoring it.")
+                self.ionice_class = self.ionice_level = None
+            elif self.ionice_class == "idle":
+                self.ionice_level = None
+
+    def command(self, args):
+        """
+        Returns `args` prefixed with the commands applying the client's
+        affinity and priority. This must be called from the thread that then
+        starts the client, as nice values are per thread on Linux.
+        """
+        prefix = []
+        if self.cpus is not None:
+            prefix += ["taskset", "-c", _format_cpus(self.cpus)]
+        self.client_nice = os.getpriority(os.PRIO_PROCESS, 0)
+        if self.nice is not None:
+            # nice(1) takes an adjustment to the current value.
+            adjustment = self.nice - self.client_nice
+            if adjustment:
+                prefix += ["nice", "-n", str(adjustment)]
+            self.client_nice = self.nice
+        if self.ionice_class is not None:
+            prefix += ["ionice", "-c", str(IONICE_CLASSES[self.ionice_class])]
+            if self.ionice_level is not None:
+                prefix += ["-n", str(self.ionice_level)]
+        return prefix + list(args)
+
+    @contextmanager
+    def lowered_daemon(self):
+        """
+        Lowers the priority of the daemon's other threads to `daemon_nice`
+        while in the context, and restores them afterwards. Restoring needs
+        the privilege to raise priorities, and is skipped with a warning
+        otherwise. The calling thread, which starts the client, is left
+        alone, and nothing is lowered if its thread id cannot be found.
+        """
+        if self.daemon_nice is None:
+            yield
+            return
+
+        current = _thread_id()
+        threads = _threads()
+        if current is None or threads is None:
+            _logger.warning("Cannot find the daemon's thread ids, not "
+                            "lowering its priority.")
+            yield
+            return
+
+        previous = {}
+        for tid in threads:
+            if tid == current:
+                continue
+            try:
+                nice = os.getpriority(os.PRIO_PROCESS, tid)
+                if nice < self.daemon_nice:
+                    os.setpriority(os.PRIO_PROCESS, tid, self.daemon_nice)
+                    previous[tid] = nice
+            except OSError:
+                # The thread has exited.
+                continue
+        try:
+            yield
+        finally:
+            for tid, nice in previous.items():
+                try:
+                    os.setpriority(os.PRIO_PROCESS, tid, nice)
+                except ProcessLookupError:
+                    continue
+                except OSError as exc:
+                    _logger.warning("Cannot restore the priority of the "
+                                    "daemon: %s", exc)
+                    break
+
+    def fields(self):
+        """Returns the Murakami* result fields for the settings in effect."""
+        return {
+            'MurakamiClientCPUs': (_format_cpus(self.cpus)
+                                   if self.cpus is not None else None),
+            'MurakamiClientNice': self.client_nice,
+            'MurakamiClientIOClass': self.ionice_class,
+            'MurakamiClientIOLevel': self.ionice_level,
+            'MurakamiDaemonNice': self.daemon_nice,
+        }
+
+
+def _thread_id():
+    """Returns the kernel's id for the calling thread, or None."""
+    if _get_native_id is not None:
+        return _get_native_id()
+    # Otherwise, read it from /proc (Linux 3.17+).
+    try:
+        return int(os.path.basename(os.readlink("/proc/thread-self")))
+    except (OSError, ValueError):
+        return None
+
+
+def _threads():
+    try:
+        return [int(tid) for tid in os.listdir("/proc/self/task")]
+    except OSError:
+        return None
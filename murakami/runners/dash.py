@@ -1,12 +1,14 @@
+import json
 import logging
 import shutil
-import subprocess
 import uuid
 
 import jsonlines
 
 from murakami.errors import RunnerError
+from murakami.priority import ClientPriority
 from murakami.runner import MurakamiRunner
+import murakami.utils as utils
 
 logger = logging.getLogger(__name__)
 
@@ -27,17 +29,25 @@ class DashClient(MurakamiRunner):
             device_id=device_id,
         )
 
-    @staticmethod
-    def _start_test():
+    def _start_test(self):
         logger.info("Starting DASH test...")
         if shutil.which("dash-client") is not None:
-            output = subprocess.run(["dash-client"],
-                                    check=True,
-                                    text=True,
-                                    capture_output=True)
+            loadavg = utils.load_average()
+            output = utils.run_client(
+                ["dash-client"],
+                check=True,
+                priority=ClientPriority(self._config))
             logger.info("Dash test complete.")
             # TODO: write parser. Only print the last line for now.
-            return output.stdout.splitlines()[-1]
+            result = output.stdout.splitlines()[-1]
+            try:
+                summary = json.loads(result)
+            except ValueError:
+                return result
+            if not isinstance(summary, dict):
+                return result
+            summary.update(utils.resource_fields(loadavg, output))
+            return json.dumps(summary)
         else:
             raise RunnerError(
                 "dash",
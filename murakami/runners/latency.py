@@ -0,0 +1,271 @@
+import asyncio
+from collections import deque
+import datetime
+import functools
+import itertools
+import json
+import logging
+import math
+import socket
+import statistics
+import threading
+import time
+
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+from murakami.runner import MurakamiRunner
+
+logger = logging.getLogger(__name__)
+
+# How long resolved target addresses are reused, in seconds.
+RESOLVE_TTL = 600
+# The most rollups kept between exports; older ones are dropped.
+MAX_ROLLUPS = 10000
+
+
+def _parse_targets(value):
+    """Parses "host:port" targets, given as a list or a comma-separated
+    string, into (host, port) tuples."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    targets = []
+    for target in value:
+        host, _, port = str(target).strip().rpartition(":")
+        targets.append((host.strip("[]"), int(port)))
+    return targets
+
+
+def _timestamp(seconds):
+    return datetime.datetime.utcfromtimestamp(seconds).strftime(
+        "%Y-%m-%dT%H:%M:%S.%f")
+
+
+def _rollup(protocol, host, port, minute, samples):
+    rtts = sorted(rtt for rtt in samples if rtt is not None)
+    rollup = {
+        'Target': "%s:%d" % (host, port),
+        'Protocol': protocol,
+        'Minute': _timestamp(minute),
+        'Sent': len(samples),
+        'Received': len(rtts),
+        'LossRate': 1 - len(rtts) / len(samples),
+        'MinRTTValue': None,
+        'MedianRTTValue': None,
+        'P95RTTValue': None,
+        'RTTUnit': 'ms',
+    }
+    if rtts:
+        rollup['MinRTTValue'] = rtts[0]
+        rollup['MedianRTTValue'] = statistics.median(rtts)
+        rollup['P95RTTValue'] = rtts[math.ceil(0.95 * len(rtts)) - 1]
+    return rollup
+
+
+class _EchoProtocol(asyncio.DatagramProtocol):
+    """Matches UDP echo replies to the probes waiting for them."""
+    def __init__(self):
+        self.transport = None
+        self.pending = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        waiter = self.pending.pop(data, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(asyncio.get_event_loop().time())
+
+    def error_received(self, exc):
+        logger.debug("UDP echo probe error: %s", exc)
+
+
+class LatencyProbe(MurakamiRunner):
+    """
+    Continuously probes the latency to a few targets with TCP connects and,
+    optionally, UDP echo requests, on the IOLoop. Samples are kept in a ring
+    buffer per target and rolled up per minute into the minimum, median and
+    95th percentile RTT and loss rate. Only the rollups are exported, in one
+    result every `export_interval` seconds.
+    """
+    def __init__(self, config=None, data_cb=None,
+        location=None, network_type=None, connection_type=None,
+        device_id=None):
+        super().__init__(
+            title="latency",
+            description="Continuous TCP connect and UDP echo latency probes.",
+            config=config,
+            data_cb=data_cb,
+            location=location,
+            network_type=network_type,
+            connection_type=connection_type,
+            device_id=device_id
+        )
+        config = config or {}
+        self._interval = float(config.get("interval", 5))
+        self._timeout = float(config.get("timeout", 1))
+        self._export_interval = float(config.get("export_interval", 3600))
+        size = int(config.get("buffer_size", 1024))
+        self._targets = (
+            [("tcp", h, p) for h, p in _parse_targets(config.get("targets"))]
+            + [("udp", h, p)
+               for h, p in _parse_targets(config.get("udp_targets"))])
+
+        self._lock = threading.Lock()
+        self._samples = {t: deque(maxlen=size) for t in self._targets}
+        self._rollups = deque(maxlen=MAX_ROLLUPS)
+        self._rolled_until = time.time() // 60 * 60
+        self._last_export = time.time()
+        self._addresses = {}
+        self._echo = {}
+        self._sequence = itertools.count()
+        self._probing = False
+        self._callback = None
+        if self._targets:
+            self._callback = PeriodicCallback(self._tick,
+                                              self._interval * 1000,
+                                              jitter=0.1)
+            self._callback.start()
+
+    async def _resolve(self, protocol, host, port):
+        key = (protocol, host, port)
+        cached = self._addresses.get(key)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+        loop = asyncio.get_event_loop()
+        infos = await loop.getaddrinfo(
+            host, port,
+            type=socket.SOCK_STREAM if protocol == "tcp" else
+            socket.SOCK_DGRAM)
+        address = infos[0][4][:2]
+        self._addresses[key] = (address, time.monotonic() + RESOLVE_TTL)
+        return address
+
+    async def _probe_tcp(self, host, port):
+        loop = asyncio.get_event_loop()
+        address = await self._resolve("tcp", host, port)
+        start = loop.time()
+        transport, _ = await asyncio.wait_for(
+            loop.create_connection(asyncio.Protocol, *address),
+            self._timeout)
+        rtt = (loop.time() - start) * 1000
+        transport.close()
+        return rtt
+
+    async def _probe_udp(self, host, port):
+        loop = asyncio.get_event_loop()
+        echo = self._echo.get((host, port))
+        if echo is None or echo.transport.is_closing():
+            address = await self._resolve("udp", host, port)
+            _, echo = await loop.create_datagram_endpoint(
+                _EchoProtocol, remote_addr=address)
+            self._echo[(host, port)] = echo
+        payload = b"murakami %d" % next(self._sequence)
+        waiter = loop.create_future()
+        echo.pending[payload] = waiter
+        start = loop.time()
+        echo.transport.sendto(payload)
+        try:
+            end = await asyncio.wait_for(waiter, self._timeout)
+        finally:
+            echo.pending.pop(payload, None)
+        return (end - start) * 1000
+
+    async def _probe(self, protocol, host, port):
+        try:
+            if protocol == "tcp":
+                return await self._probe_tcp(host, port)
+            return await self._probe_udp(host, port)
+        except (OSError, asyncio.TimeoutError) as exc:
+            logger.debug("%s probe to %s:%d failed: %s", protocol, host, port,
+                         exc)
+            return None
+
+    async def probe(self):
+        """Probes every target once, and records the samples."""
+        now = time.time()
+        rtts = await asyncio.gather(*(self._probe(*t) for t in self._targets))
+        with self._lock:
+            for target, rtt in zip(self._targets, rtts):
+                self._samples[target].append((now, rtt))
+
+    def roll_up(self, now=None):
+        """Rolls up the samples of every minute completed before `now`."""
+        minute = (time.time() if now is None else now) // 60 * 60
+        with self._lock:
+            for target, samples in self._samples.items():
+                minutes = {}
+                for timestamp, rtt in samples:
+                    if self._rolled_until <= timestamp < minute:
+                        minutes.setdefault(timestamp // 60 * 60,
+                                           []).append(rtt)
+                for start in sorted(minutes):
+                    self._rollups.append(
+                        _rollup(*target, start, minutes[start]))
+            self._rolled_until = max(self._rolled_until, minute)
+
+    def _result(self, rollups):
+        minutes = sorted(r['Minute'] for r in rollups)
+        return json.dumps({
+            'TestName': "latency",
+            'TestStartTime': minutes[0] if minutes else None,
+            'TestEndTime': minutes[-1] if minutes else None,
+            'MurakamiLocation': self._location,
+            'MurakamiConnectionType': self._connection_type,
+            'MurakamiNetworkType': self._network_type,
+            'MurakamiDeviceID': self._device_id,
+            'ProbeInterval': self._interval,
+            'Rollups': rollups,
+        })
+
+    def export(self):
+        """
+        Passes the rollups accumulated since the last export to the
+        exporters, in a thread so that slow exporters don't block the IOLoop.
+        """
+        self._last_export = time.time()
+        with self._lock:
+            rollups = list(self._rollups)
+            self._rollups.clear()
+        if not rollups or self._data_cb is None:
+            return
+        IOLoop.current().run_in_executor(
+            None,
+            functools.partial(self._data_cb,
+                              test_name=self.title,
+                              data=self._result(rollups),
+                              timestamp=_timestamp(time.time())))
+
+    def _tick(self):
+        if self._probing or not self.enabled:
+            return
+        IOLoop.current().spawn_callback(self._round)
+
+    async def _round(self):
+        self._probing = True
+        try:
+            await self.probe()
+        finally:
+            self._probing = False
+        self.roll_up()
+        if time.time() - self._last_export >= self._export_interval:
+            self.export()
+
+    def start_test(self):
+        """
+        Returns the rollups not exported yet, without exporting them: the
+        probes run continuously rather than when tests are triggered.
+        """
+        self.roll_up()
+        with self._lock:
+            rollups = list(self._rollups)
+        return self._result(rollups)
+
+    def _teardown(self):
+        if self._callback is not None:
+            self._callback.stop()
+        self.roll_up()
+        self.export()
+        for echo in self._echo.values():
+            echo.transport.close()
@@ -1,12 +1,13 @@
 import logging
 import shutil
-import subprocess
 import uuid
 import json
 import datetime
 
 from murakami.errors import RunnerError
+from murakami.priority import ClientPriority
 from murakami.runner import MurakamiRunner
+import murakami.utils as utils
 
 logger = logging.getLogger(__name__)
 
@@ -42,12 +43,10 @@ class Ndt7Client(MurakamiRunner):
                 if insecure:
                     cmdargs.append('--insecure')
 
+            loadavg = utils.load_average()
             starttime = datetime.datetime.utcnow()
-            output = subprocess.run(
-                cmdargs,
-                text=True,
-                capture_output=True,
-            )
+            output = utils.run_client(
+                cmdargs, priority=ClientPriority(self._config))
             endtime = datetime.datetime.utcnow()
 
             murakami_output = {
@@ -59,6 +58,8 @@ class Ndt7Client(MurakamiRunner):
                 'MurakamiNetworkType': self._network_type,
                 'MurakamiDeviceID': self._device_id,
             }
+            murakami_output.update(
+                utils.resource_fields(loadavg, output))
 
             if output.returncode == 0:
                 # Parse ndt7 summary.
@@ -1,15 +1,115 @@
 import logging
+import resource
 import shutil
 import subprocess
+import threading
+import time
+import types
 import uuid
 import datetime
 import json
 
+try:
+    import speedtest
+except ImportError:
+    speedtest = None
+
 from murakami.errors import RunnerError
+from murakami.priority import ClientPriority
 from murakami.runner import MurakamiRunner
+import murakami.utils as utils
 
 logger = logging.getLogger(__name__)
 
+# How long the in-process mode reuses the speedtest.net configuration and
+# server list before fetching them again, in seconds.
+CACHE_TTL = 6 * 60 * 60
+
+
+class _Session:
+    """
+    Runs speedtest-cli's test logic inside the Murakami process. The parsed
+    configuration and server list are fetched once and shared by the multi-
+    and single-stream runners until they are CACHE_TTL seconds old, or a test
+    fails; only the best server's latency is measured again for each test.
+    """
+    def __init__(self):
+        self._speedtest = None
+        self._fetched = 0
+        self._lock = threading.Lock()
+
+    def _get(self):
+        if (self._speedtest is None
+                or time.monotonic() - self._fetched > CACHE_TTL):
+            logger.debug("Fetching speedtest.net configuration and servers")
+            self._speedtest = speedtest.Speedtest()
+            self._speedtest.get_servers()
+            self._fetched = time.monotonic()
+        return self._speedtest
+
+    def run(self, single=False):
+        """
+        Runs a test like `speedtest-cli --json [--single]` would, and returns
+        the outcome as a CompletedProcess for _parse_summary(), with the
+        resources used by this process during the test in `rusage`.
+        """
+        args = ["speedtest-cli"] + (["--single"] if single else []) + ["--json"]
+        threads = 1 if single else None
+        with self._lock:
+            before = resource.getrusage(resource.RUSAGE_SELF)
+            output = self._run(args, threads)
+            after = resource.getrusage(resource.RUSAGE_SELF)
+            output.rusage = types.SimpleNamespace(
+                ru_utime=after.ru_utime - before.ru_utime,
+                ru_stime=after.ru_stime - before.ru_stime,
+                ru_maxrss=after.ru_maxrss,
+                ru_nvcsw=after.ru_nvcsw - before.ru_nvcsw,
+                ru_nivcsw=after.ru_nivcsw - before.ru_nivcsw,
+            )
+            return output
+
+    def _run(self, args, threads):
+        try:
+            st = self._get()
+            st.results = speedtest.SpeedtestResults(
+                client=st.config["client"],
+                opener=st._opener,
+                secure=st._secure,
+            )
+            st.get_best_server()
+            st.download(threads=threads)
+            st.upload(threads=threads, pre_allocate=True)
+            return subprocess.CompletedProcess(
+                args, 0, stdout=json.dumps(st.results.dict()), stderr="")
+        except (speedtest.SpeedtestException, OSError) as exc:
+            self._speedtest = None
+            return subprocess.CompletedProcess(args, 1, stdout="",
+                                               stderr=str(exc))
+
+
+_session = _Session()
+
+
+def run_speedtest(config, single=False):
+    """
+    Runs a speedtest-cli test, in a subprocess or, if the runner's `mode` is
+    set to "inprocess", in this process, and returns a CompletedProcess.
+    """
+    if config.get("mode", "subprocess") == "inprocess":
+        if speedtest is None:
+            raise RunnerError(
+                "speedtest",
+                "Module speedtest is not available, please install "
+                "speedtest-cli.")
+        return _session.run(single)
+    if shutil.which("speedtest-cli") is None:
+        raise RunnerError(
+            "speedtest",
+            "Executable does not exist, please install speedtest-cli.")
+    return utils.run_client(
+        ["speedtest-cli"] + (["--single"] if single else []) + ["--json"],
+        priority=ClientPriority(config))
+
 
 class SpeedtestClient(MurakamiRunner):
     """Run Speedtest.net tests."""
@@ -41,11 +141,11 @@ class SpeedtestClient(MurakamiRunner):
             JSONDecodeError: if the output cannot be parsed as JSON.
         """
 
+        murakami_output = {}
         if output.returncode == 0:
             summary = {}
             summary = json.loads(output.stdout)
 
-            murakami_output = {}
             murakami_output['DownloadValue'] = summary.get('download')
             murakami_output['DownloadUnit'] = 'Bit/s'
             murakami_output['UploadValue'] = summary.get('upload')
@@ -122,30 +222,25 @@ class SpeedtestClient(MurakamiRunner):
             murakami_output['LoggedIn'] = None
             murakami_output['Country'] = None
 
+            return murakami_output
+
     def _start_test(self):
         logger.info("Starting Speedtest multi-stream test...")
-        if shutil.which("speedtest-cli") is not None:
-
-            starttime = datetime.datetime.utcnow()
-            output = subprocess.run(["speedtest-cli", "--json"],
-                                    text=True,
-                                    capture_output=True)
-            endtime = datetime.datetime.utcnow()
-
-            murakami_output = {
-                'TestName': "speedtest-cli-multi-stream",
-                'TestStartTime': starttime.strftime('%Y-%m-%dT%H:%M:%S.%f'),
-                'TestEndTime': endtime.strftime('%Y-%m-%dT%H:%M:%S.%f'),
-                'MurakamiLocation': self._location,
-                'MurakamiConnectionType': self._connection_type,
-                'MurakamiNetworkType': self._network_type,
-                'MurakamiDeviceID': self._device_id,
-            }
-
-            murakami_output.update(self._parse_summary(output))
-            return json.dumps(murakami_output)
-
-        else:
-            raise RunnerError(
-                "speedtest",
-                "Executable does not exist, please install speedtest-cli.")
+        loadavg = utils.load_average()
+        starttime = datetime.datetime.utcnow()
+        output = run_speedtest(self._config)
+        endtime = datetime.datetime.utcnow()
+
+        murakami_output = {
+            'TestName': "speedtest-cli-multi-stream",
+            'TestStartTime': starttime.strftime('%Y-%m-%dT%H:%M:%S.%f'),
+            'TestEndTime': endtime.strftime('%Y-%m-%dT%H:%M:%S.%f'),
+            'MurakamiLocation': self._location,
+            'MurakamiConnectionType': self._connection_type,
+            'MurakamiNetworkType': self._network_type,
+            'MurakamiDeviceID': self._device_id,
+        }
+        murakami_output.update(utils.resource_fields(loadavg, output))
+
+        murakami_output.update(self._parse_summary(output))
+        return json.dumps(murakami_output)
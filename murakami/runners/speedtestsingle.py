@@ -1,13 +1,11 @@
 import logging
-import shutil
-import subprocess
 import uuid
 import datetime
 import json
 
-from murakami.errors import RunnerError
 from murakami.runner import MurakamiRunner
-from murakami.runners.speedtest import SpeedtestClient
+import murakami.utils as utils
+from murakami.runners.speedtest import SpeedtestClient, run_speedtest
 
 logger = logging.getLogger(__name__)
 
@@ -30,27 +28,21 @@ class SpeedtestSingleClient(MurakamiRunner):
 
     def _start_test(self):
         logger.info("Starting Speedtest single stream test...")
-        if shutil.which("speedtest-cli") is not None:
-            starttime = datetime.datetime.utcnow()
-            output = subprocess.run(["speedtest-cli",
-                                     "--single", "--json"],
-                                    text=True,
-                                    capture_output=True)
-            endtime = datetime.datetime.utcnow()
+        loadavg = utils.load_average()
+        starttime = datetime.datetime.utcnow()
+        output = run_speedtest(self._config, single=True)
+        endtime = datetime.datetime.utcnow()
 
-            murakami_output = {
-                'TestName': "speedtest-cli-single-stream",
-                'TestStartTime': starttime.strftime('%Y-%m-%dT%H:%M:%S.%f'),
-                'TestEndTime': endtime.strftime('%Y-%m-%dT%H:%M:%S.%f'),
-                'MurakamiLocation': self._location,
-                'MurakamiConnectionType': self._connection_type,
-                'MurakamiNetworkType': self._network_type,
-                'MurakamiDeviceID': self._device_id,
-            }
+        murakami_output = {
+            'TestName': "speedtest-cli-single-stream",
+            'TestStartTime': starttime.strftime('%Y-%m-%dT%H:%M:%S.%f'),
+            'TestEndTime': endtime.strftime('%Y-%m-%dT%H:%M:%S.%f'),
+            'MurakamiLocation': self._location,
+            'MurakamiConnectionType': self._connection_type,
+            'MurakamiNetworkType': self._network_type,
+            'MurakamiDeviceID': self._device_id,
+        }
+        murakami_output.update(utils.resource_fields(loadavg, output))
 
-            murakami_output.update(SpeedtestClient._parse_summary(output))
-            return json.dumps(murakami_output)
-        else:
-            raise RunnerError(
-                "speedtest",
-                "Executable does not exist, please install speedtest-cli.")
+        murakami_output.update(SpeedtestClient._parse_summary(output))
+        return json.dumps(murakami_output)
@@ -4,18 +4,26 @@ WebThingServer loading code.
 """
 
 import datetime
+import json
 import logging
 import random
 import pkg_resources
 
 from apscheduler.schedulers.tornado import TornadoScheduler
 from apscheduler.triggers.base import BaseTrigger
+from tornado.httpserver import HTTPServer
 from tornado.ioloop import IOLoop
 from tornado import gen
+import tornado.web
 from webthing import WebThingServer, SingleThing
 
 import murakami.defaults as defaults
+from murakami.api import ResultBuffer, routes as api_routes
+from murakami.connectivity import Precheck
+from murakami.exportqueue import DEFERRED, ExportQueue
+import murakami.lease as lease
 from murakami.thing import MurakamiThing
+from murakami.trigger import RunQueue
 import murakami.utils as utils
 
 _logger = logging.getLogger(__name__)
@@ -64,6 +72,19 @@ class MurakamiServer:
     * `network_type`: string describing the network this device is connected to
     * `connection_type`: string describing type of connection this device is
     using
+    * `api`: serve the HTTP API on `port` even if WebThings is disabled
+    * `results_size`: number of recent results per test kept for the API
+    * `lease_url`: URL of the lease (a lease service URL or a lock file path)
+    this device must hold to run tests, to take turns with other devices
+    * `lease_ttl`: seconds after which an unrenewed lease expires
+    * `lease_server`: serve the lease service from this device's API
+    * `precheck`: "host[:port]" to resolve and connect to before each batch of
+    tests, which is deferred while that fails
+    * `precheck_timeout`: seconds the connectivity pre-check may take
+    * `export_policy`: "immediate" to push results to every exporter as soon
+    as a test finishes, or "deferred" to hold pushes to remote exporters
+    until no test has run for `export_quiet` seconds
+    * `export_quiet`: seconds without tests before held pushes are sent
     """
     def __init__(
             self,
@@ -80,12 +101,22 @@ class MurakamiServer:
             connection_type=None,
             device_id=None,
             config=None,
+            api=False,
+            results_size=defaults.RESULTS_BUFFER_SIZE,
+            lease_url=None,
+            lease_ttl=defaults.LEASE_TTL,
+            lease_server=False,
+            precheck=None,
+            precheck_timeout=defaults.PRECHECK_TIMEOUT,
+            export_policy=defaults.EXPORT_POLICY,
+            export_quiet=defaults.EXPORT_QUIET_WINDOW,
     ):
         self._runners = {}
         self._exporters = {}
 
         self._scheduler = None
         self._server = None
+        self._api_server = None
 
         self._port = port
         self._hostname = hostname
@@ -100,23 +131,77 @@ class MurakamiServer:
         self._connection_type = connection_type
         self._device_id = device_id
         self._config = config
+        self._api = api
+        self._results = ResultBuffer(results_size)
+        self._leases = lease.LeaseTable() if lease_server else None
+        test_lease = None
+        if lease_url:
+            test_lease = lease.from_url(lease_url,
+                                        lease.default_holder(device_id),
+                                        lease_ttl)
+        self._held_exports = None
+        busy_cb = idle_cb = None
+        if export_policy == DEFERRED:
+            self._held_exports = ExportQueue(self._push, export_quiet)
+            busy_cb = self._held_exports.busy
+            idle_cb = self._held_exports.idle
+        self._runs = RunQueue(
+            self._runners,
+            lease=test_lease,
+            precheck=Precheck(precheck, precheck_timeout)
+            if precheck else None,
+            offline_cb=self._report_offline,
+            busy_cb=busy_cb,
+            idle_cb=idle_cb)
 
     def _call_runners(self):
-        for r in self._runners.values():
-            _logger.info("Running test: %s", r.title)
-            try:
-                r.start_test()
-            except Exception as exc:
-                _logger.error("Failed to run test %s: %s", r.title, str(exc))
+        # Scheduled runs share the on-demand queue, so they never overlap
+        # with (and are merged into) runs requested through the API.
+        self._runs.request()
 
     def _call_exporters(self, test_name="", data="", timestamp=None):
+        self._results.add(test_name, data, timestamp)
         for e in self._exporters.values():
-            _logger.info("Running exporter %s for test %s", e.name, test_name)
-            try:
-                e.push(test_name, data, timestamp)
-            except Exception as exc:
-                _logger.error("Failed to run exporter %s: %s", e.name,
-                              str(exc))
+            if self._held_exports is not None and e.remote:
+                self._held_exports.push(e, test_name, data, timestamp)
+            else:
+                self._push(e, test_name, data, timestamp)
+
+    def _push(self, exporter, test_name, data, timestamp):
+        _logger.info("Running exporter %s for test %s", exporter.name,
+                     test_name)
+        try:
+            exporter.push(test_name, data, timestamp)
+        except Exception as exc:
+            _logger.error("Failed to run exporter %s: %s", exporter.name,
+                          str(exc))
+
+    def _report_offline(self, run, check, delay):
+        # A single record stands in for the tests the failed pre-check
+        # skipped, rather than one failure per test.
+        now = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%f")
+        record = {
+            "TestName": "offline",
+            "TestStartTime": now,
+            "MurakamiLocation": self._location,
+            "MurakamiConnectionType": self._connection_type,
+            "MurakamiNetworkType": self._network_type,
+            "MurakamiDeviceID": self._device_id,
+            "PrecheckTarget": check["target"],
+            "PrecheckStep": check["step"],
+            "PrecheckError": check["error"],
+            "PrecheckDNSTime": check["dns_time"],
+            "SkippedTests": list(run.runners),
+            "RetryDelay": delay,
+        }
+        self._call_exporters(test_name="offline", data=json.dumps(record),
+                             timestamp=now)
+
+    def _routes(self):
+        routes = api_routes(self._results, self._runs, self._leases)
+        if isinstance(self._additional_routes, list):
+            routes = self._additional_routes + routes
+        return routes
 
     def _load_runners(self):
         trigger = RandomTrigger(tests_per_day=self._tests_per_day,
@@ -141,13 +226,19 @@ class MurakamiServer:
         # Start webthings server if enabled
         if self._webthings:
             self._server = WebThingServer(
-                SingleThing(MurakamiThing(self._runners.values())),
+                SingleThing(MurakamiThing(self._runners.values(),
+                                          self._runs)),
                 port=self._port,
                 hostname=self._hostname,
                 ssl_options=self._ssl_options,
-                additional_routes=self._additional_routes,
+                additional_routes=self._routes(),
                 base_path=self._base_path,
             )
+        elif self._api or self._leases is not None:
+            app = tornado.web.Application([[self._base_path.rstrip("/") +
+                                            route[0]] + route[1:]
+                                           for route in self._routes()])
+            self._api_server = HTTPServer(app, ssl_options=self._ssl_options)
 
         # Start test scheduler if enabled
         if self._tests_per_day > 0:
@@ -202,7 +293,11 @@ class MurakamiServer:
         if self._server is not None:
             _logger.info("Starting the WebThing server.")
             self._server.start()
-        if self._scheduler is not None and self._server is None:
+        elif self._api_server is not None:
+            _logger.info("Starting the API server.")
+            self._api_server.listen(self._port)
+            IOLoop.current().start()
+        elif self._scheduler is not None:
             IOLoop.current().start()
 
     def stop(self):
@@ -217,6 +312,10 @@ class MurakamiServer:
         if self._server is not None:
             _logger.info("Stopping the WebThing server.")
             self._server.stop()
+        if self._api_server is not None:
+            _logger.info("Stopping the API server.")
+            self._api_server.stop()
+            self._api_server = None
 
         _logger.info("Cleaning up test runners.")
 
@@ -224,6 +323,10 @@ class MurakamiServer:
             self._runners[r].stop_test()
             self._runners[r].teardown()
 
+        if self._held_exports is not None and len(self._held_exports):
+            _logger.info("Sending held-back exports.")
+            self._held_exports.flush()
+
     @gen.coroutine
     def reload(self, signum, frame, **kwargs):
         """Reload MurakamiServer, to be called as an event handler."""
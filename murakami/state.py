@@ -0,0 +1,183 @@
+"""
+This module contains the dynamic state store, which holds the settings that
+can be changed at runtime (e.g. via WebThings) and persists them to a JSON
+file.
+"""
+from collections.abc import MutableMapping
+import json
+import logging
+import os
+import threading
+
+import murakami.defaults as defaults
+
+_logger = logging.getLogger(__name__)
+
+
+class _Nested(MutableMapping):
+    """
+    A view of a dict nested inside a DynamicState, which marks the store as
+    changed when it is modified. It looks its dict up by key path on every
+    access, so it stays valid when the store is reloaded.
+    """
+    def __init__(self, store, path):
+        self._store = store
+        self._path = path
+
+    def _dict(self):
+        return self._store._resolve(self._path)
+
+    def __getitem__(self, key):
+        with self._store._lock:
+            return self._store._wrap(self._path + (key, ),
+                                     self._dict()[key])
+
+    def __setitem__(self, key, value):
+        with self._store._lock:
+            self._dict()[key] = value
+            self._store._changed()
+
+    def __delitem__(self, key):
+        with self._store._lock:
+            del self._dict()[key]
+            self._store._changed()
+
+    def __iter__(self):
+        with self._store._lock:
+            return iter(list(self._dict()))
+
+    def __len__(self):
+        with self._store._lock:
+            return len(self._dict())
+
+    def __contains__(self, key):
+        with self._store._lock:
+            return key in self._dict()
+
+    def __repr__(self):
+        return repr(self._dict())
+
+
+class DynamicState(MutableMapping):
+    """
+    A dict-like store backed by a JSON file, used in place of the config file
+    for settings that can be changed at runtime. The data is kept in memory:
+    the file is only parsed again when its mtime or size changes, and
+    changes are written back atomically after `delay` seconds, so that a
+    burst of changes results in a single write.
+
+    ####Arguments
+    * `path`: The path of the JSON file
+    * `delay`: Seconds to wait before writing changes back to the file
+    """
+    def __init__(self, path, delay=defaults.DYNAMIC_WRITE_DELAY):
+        self._path = path
+        self._delay = delay
+        self._lock = threading.RLock()
+        self._data = {}
+        self._stat = None
+        self._dirty = False
+        self._timer = None
+        self._reload()
+
+    def _file_stat(self):
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _reload(self):
+        stat = self._file_stat()
+        if stat == self._stat:
+            return
+        if self._dirty:
+            _logger.warning(
+                "Dynamic state %s changed on disk, keeping unsaved changes.",
+                self._path)
+            return
+        self._stat = stat
+        if stat is None:
+            self._data = {}
+            return
+        try:
+            with open(self._path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as err:
+            _logger.error("Cannot read dynamic state %s: %s", self._path, err)
+            return
+        if isinstance(data, dict):
+            self._data = data
+        else:
+            _logger.error("Dynamic state %s is not a JSON object.", self._path)
+
+    def _resolve(self, path):
+        self._reload()
+        value = self._data
+        for key in path:
+            value = value[key]
+        return value
+
+    def _wrap(self, path, value):
+        if isinstance(value, dict):
+            return _Nested(self, path)
+        return value
+
+    def _changed(self):
+        self._dirty = True
+        if self._timer is None:
+            self._timer = threading.Timer(self._delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Write any pending changes to the file now."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            tmp_path = self._path + ".tmp"
+            try:
+                os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+                with open(tmp_path, "w") as f:
+                    json.dump(self._data, f, indent=4)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self._path)
+            except OSError as err:
+                _logger.error("Cannot write dynamic state %s: %s", self._path,
+                              err)
+                return
+            self._dirty = False
+            self._stat = self._file_stat()
+
+    def __getitem__(self, key):
+        with self._lock:
+            return self._wrap((key, ), self._resolve(())[key])
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._resolve(())[key] = value
+            self._changed()
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._resolve(())[key]
+            self._changed()
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._resolve(())))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._resolve(()))
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._resolve(())
+
+    def __repr__(self):
+        return "DynamicState(%r)" % self._path
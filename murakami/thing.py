@@ -1,7 +1,35 @@
 """
 This module contains the Thing wrapper, used for accessing tests via WebThings.
 """
-from webthing import Property, Thing, Value
+import uuid
+
+from tornado.ioloop import IOLoop
+from webthing import Action, Property, Thing, Value
+
+
+class RunAction(Action):
+    """
+    The WebThings action that queues an immediate test run. It completes when
+    the run it was merged into is done, and its description includes that
+    run's id so that the results can be fetched from the HTTP API.
+    """
+    def __init__(self, thing, input_):
+        super().__init__(uuid.uuid4().hex, thing, "run", input_=input_)
+        self.run = None
+
+    def start(self):
+        self.status = "pending"
+        self.thing.action_notify(self)
+        test = (self.input or {}).get("test")
+        self.run = self.thing.runs.request([test] if test else None)
+        loop = IOLoop.current()
+        self.run.add_done_callback(lambda run: loop.add_callback(self.finish))
+
+    def as_action_description(self):
+        description = super().as_action_description()
+        if self.run is not None:
+            description[self.name]["run"] = self.run.id
+        return description
 
 
 class MurakamiThing(Thing):
@@ -11,8 +39,10 @@ class MurakamiThing(Thing):
 
     ####Arguments
     * `runners`: a List of MurakamiRunner instances passed from MurakamiServer
+    * `runs`: the RunQueue used by the `run` action, which is only added if
+    given
     """
-    def __init__(self, runners):
+    def __init__(self, runners, runs=None):
         super().__init__(
             id_="https://github.com/throneless-tech/murakami",
             title="Murakami",
@@ -34,3 +64,23 @@ class MurakamiThing(Thing):
                         "description": runner.description,
                     },
                 ))
+
+        self.runs = runs
+        if runs is not None:
+            self.add_available_action(
+                "run",
+                {
+                    "title": "Run tests",
+                    "description": "Run one test, or all tests, now.",
+                    "input": {
+                        "type": "object",
+                        "properties": {
+                            "test": {
+                                "type": "string",
+                                "enum": runs.names(),
+                            },
+                        },
+                    },
+                },
+                RunAction,
+            )
@@ -0,0 +1,290 @@
+"""
+This module contains the on-demand test queue, which runs the test runners one
+batch at a time and merges repeated requests into the batch that is already
+queued or in progress.
+"""
+from collections import OrderedDict
+from datetime import datetime
+import json
+import logging
+import threading
+import time
+import uuid
+
+import murakami.defaults as defaults
+from murakami.lease import Backoff, LeaseUnavailable
+
+_logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+
+
+def _timestamp():
+    return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%f")
+
+
+class TestRun:
+    """
+    A batch of test runners to run once, which is the handle returned to
+    everyone who requested it.
+
+    ####Arguments
+    * `runners`: The names of the runners to run
+    """
+    def __init__(self, runners):
+        self.id = uuid.uuid4().hex
+        self.runners = list(runners)
+        self.status = QUEUED
+        self.requests = 1
+        self.requested = _timestamp()
+        self.started = None
+        self.finished = None
+        self.results = {}
+        self.errors = {}
+        self.deferrals = 0
+        self._done = threading.Event()
+        self._callbacks = []
+        self._callbacks_lock = threading.Lock()
+
+    def covers(self, runners):
+        """Returns whether this run includes all of the given runners."""
+        return set(runners) <= set(self.runners)
+
+    def add_done_callback(self, callback):
+        """
+        Calls `callback` with this run once it is done, which may be right
+        away. The callback is called from the thread running the tests.
+        """
+        with self._callbacks_lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def wait(self, timeout=None):
+        """Blocks until this run is done, returning False on timeout."""
+        return self._done.wait(timeout)
+
+    def _finish(self):
+        self.finished = _timestamp()
+        self.status = DONE
+        with self._callbacks_lock:
+            self._done.set()
+        for callback in self._callbacks:
+            try:
+                callback(self)
+            except Exception as exc:
+                _logger.error("Run %s callback failed: %s", self.id, exc)
+
+    def as_dict(self):
+        """Returns a JSON-serialisable description of this run."""
+        results = {}
+        for name, data in list(self.results.items()):
+            try:
+                results[name] = json.loads(data)
+            except (TypeError, ValueError):
+                results[name] = data
+        return {
+            "id": self.id,
+            "status": self.status,
+            "runners": self.runners,
+            "requests": self.requests,
+            "requested": self.requested,
+            "started": self.started,
+            "finished": self.finished,
+            "results": results,
+            "errors": dict(self.errors),
+            "deferrals": self.deferrals,
+        }
+
+
+class RunQueue:
+    """
+    Runs test runners on a single worker thread so that runs never overlap.
+    There is at most one run in progress and one queued: a request already
+    covered by either of them is merged into it, and any other request is
+    merged into the queued run, so repeated requests never stack up.
+
+    ####Arguments
+    * `runners`: A dict of MurakamiRunner instances by name, which is looked up
+    when each run starts
+    * `history`: The number of finished runs to keep for polling
+    * `lease`: A lease (see murakami.lease) to hold while running tests, so
+    that devices sharing an uplink take turns; while another device holds it,
+    the queued run is retried after a randomised, growing delay
+    * `backoff`: The Backoff giving those delays
+    * `precheck`: A connectivity Precheck (see murakami.connectivity) to pass
+    before each run; while it fails, the queued run is deferred after a
+    randomised, growing delay
+    * `precheck_backoff`: The Backoff giving those delays
+    * `offline_cb`: Called each time the run is deferred, with the run, the
+    failed check's result and the delay before the next attempt
+    * `busy_cb`: Called before each run starts
+    * `idle_cb`: Called after a run finishes if no other run is queued
+    """
+    def __init__(self, runners, history=defaults.RUNS_HISTORY, lease=None,
+                 backoff=None, precheck=None, precheck_backoff=None,
+                 offline_cb=None, busy_cb=None, idle_cb=None):
+        self._runners = runners
+        self._history = history
+        self._lease = lease
+        self._backoff = backoff or Backoff()
+        self._precheck = precheck
+        self._precheck_backoff = precheck_backoff or Backoff(
+            defaults.PRECHECK_BACKOFF, defaults.PRECHECK_MAX_BACKOFF)
+        self._offline_cb = offline_cb
+        self._busy_cb = busy_cb
+        self._idle_cb = idle_cb
+        self._runs = OrderedDict()
+        self._queued = None
+        self._running = None
+        self._lock = threading.Condition()
+        self._worker = None
+
+    def names(self):
+        """Returns the names of the runners that can be requested."""
+        return list(self._runners)
+
+    def request(self, names=None):
+        """
+        Requests a run of the named runners, or of all runners if `names` is
+        empty, and returns the TestRun handle it was merged into. Raises
+        KeyError for an unknown runner name.
+        """
+        names = list(names or self._runners)
+        for name in names:
+            if name not in self._runners:
+                raise KeyError(name)
+
+        with self._lock:
+            if self._running is not None and self._running.covers(names):
+                run = self._running
+                run.requests += 1
+            elif self._queued is not None:
+                run = self._queued
+                run.runners.extend(n for n in names if n not in run.runners)
+                run.requests += 1
+            else:
+                run = TestRun(names)
+                self._queued = run
+                self._remember(run)
+                self._lock.notify()
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._work,
+                                                name="murakami-runs",
+                                                daemon=True)
+                self._worker.start()
+        _logger.debug("Run %s requested for %s", run.id, ", ".join(names))
+        return run
+
+    def get(self, run_id):
+        """Returns the run with the given id, or None if it is unknown."""
+        with self._lock:
+            return self._runs.get(run_id)
+
+    def runs(self):
+        """Returns the known runs, newest first."""
+        with self._lock:
+            return list(self._runs.values())[::-1]
+
+    def _remember(self, run):
+        self._runs[run.id] = run
+        while len(self._runs) > self._history:
+            oldest = next(iter(self._runs.values()))
+            if oldest.status != DONE:
+                break
+            self._runs.popitem(last=False)
+
+    def _acquire_lease(self):
+        """
+        Waits until this device holds the lease. If the lease cannot be
+        reached at all, tests go ahead uncoordinated rather than not at all.
+        """
+        while True:
+            try:
+                if self._lease.acquire():
+                    self._backoff.reset()
+                    return True
+            except LeaseUnavailable as exc:
+                _logger.warning("Test lease unavailable, running tests "
+                                "without it: %s", exc)
+                return False
+            delay = self._backoff.next()
+            _logger.info("Test lease held by another device, retrying in "
+                         "%.0f seconds.", delay)
+            time.sleep(delay)
+
+    def _online(self):
+        """
+        Runs the connectivity pre-check. If it fails, the failed attempt is
+        recorded, the queued run stays queued, and the worker waits before
+        the next attempt.
+        """
+        result = self._precheck.check()
+        if result["ok"]:
+            self._precheck_backoff.reset()
+            return True
+
+        delay = self._precheck_backoff.next()
+        with self._lock:
+            run = self._queued
+            run.deferrals += 1
+        _logger.warning("Connectivity pre-check to %s failed at %s (%s), "
+                        "deferring tests by %.0f seconds.", result["target"],
+                        result["step"], result["error"], delay)
+        if self._offline_cb is not None:
+            try:
+                self._offline_cb(run, result, delay)
+            except Exception as exc:
+                _logger.error("Failed to record the outage: %s", exc)
+        time.sleep(delay)
+        return False
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while self._queued is None:
+                    self._lock.wait()
+
+            if self._precheck is not None and not self._online():
+                continue
+
+            # The run stays queued, so that requests are merged into it, until
+            # this device's turn comes.
+            if self._lease is not None and self._acquire_lease():
+                with self._lease.kept_alive():
+                    self._run()
+            else:
+                self._run()
+
+    def _run(self):
+        with self._lock:
+            run = self._running = self._queued
+            self._queued = None
+            run.status = RUNNING
+            run.started = _timestamp()
+        if self._busy_cb is not None:
+            self._busy_cb()
+
+        for name in list(run.runners):
+            runner = self._runners.get(name)
+            if runner is None:
+                run.errors[name] = "Runner is no longer loaded."
+                continue
+            _logger.info("Running test: %s", runner.title)
+            try:
+                run.results[name] = runner.start_test()
+            except Exception as exc:
+                message = getattr(exc, "message", None) or str(exc)
+                _logger.error("Failed to run test %s: %s", runner.title,
+                              message)
+                run.errors[name] = message
+
+        with self._lock:
+            self._running = None
+            idle = self._queued is None
+        run._finish()
+        if idle and self._idle_cb is not None:
+            self._idle_cb()
@@ -1,6 +1,13 @@
 """
 Common utility functions for Murakami.
 """
+from contextlib import contextmanager
+import io
+import os
+import subprocess
+import tempfile
+
+from murakami.priority import ClientPriority
 
 
 def is_enabled(toggle):
@@ -8,3 +15,91 @@ def is_enabled(toggle):
     Check for string values that are common regarded as "True"
     """
     return str(toggle).lower() in ["true", "yes", "1", "y"]
+
+
+@contextmanager
+def _nothing():
+    yield
+
+
+def run_client(args, check=False, priority=None):
+    """
+    Runs a test client like `subprocess.run(args, text=True,
+    capture_output=True)`, and returns the CompletedProcess with the client's
+    resource usage, as collected by wait4(), in its `rusage` attribute.
+
+    If a ClientPriority is given, it is applied to the client and the daemon
+    for the duration of the test, and kept in the `priority` attribute.
+
+    The output is captured to temporary files rather than pipes, so that the
+    child can be reaped by wait4() rather than by subprocess itself.
+    """
+    with tempfile.TemporaryFile() as stdout, \
+            tempfile.TemporaryFile() as stderr, \
+            (priority.lowered_daemon() if priority is not None
+             else _nothing()):
+        command = priority.command(args) if priority is not None else args
+        process = subprocess.Popen(command, stdout=stdout, stderr=stderr)
+        try:
+            _, status, rusage = os.wait4(process.pid, 0)
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        if os.WIFSIGNALED(status):
+            process.returncode = -os.WTERMSIG(status)
+        else:
+            process.returncode = os.WEXITSTATUS(status)
+
+        outputs = []
+        for f in (stdout, stderr):
+            f.seek(0)
+            outputs.append(io.TextIOWrapper(io.BytesIO(f.read())).read())
+
+    result = subprocess.CompletedProcess(args, process.returncode, *outputs)
+    result.rusage = rusage
+    result.priority = priority
+    if check:
+        result.check_returncode()
+    return result
+
+
+def load_average():
+    """Returns the 1, 5 and 15 minute load averages, or Nones if unknown."""
+    try:
+        return os.getloadavg()
+    except OSError:
+        return (None, None, None)
+
+
+def resource_fields(loadavg, output):
+    """
+    Returns the Murakami* result fields describing the load average at the
+    start of a test, the resources used by its client and the priority
+    settings it ran with.
+
+    ####Arguments
+    * `loadavg`: The load averages returned by load_average()
+    * `output`: The CompletedProcess returned by run_client(); its `rusage`
+    is a resource.struct_rusage (or an object with the same attributes) and
+    its `priority` a ClientPriority, either of which may be missing
+    """
+    rusage = getattr(output, 'rusage', None)
+    priority = getattr(output, 'priority', None)
+    fields = {
+        'MurakamiLoadAverage1': loadavg[0],
+        'MurakamiLoadAverage5': loadavg[1],
+        'MurakamiLoadAverage15': loadavg[2],
+    }
+    fields['MurakamiClientUserTime'] = getattr(rusage, 'ru_utime', None)
+    fields['MurakamiClientSystemTime'] = getattr(rusage, 'ru_stime', None)
+    fields['MurakamiClientMaxRSS'] = getattr(rusage, 'ru_maxrss', None)
+    fields['MurakamiClientVoluntaryContextSwitches'] = getattr(
+        rusage, 'ru_nvcsw', None)
+    fields['MurakamiClientInvoluntaryContextSwitches'] = getattr(
+        rusage, 'ru_nivcsw', None)
+    if priority is not None:
+        fields.update(priority.fields())
+    else:
+        fields.update(ClientPriority(None).fields())
+    return fields
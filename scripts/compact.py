@@ -0,0 +1,403 @@
+"""
+Murakami's local exporter writes each test result to its own small file, and
+years of them are slow to list and back up. This utility script merges the
+files into one compressed segment per test, device and day: a tar archive
+that murakami-convert reads directly, alongside a small index giving the
+offset of each original file in the uncompressed archive. The originals are
+removed only once the segment has been written, read back and checked.
+"""
+
+from collections import defaultdict
+import datetime
+import functools
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import tarfile
+import tempfile
+
+import configargparse
+
+from scripts.convert import (SEGMENT_INDEX_SUFFIX, ConvertException,
+                             _open_tar, discover)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COMPRESSION = "gzip"
+COMPRESSION_SUFFIXES = {
+    "gzip": ".tar.gz",
+    "zstd": ".tar.zst",
+}
+
+# The names of the runners' results, which may themselves contain "-".
+TEST_NAMES = (
+    "dash",
+    "latency",
+    "ndt5",
+    "ndt7",
+    "speedtest-cli-multi-stream",
+    "speedtest-cli-single-stream",
+)
+
+# The names MurakamiExporter._generate_filename() gives results:
+# <test>[-<location>-<network type>-<connection type>]-<timestamp>.jsonl
+FILENAME = re.compile(r"(?P<prefix>.+)-(?P<day>\d{4}-\d{2}-\d{2})"
+                      r"T\d{2}:\d{2}:\d{2}(\.\d+)?\.jsonl\Z")
+
+
+def parse_filename(name):
+    """
+    Split the name of a local exporter's result file into its test name,
+    device (the location, network type and connection type, if any) and day.
+    Returns None for names in any other form.
+    """
+    match = FILENAME.match(name)
+    if match is None:
+        return None
+    prefix = match.group("prefix")
+    test = next((t for t in TEST_NAMES if prefix.lower() == t
+                 or prefix.lower().startswith(t + "-")), None)
+    if test is None:
+        test = prefix.split("-", 1)[0].lower()
+    return test, prefix[len(test) + 1:], match.group("day")
+
+
+def group_files(paths, before=None):
+    """
+    Group result files by directory, test, device and day. Files from `before`
+    (an ISO date) onwards are left out, as more may still be written for
+    those days. Returns a dict of lists of paths, each sorted by name.
+    """
+    groups = defaultdict(list)
+    for path in paths:
+        fields = parse_filename(os.path.basename(path))
+        if fields is None:
+            logger.debug("%s: not a Murakami result file, skipping.", path)
+            continue
+        if before is not None and fields[2] >= before:
+            continue
+        groups[(os.path.dirname(path), ) + fields].append(path)
+    for group in groups.values():
+        group.sort()
+    return groups
+
+
+def segment_name(test, device, day):
+    return "-".join(p for p in (test, device, day) if p)
+
+
+def _count_records(data):
+    return sum(1 for line in data.splitlines() if line.strip())
+
+
+def _open_writer(path, compression):
+    """Open a tar archive for streaming to `path` with the compression."""
+    if compression == "zstd":
+        if zstandard is None:
+            raise ConvertException(
+                "Writing .zst segments requires zstandard, please install "
+                "murakami with the 'zstd' extra.")
+        fileobj = zstandard.ZstdCompressor().stream_writer(open(path, "wb"))
+        return fileobj, tarfile.open(fileobj=fileobj, mode="w|")
+    return None, tarfile.open(path, mode="w|gz")
+
+
+def _write_segment(path, members, compression):
+    """
+    Write the (name, mtime, data) members to a tar archive, returning the
+    index entry for each: its name, the offset and size of its data in the
+    uncompressed archive, and its record count.
+    """
+    index = []
+    fileobj, archive = _open_writer(path, compression)
+    try:
+        for name, mtime, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = mtime
+            info.mode = 0o644
+            archive.addfile(info, _BytesReader(data))
+            padded = -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            index.append({
+                "name": name,
+                "offset": archive.offset - padded,
+                "size": len(data),
+                "records": _count_records(data),
+            })
+    finally:
+        archive.close()
+        if fileobj is not None:
+            fileobj.close()
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+    return index
+
+
+class _BytesReader:
+    """The minimal file object tarfile.addfile() reads member data from."""
+    def __init__(self, data):
+        self._data = memoryview(data)
+        self._position = 0
+
+    def read(self, size=-1):
+        end = len(self._data) if size < 0 else self._position + size
+        chunk = self._data[self._position:end].tobytes()
+        self._position += len(chunk)
+        return chunk
+
+
+def _verify_segment(path, index, hashes):
+    """
+    Read a segment back and check that it holds exactly the indexed members,
+    with the same contents and record counts. Raises ConvertException if not.
+    """
+    found = 0
+    with _open_tar(path) as archive:
+        for member in archive:
+            if found == len(index):
+                raise ConvertException("{}: unexpected member {}.".format(
+                    path, member.name))
+            entry = index[found]
+            data = archive.extractfile(member).read()
+            if (member.name != entry["name"]
+                    or hashlib.sha256(data).digest() != hashes[found]
+                    or _count_records(data) != entry["records"]):
+                raise ConvertException(
+                    "{}: member {} does not match {}.".format(
+                        path, member.name, entry["name"]))
+            found += 1
+    if found != len(index):
+        raise ConvertException("{}: {} of {} members found.".format(
+            path, found, len(index)))
+
+
+def _link_segment(tmp, directory, name, suffix):
+    """
+    Links `tmp` to a segment path in `directory` not already taken and
+    returns the path. Unlike a rename, the link fails rather than replacing
+    a segment another worker has just written under the same name.
+    """
+    path = os.path.join(directory, name + suffix)
+    n = 1
+    while True:
+        try:
+            os.link(tmp, path)
+            return path
+        except FileExistsError:
+            path = os.path.join(directory, "%s.%d%s" % (name, n, suffix))
+            n += 1
+
+
+def compact_group(key, paths, output=None, compression=DEFAULT_COMPRESSION,
+                  keep=False):
+    """
+    Merge one group's files into a segment and index in `output`, or the
+    files' own directory, then remove the files unless `keep` is True.
+    Returns (segment path, files, records), or raises ConvertException with
+    the originals left in place if the segment cannot be written and
+    verified.
+    """
+    directory, test, device, day = key
+    directory = output or directory or "."
+    members, hashes = [], []
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+                mtime = os.fstat(f.fileno()).st_mtime
+        except OSError as ex:
+            raise ConvertException("{}: cannot read: {}".format(path, ex))
+        members.append((os.path.basename(path), mtime, data))
+        hashes.append(hashlib.sha256(data).digest())
+
+    name = segment_name(test, device, day)
+    suffix = COMPRESSION_SUFFIXES[compression]
+    segment = os.path.join(directory, name + suffix)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".compact-",
+                               suffix=suffix)
+    os.close(fd)
+    try:
+        index = _write_segment(tmp, members, compression)
+        _verify_segment(tmp, index, hashes)
+        records = sum(entry["records"] for entry in index)
+        segment = _link_segment(tmp, directory, name, suffix)
+        # The index goes in once the segment has its name. If it cannot be
+        # written, the segment is removed again, as the originals are kept.
+        try:
+            with open(segment + SEGMENT_INDEX_SUFFIX, "w") as f:
+                json.dump({
+                    "segment": os.path.basename(segment),
+                    "test": test,
+                    "device": device,
+                    "day": day,
+                    "files": len(index),
+                    "records": records,
+                    "members": index,
+                }, f)
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError:
+            os.unlink(segment)
+            raise
+    except (OSError, tarfile.TarError) as ex:
+        raise ConvertException("{}: cannot write segment: {}".format(
+            segment, ex))
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+    _fsync_directory(directory)
+
+    if not keep:
+        for path in paths:
+            os.unlink(path)
+    return segment, len(paths), records
+
+
+def _fsync_directory(directory):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _compact_one(options, item):
+    """
+    Compact a single group, returning a (key, result, error) tuple rather
+    than raising so that it can be used in a worker process.
+    """
+    key, paths = item
+    try:
+        return key, compact_group(key, paths, **options), None
+    except ConvertException as ex:
+        return key, None, str(ex)
+
+
+def compact(groups, jobs=1, **options):
+    """
+    Compact each group, in `jobs` worker processes if greater than one.
+    Yields a (key, result, error) tuple per group, in no particular order.
+    """
+    work = functools.partial(_compact_one, options)
+    if jobs > 1:
+        with multiprocessing.Pool(jobs) as pool:
+            yield from pool.imap_unordered(work, groups.items())
+    else:
+        yield from map(work, groups.items())
+
+
+def main():
+    """ The main function for the compaction script."""
+    parser = configargparse.ArgParser(
+        auto_env_var_prefix="murakami_compact_",
+        description="Merge Murakami's per-test result files into one "
+        "compressed segment per test, device and day.",
+        ignore_unknown_config_file_keys=False,
+    )
+    parser.add(
+        "-l",
+        "--loglevel",
+        dest="loglevel",
+        default="INFO",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        help="Set the logging level",
+    )
+    parser.add(
+        "-z",
+        "--compression",
+        dest="compression",
+        default=DEFAULT_COMPRESSION,
+        choices=COMPRESSION_SUFFIXES.keys(),
+        help="Compress segments with gzip (.tar.gz) or zstd (.tar.zst) "
+        "(default: gzip).",
+    )
+    parser.add(
+        "-o",
+        "--output",
+        dest="output",
+        help="Directory to write segments to (default: the directory of "
+        "the files they merge).",
+    )
+    parser.add(
+        "--before",
+        dest="before",
+        default=datetime.datetime.utcnow().strftime("%Y-%m-%d"),
+        help="Only compact files from days before this date, YYYY-MM-DD "
+        "(default: today, UTC).",
+    )
+    parser.add(
+        "--keep",
+        action="store_true",
+        dest="keep",
+        default=False,
+        help="Keep the original files after compacting them.",
+    )
+    parser.add(
+        "-r",
+        "--recurse",
+        action="store_true",
+        dest="recurse",
+        default=False,
+        help="If the input is a directory, recursively search it for files.",
+    )
+    parser.add(
+        "-j",
+        "--jobs",
+        type=int,
+        dest="jobs",
+        default=1,
+        help="Number of worker processes to compact groups with, or 0 to "
+        "use every CPU (default: 1).",
+    )
+    parser.add(
+        "input",
+        nargs="+",
+        help="The directories, files, or patterns of result files to "
+        "compact.",
+    )
+    settings = parser.parse_args()
+
+    logging.basicConfig(
+        level=settings.loglevel,
+        format="%(asctime)s %(filename)s:%(lineno)s %(levelname)s %(message)s",
+    )
+
+    if settings.compression == "zstd" and zstandard is None:
+        parser.error("zstd compression requires zstandard, please install "
+                     "murakami with the 'zstd' extra.")
+    if settings.output:
+        os.makedirs(settings.output, exist_ok=True)
+
+    jobs = settings.jobs if settings.jobs > 0 else os.cpu_count()
+    groups = group_files(discover(settings.input, settings.recurse),
+                         settings.before)
+    files = records = failed = 0
+    for key, result, error in compact(groups,
+                                      jobs=jobs,
+                                      output=settings.output,
+                                      compression=settings.compression,
+                                      keep=settings.keep):
+        if error is not None:
+            logger.error(error)
+            failed += 1
+            continue
+        segment, count, total = result
+        logger.info("%s: %d files, %d records.", segment, count, total)
+        files += count
+        records += total
+    logger.info("Compacted %d files with %d records into %d segments.",
+                files, records, len(groups) - failed)
+    if failed:
+        raise SystemExit("{} groups could not be compacted.".format(failed))
+
+
+if __name__ == "__main__":
+    main()
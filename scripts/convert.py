@@ -4,20 +4,74 @@ Results are saved as individual files in JSON new line format (.jsonl), and
 this is a utility script designed to convert them to other formats.
 """
 
-import difflib
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+from datetime import datetime
+import functools
 import glob
+import gzip
+import hashlib
+import io
+import itertools
 import logging
+import mmap
+import multiprocessing
 import os
+import queue
+import re
+import tarfile
+import tempfile
+import threading
 
 import configargparse
 import csv
-import jsonlines
 import json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 logger = logging.getLogger(__name__)
 
 DEFAULT_FORMAT = "csv"
 DEFAULT_TEST = "speedtest"
+DEFAULT_CHUNKSIZE = 64
+DEFAULT_SEPARATOR = "-"
+DEFAULT_ROW_GROUP_SIZE = 65536
+MMAP_THRESHOLD = 1 << 20
+DISCOVER_BATCH_SIZE = 256
+ARCHIVE_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz",
+                    ".tar.zst")
+# The suffix of the indexes murakami-compact writes next to its segments.
+SEGMENT_INDEX_SUFFIX = ".index.json"
+
+# The filename pattern fields, and the record keys they are stored under.
+PATTERN_FIELDS = {
+    "l": "location",
+    "n": "network_type",
+    "c": "connection_type",
+    "d": "datestamp",
+}
+
+# The filename prefix Murakami gives each test's results, where known.
+TEST_PREFIXES = {
+    "speedtest": "speedtest",
+    "dash_legacy": "dash",
+    "ndt5": "ndt5",
+    "ndt7": "ndt7",
+}
 
 
 class ConvertException(Exception):
@@ -49,125 +103,206 @@ def flatten_json(b, delim):
     return val
 
 
-def extract_pattern(string, template):
+def compile_pattern(template, separator=DEFAULT_SEPARATOR):
     """
-    A rudimentary function for extracting patterns from a string by comparing
-    differences between it and a template string.
+    Compile a filename template containing %l, %n, %c and %d fields into an
+    anchored regular expression with a named group per field. Location,
+    network and connection types may not contain the separator; the datestamp
+    may contain anything. A literal percent sign is written as %%.
     """
-    output = {}
-    entry = ""
-    value = ""
+    fields = "".join(PATTERN_FIELDS)
+    value = "[^%s]+" % re.escape(separator) if separator else ".+?"
+    regex = ""
+    seen = set()
+    for literal, field in re.findall(r"([^%]*)(%.?)?", template):
+        regex += re.escape(literal)
+        if not field:
+            continue
+        if field == "%%":
+            regex += re.escape("%")
+        elif len(field) == 2 and field[1] in fields:
+            name = field[1]
+            if name in seen:
+                regex += "(?P=%s)" % name
+            else:
+                seen.add(name)
+                regex += "(?P<%s>%s)" % (name, ".+" if name == "d" else value)
+        else:
+            raise ConvertException(
+                "Invalid field {} in pattern {}.".format(field, template))
+    return re.compile(regex + r"\Z")
 
-    for s in difflib.ndiff(string, template):
-        if s[0] == " ":
-            if entry != "" and value != "":
-                output[entry] = value
-                entry = ""
-                value = ""
-        elif s[0] == "-":
-            value += s[2]
-        elif s[0] == "+":
-            if s[2] != "%":
-                entry += s[2]
 
-    # check ending if non-empty
-    if entry != "" and value != "":
-        output[entry] = value
+def extract_pattern(string, pattern):
+    """
+    Extract the fields of a compiled filename pattern from a string. Returns a
+    dict keyed by field letter, or None if the string does not match.
+    """
+    match = pattern.match(string)
+    if match is None:
+        return None
+    return match.groupdict()
 
-    return output
 
+def loads(data):
+    """
+    Decode a JSON document from bytes, using orjson if it is installed and the
+    standard library otherwise.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _zstd_reader(fileobj):
+    if zstandard is None:
+        raise ConvertException(
+            "Reading .zst files requires zstandard, please install murakami "
+            "with the 'zstd' extra.")
+    return io.BufferedReader(
+        zstandard.ZstdDecompressor().stream_reader(fileobj))
+
+
+def _decompress(path, data, first_line=False):
+    """Decompress the contents of a .gz or .zst file read into memory."""
+    if path.endswith(".gz"):
+        reader = gzip.GzipFile(fileobj=io.BytesIO(data))
+    elif path.endswith(".zst"):
+        reader = _zstd_reader(io.BytesIO(data))
+    else:
+        return data.split(b"\n", 1)[0] if first_line else data
+    with reader:
+        return reader.readline() if first_line else reader.read()
 
-def import_speedtest(path):
+
+def _read_bytes(path, first_line=False):
+    """
+    Read a file's contents, or only its first line. Small files are read with
+    a single unbuffered call; larger ones are memory-mapped so that reading
+    the first line does not read the whole file. Files ending in .gz or .zst
+    are decompressed as they are read.
+    """
+    if path.endswith(".gz") or path.endswith(".zst"):
+        with open(path, "rb") as f:
+            reader = gzip.GzipFile(fileobj=f) if path.endswith(".gz") \
+                else _zstd_reader(f)
+            with reader:
+                return reader.readline() if first_line else reader.read()
+
+    with open(path, "rb", buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < MMAP_THRESHOLD:
+            data = f.read()
+            if first_line:
+                data = data.split(b"\n", 1)[0]
+            return data
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = mm.find(b"\n") if first_line else -1
+            return mm[:end] if end >= 0 else mm[:]
+
+
+def read_json(path, first_line=False, data=None):
+    """
+    Read the JSON document in a file, or only the one on its first line for
+    JSON lines files. If `data` is given, it holds the (possibly compressed)
+    contents of `path`, such as an archive member, and is decoded instead.
+    """
+    if data is None:
+        data = _read_bytes(path, first_line)
+    else:
+        data = _decompress(path, data, first_line)
+    try:
+        return loads(data)
+    except ValueError as ex:
+        raise ConvertException("{}: invalid JSON: {}".format(path, ex))
+
+
+def import_speedtest(path, data=None):
     """
     Import function for Speedtest.net tests.
     """
-    with jsonlines.open(path, mode="r") as reader:
-        line = reader.read()
-        return flatten_json(line, "_")
+    line = read_json(path, first_line=True, data=data)
+    return flatten_json(line, "_")
 
 
-def import_dash_legacy(path):
+def import_dash_legacy(path, data=None):
     """
     Import function for legacy-format DASH tests..
     """
     record = {}
-    with jsonlines.open(path, mode="r") as reader:
-        data = reader.read()
-        if "test_name" in data:
-            record["test_name"] = data["test_name"]
-            record["test_runtime"] = data["test_runtime"]
-            record["test_start_time"] = data["test_start_time"]
-            record["connect_latency"] = data["test_keys"]["simple"][
-                "connect_latency"]
-            record["median_bitrate"] = data["test_keys"]["simple"][
-                "median_bitrate"]
-            record["min_playout_delay"] = data["test_keys"]["simple"][
-                "min_playout_delay"]
-            record["probe_asn"] = data["probe_asn"]
-            record["probe_cc"] = data["probe_cc"]
-            return record
-
-
-def import_ndt_legacy(path):
+    data = read_json(path, first_line=True, data=data)
+    if "test_name" in data:
+        record["test_name"] = data["test_name"]
+        record["test_runtime"] = data["test_runtime"]
+        record["test_start_time"] = data["test_start_time"]
+        record["connect_latency"] = data["test_keys"]["simple"][
+            "connect_latency"]
+        record["median_bitrate"] = data["test_keys"]["simple"][
+            "median_bitrate"]
+        record["min_playout_delay"] = data["test_keys"]["simple"][
+            "min_playout_delay"]
+        record["probe_asn"] = data["probe_asn"]
+        record["probe_cc"] = data["probe_cc"]
+        return record
+
+
+def import_ndt_legacy(path, data=None):
     """
     Import function for legacy-format NDT tests..
     """
     record = {}
-    with jsonlines.open(path, mode="r") as reader:
-        data = reader.read()
-        if "probe_asn" in data:
-            record["server_address"] = data["test_keys"]["server_address"]
-            record["download"] = data["test_keys"]["simple"]["download"]
-            record["upload"] = data["test_keys"]["simple"]["upload"]
-            record["ping"] = data["test_keys"]["simple"]["ping"]
-            record["avg_rtt"] = data["test_keys"]["advanced"]["avg_rtt"]
-            record["max_rtt"] = data["test_keys"]["advanced"]["max_rtt"]
-            record["min_rtt"] = data["test_keys"]["advanced"]["min_rtt"]
-            record["congestion_limited"] = data["test_keys"]["advanced"][
-                "congestion_limited"]
-            record["packet_loss"] = data["test_keys"]["advanced"][
-                "packet_loss"]
-            record["sender_limited"] = data["test_keys"]["advanced"][
-                "sender_limited"]
-            record["receiver_limited"] = data["test_keys"]["advanced"][
-                "receiver_limited"]
-            record["probe_asn"] = data["probe_asn"]
-            record["probe_cc"] = data["probe_cc"]
-            return record
-
-def import_ndt5(path):
-    print("Converting {}...".format(path))
-    with open(path) as f:
-        data = json.load(f)
-
-        # Check this is an NDT5 test summary.
-        if data.get('TestName') != "ndt5":
-            raise ConvertException("{}: Invalid ndt5 output file."
-                .format(path))
+    data = read_json(path, first_line=True, data=data)
+    if "probe_asn" in data:
+        record["server_address"] = data["test_keys"]["server_address"]
+        record["download"] = data["test_keys"]["simple"]["download"]
+        record["upload"] = data["test_keys"]["simple"]["upload"]
+        record["ping"] = data["test_keys"]["simple"]["ping"]
+        record["avg_rtt"] = data["test_keys"]["advanced"]["avg_rtt"]
+        record["max_rtt"] = data["test_keys"]["advanced"]["max_rtt"]
+        record["min_rtt"] = data["test_keys"]["advanced"]["min_rtt"]
+        record["congestion_limited"] = data["test_keys"]["advanced"][
+            "congestion_limited"]
+        record["packet_loss"] = data["test_keys"]["advanced"][
+            "packet_loss"]
+        record["sender_limited"] = data["test_keys"]["advanced"][
+            "sender_limited"]
+        record["receiver_limited"] = data["test_keys"]["advanced"][
+            "receiver_limited"]
+        record["probe_asn"] = data["probe_asn"]
+        record["probe_cc"] = data["probe_cc"]
+        return record
 
-        # Check this test completed without errors.
-        if data.get('TestError') is not None:
-            raise ConvertException(
-                "{}: test did not complete successfully, skipping."
-                    .format(path))
-        return data
-
-def import_ndt7(path):
-    print("Converting {}...".format(path))
-    with open(path) as f:
-        data = json.load(f)
-
-        # Check this is an ndt7 test summary.
-        if data.get("TestName") != "ndt7":
-            raise ConvertException("{}: Invalid ndt7 output file."
+def import_ndt5(path, data=None):
+    logger.debug("Converting %s...", path)
+    data = read_json(path, data=data)
+
+    # Check this is an NDT5 test summary.
+    if data.get('TestName') != "ndt5":
+        raise ConvertException("{}: Invalid ndt5 output file."
+            .format(path))
+
+    # Check this test completed without errors.
+    if data.get('TestError') is not None:
+        raise ConvertException(
+            "{}: test did not complete successfully, skipping."
                 .format(path))
+    return data
 
-        # Check this test completed without errors.
-        if data.get('TestError') is not None:
-            raise ConvertException(
-                "{}: test did not complete successfully, skipping."
-                    .format(path))
-        return data
+def import_ndt7(path, data=None):
+    logger.debug("Converting %s...", path)
+    data = read_json(path, data=data)
+
+    # Check this is an ndt7 test summary.
+    if data.get("TestName") != "ndt7":
+        raise ConvertException("{}: Invalid ndt7 output file."
+            .format(path))
+
+    # Check this test completed without errors.
+    if data.get('TestError') is not None:
+        raise ConvertException(
+            "{}: test did not complete successfully, skipping."
+                .format(path))
+    return data
 
 tests = {
     "speedtest": import_speedtest,
@@ -178,17 +313,602 @@ tests = {
 }
 
 
-def export_csv(path, data):
+def _directory_id(path):
+    """Identify a directory by device and inode, to detect symlink loops."""
+    stat = os.stat(path)
+    return stat.st_dev, stat.st_ino
+
+
+def _scan(root, recurse, match):
+    """
+    Yield the files in a directory whose names pass `match`, using
+    os.scandir(), and those in its subdirectories if `recurse` is True. Each
+    directory is listed once, however many symlinks lead to it.
+    """
+    stack = [root]
+    visited = set()
+    while stack:
+        try:
+            path = stack.pop()
+            directory = _directory_id(path)
+            if directory in visited:
+                continue
+            visited.add(directory)
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        if recurse:
+                            stack.append(entry.path)
+                    elif match(entry.name):
+                        yield entry.path
+        except OSError as ex:
+            logger.warning("Cannot list directory: %s", ex)
+
+
+def _scan_parallel(root, match, walkers):
     """
-    Export function for CSV-format output files.
+    Yield the files in a directory tree whose names pass `match`, listing
+    subdirectories concurrently in `walkers` threads. Files are yielded in
+    no particular order as soon as their directory has been listed. Each
+    directory is listed once, however many symlinks lead to it.
     """
-    with open(path, "w", newline="") as file:
-        writer = csv.DictWriter(file, fieldnames=data[0].keys(), quotechar='"',
-            quoting=csv.QUOTE_NONNUMERIC)
+    results = queue.Queue(maxsize=walkers * 4)
+    stop = threading.Event()
+    lock = threading.Lock()
+    pending = [0]
+    visited = set()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def submit(path):
+        try:
+            directory = _directory_id(path)
+        except OSError as ex:
+            logger.warning("Cannot list directory: %s", ex)
+            return False
+        with lock:
+            if directory in visited:
+                return False
+            visited.add(directory)
+            pending[0] += 1
+        try:
+            pool.submit(scan, path)
+        except RuntimeError:
+            # The pool is shutting down because the consumer went away.
+            finished()
+        return True
+
+    def finished():
+        with lock:
+            pending[0] -= 1
+            done = pending[0] == 0
+        if done:
+            put(None)
+
+    def scan(path):
+        batch = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if stop.is_set():
+                        return
+                    if entry.is_dir():
+                        submit(entry.path)
+                    elif match(entry.name):
+                        batch.append(entry.path)
+                        if len(batch) >= DISCOVER_BATCH_SIZE:
+                            put(batch)
+                            batch = []
+            if batch:
+                put(batch)
+        except OSError as ex:
+            logger.warning("Cannot list directory: %s", ex)
+        finally:
+            finished()
+
+    with ThreadPoolExecutor(walkers) as pool:
+        if not submit(root):
+            return
+        try:
+            while True:
+                batch = results.get()
+                if batch is None:
+                    break
+                yield from batch
+        finally:
+            stop.set()
+
+
+def discover(inputs, recurse=False, prefix=None, walkers=1):
+    """
+    Yield the paths of the input files, lazily and only once. Each input may
+    be a file, a glob, or a directory, which is listed with os.scandir() and,
+    if `recurse` is True, walked with `walkers` threads. Only files whose
+    names start with `prefix`, if given, or that are tar archives, are
+    yielded; murakami-compact's segment indexes never are. Only paths
+    matched by more than one input need to be remembered, so a single input
+    is never held in memory.
+    """
+    def match(name):
+        if name.endswith(SEGMENT_INDEX_SUFFIX):
+            return False
+        return prefix is None or name.startswith(prefix) or is_archive(name)
+
+    seen = set() if len(inputs) > 1 else None
+    for i in inputs:
+        if os.path.isdir(i):
+            if recurse and walkers > 1:
+                paths = _scan_parallel(i, match, walkers)
+            else:
+                paths = _scan(i, recurse, match)
+        else:
+            paths = (p for p in glob.iglob(i, recursive=recurse)
+                     if match(os.path.basename(p)))
+        for path in paths:
+            if seen is not None:
+                if path in seen:
+                    continue
+                seen.add(path)
+            yield path
+
+
+class Manifest:
+    """
+    A persisted record of the input files that have already been converted,
+    used for incremental conversion. Each entry notes the path, size, mtime
+    and (optionally) SHA-256 hash of an input file, and the output partition
+    its records were written to. Entries whose partition does not exist, for
+    example because the run that wrote them was interrupted, are ignored.
+
+    ####Arguments
+    * `path`: The manifest file, in JSON lines format
+    * `use_hash`: Also compare file contents when size and mtime match
+    """
+    def __init__(self, path, use_hash=False):
+        self._path = path
+        self._use_hash = use_hash
+        self._entries = {}
+        self._pending = []
+        self._file = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self._path):
+            return
+        partitions = {}
+        with open(self._path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut short by an interrupted run.
+                    continue
+                partition = entry.get("partition")
+                if partition not in partitions:
+                    partitions[partition] = os.path.exists(partition)
+                if partitions[partition]:
+                    self._entries[entry["path"]] = (entry["size"],
+                                                    entry["mtime"],
+                                                    entry.get("hash"))
+
+    @staticmethod
+    def _hash(path):
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(functools.partial(f.read, 1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def filter(self, paths, errors=None):
+        """
+        Yield only those paths that are new or have changed since they were
+        last converted. Nothing is recorded until record() is called. A
+        (path, message) tuple is appended to the `errors` list, if given, for
+        each path that cannot be read.
+        """
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                known = self._entries.get(path)
+                digest = None
+                if known is not None and known[:2] == (stat.st_size,
+                                                       stat.st_mtime_ns):
+                    if not self._use_hash or known[2] is None:
+                        continue
+                    digest = self._hash(path)
+                    if digest == known[2]:
+                        continue
+                elif self._use_hash:
+                    digest = self._hash(path)
+            except OSError as ex:
+                message = "{}: cannot read: {}".format(path, ex)
+                logger.warning(message)
+                if errors is not None:
+                    errors.append((path, message))
+                continue
+            entry = {
+                "path": path,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime_ns,
+            }
+            if digest is not None:
+                entry["hash"] = digest
+            self._pending.append(entry)
+            yield path
+
+    def record(self, partition, errors=()):
+        """
+        Record the paths yielded by filter() as converted into `partition`,
+        except those that failed, as listed by their (path, message) tuples
+        in `errors`, so that they are tried again next time.
+        """
+        failed = set()
+        for path, _ in errors:
+            # Members of a tar archive fail as <archive>/<member name>, and
+            # it is the archive that is recorded.
+            while path not in failed and path != os.path.dirname(path):
+                failed.add(path)
+                path = os.path.dirname(path)
+        if self._file is None:
+            self._file = open(self._path, "a")
+        for entry in self._pending:
+            if entry["path"] not in failed:
+                entry["partition"] = partition
+                self._file.write(json.dumps(entry) + "\n")
+        self._pending = []
+
+    def close(self):
+        """Flush all recorded entries to disk."""
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+
+def partition_path(path):
+    """
+    Return a new, timestamped output partition path based on `path`, e.g.
+    out.csv becomes out-20200225T170240918022.csv.
+    """
+    root, ext = os.path.splitext(path)
+    return "%s-%s%s" % (root, datetime.utcnow().strftime("%Y%m%dT%H%M%S%f"),
+                        ext)
+
+
+def is_archive(path):
+    """Returns True if `path` names a tar archive of results."""
+    return path.endswith(ARCHIVE_SUFFIXES)
+
+
+@contextlib.contextmanager
+def _open_tar(path):
+    """Open a tar archive for streaming, decompressing it if needed."""
+    if path.endswith(".tar.zst"):
+        with open(path, "rb") as f, tarfile.open(fileobj=_zstd_reader(f),
+                                                 mode="r|") as archive:
+            yield archive
+    else:
+        with tarfile.open(path, mode="r|*") as archive:
+            yield archive
+
+
+def expand(paths, prefix=None, errors=None):
+    """
+    Yield a (path, data) tuple for each input. Plain and compressed files are
+    left to be read by the importer, with `data` set to None. Tar archives
+    are streamed and each regular member whose name starts with `prefix`, if
+    given, is read into `data`, with a path of <archive>/<member name>. A
+    (path, message) tuple is appended to the `errors` list, if given, for
+    each archive that cannot be read.
+    """
+    for path in paths:
+        if not is_archive(path):
+            yield path, None
+            continue
+        try:
+            with _open_tar(path) as archive:
+                for member in archive:
+                    name = os.path.basename(member.name)
+                    if not member.isfile() or (prefix is not None and
+                                               not name.startswith(prefix)):
+                        continue
+                    yield (os.path.join(path, member.name),
+                           archive.extractfile(member).read())
+        except (OSError, tarfile.TarError) as ex:
+            message = "{}: cannot read archive: {}".format(path, ex)
+            logger.warning(message)
+            if errors is not None:
+                errors.append((path, message))
+
+
+def _import_one(importer, item):
+    """
+    Run the importer on a single (path, data) input, returning a (path,
+    record, error) tuple rather than raising so that it can be used in a
+    worker process.
+    """
+    path, data = item
+    try:
+        return path, importer(path, data), None
+    except Exception as ex:
+        return path, None, str(ex)
+
+
+def _import_parallel(inputs, importer, jobs, ordered, chunksize):
+    """
+    Spread the importer across a pool of `jobs` processes. Inputs are handed
+    out in bounded windows so that only a few chunks per worker are in flight
+    at once.
+    """
+    work = functools.partial(_import_one, importer)
+    window = jobs * chunksize * 4
+    inputs = iter(inputs)
+    with multiprocessing.Pool(jobs) as pool:
+        imap = pool.imap if ordered else pool.imap_unordered
+        while True:
+            batch = list(itertools.islice(inputs, window))
+            if not batch:
+                break
+            yield from imap(work, batch, chunksize)
+
+
+def import_records(paths, importer, jobs=1, ordered=True, errors=None,
+                   chunksize=DEFAULT_CHUNKSIZE, prefix=None):
+    """
+    Yield a (path, record) tuple for each path, or member of a tar archive
+    path, that the importer can read, skipping any that fail. If `jobs` is greater than one, files are imported
+    by that many worker processes; records keep the input order unless
+    `ordered` is False. A (path, message) tuple is appended to the `errors`
+    list, if given, for each file that fails.
+    """
+    inputs = expand(paths, prefix, errors)
+    if jobs > 1:
+        results = _import_parallel(inputs, importer, jobs, ordered, chunksize)
+    else:
+        results = map(functools.partial(_import_one, importer), inputs)
+
+    for path, contents, error in results:
+        if error is not None:
+            logger.warning(error)
+            if errors is not None:
+                errors.append((path, error))
+            continue
+        if contents is not None:
+            yield path, contents
+
+
+def annotate(records, template, separator=DEFAULT_SEPARATOR):
+    """
+    Add the fields extracted from each record's filename by the template to
+    the (path, record) tuples yielded by import_records(). A .gz or .zst
+    suffix may be left out of the template. Records whose filename does not
+    match are passed through unchanged.
+    """
+    pattern = compile_pattern(template, separator)
+    for path, contents in records:
+        name = os.path.basename(path)
+        fields = extract_pattern(name, pattern)
+        if fields is None and name.endswith((".gz", ".zst")):
+            fields = extract_pattern(name.rsplit(".", 1)[0], pattern)
+        if fields is None:
+            logger.warning("%s: filename does not match pattern %s.", path,
+                           template)
+        else:
+            for field, value in fields.items():
+                contents[PATTERN_FIELDS[field]] = value
+        yield path, contents
+
+
+def _spill(data, spill):
+    """
+    Write each record to the spill file as a JSON line, returning the union
+    of their keys in the order they were first seen.
+    """
+    fieldnames = {}
+    for record in data:
+        fieldnames.update(dict.fromkeys(record))
+        spill.write(json.dumps(record, default=str) + "\n")
+    spill.seek(0)
+    return list(fieldnames)
+
+
+def export_csv(path, data, sample=0):
+    """
+    Export function for CSV-format output files. Records are read from the
+    `data` iterable, so it may be a generator. The header is the union of the
+    keys of every record, found by spilling the records to a temporary file
+    next to `path` before writing them. If `sample` is non-zero, the header is
+    taken from the first `sample` records instead and the rest are written as
+    they arrive, dropping any columns not seen in the sample.
+    """
+    data = iter(data)
+    with open(path, "w", newline="") as file, tempfile.TemporaryFile(
+            mode="w+", dir=os.path.dirname(os.path.abspath(path))) as spill:
+        if sample > 0:
+            head = list(itertools.islice(data, sample))
+            fieldnames = list(dict.fromkeys(k for r in head for k in r))
+            rows = itertools.chain(head, data)
+        else:
+            fieldnames = _spill(data, spill)
+            rows = (json.loads(line) for line in spill)
+        if not fieldnames:
+            return
+
+        writer = csv.DictWriter(file, fieldnames=fieldnames, quotechar='"',
+            quoting=csv.QUOTE_NONNUMERIC, extrasaction="ignore")
         writer.writeheader()
-        return writer.writerows(data)
+        known = set(fieldnames)
+        for record in rows:
+            if not known.issuperset(record):
+                for name in set(record) - known:
+                    logger.warning("%s: dropping column %s missing from the "
+                                   "sampled header.", path, name)
+                    known.add(name)
+            writer.writerow(record)
+
+
+def _value_kind(value, kind=None):
+    """
+    Return the kind of column that holds both `value` and the values of a
+    column of `kind`: "bool", "number" for any other numbers, or "string" for
+    everything else. None values leave the kind unchanged.
+    """
+    if value is None:
+        return kind
+    if isinstance(value, bool):
+        value_kind = "bool"
+    elif isinstance(value, (int, float)):
+        value_kind = "number"
+    else:
+        value_kind = "string"
+    return value_kind if kind in (None, value_kind) else "string"
+
+
+def _arrow_type(kind):
+    """
+    Return the Parquet column type for a kind of column: booleans, doubles
+    for numbers, and dictionary-encoded strings for everything else,
+    including columns that only ever hold None.
+    """
+    if kind == "bool":
+        return pyarrow.bool_()
+    if kind == "number":
+        return pyarrow.float64()
+    return pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+
+
+def _arrow_value(value, arrow_type):
+    """Coerce a value to the Python type expected by an Arrow column."""
+    if value is None:
+        return None
+    if pyarrow.types.is_boolean(arrow_type):
+        return value if isinstance(value, bool) else None
+    if pyarrow.types.is_floating(arrow_type):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+class _ParquetPartition:
+    """
+    Writes records to a single Parquet file, one row group per
+    `row_group_size` records. The records are spilled to a temporary file in
+    `spill_dir` as they arrive, so that the columns and their types can be
+    found from every record before the file is written on close().
+    """
+    def __init__(self, path, spill_dir,
+                 row_group_size=DEFAULT_ROW_GROUP_SIZE):
+        self._path = path
+        self._row_group_size = row_group_size
+        self._kinds = {}
+        self._spill = tempfile.TemporaryFile(mode="w+", dir=spill_dir)
+
+    def append(self, record):
+        for name, value in record.items():
+            self._kinds[name] = _value_kind(value, self._kinds.get(name))
+        self._spill.write(json.dumps(record, default=str) + "\n")
+
+    def _write(self, writer, schema, rows):
+        columns = []
+        for field in schema:
+            value_type = field.type
+            if pyarrow.types.is_dictionary(value_type):
+                value_type = value_type.value_type
+            column = pyarrow.array(
+                [_arrow_value(r.get(field.name), value_type) for r in rows],
+                type=value_type)
+            if pyarrow.types.is_dictionary(field.type):
+                column = column.dictionary_encode()
+            columns.append(column)
+        writer.write_table(pyarrow.Table.from_arrays(columns, schema=schema))
+
+    def close(self):
+        try:
+            if not self._kinds:
+                return
+            schema = pyarrow.schema([
+                (name, _arrow_type(kind))
+                for name, kind in self._kinds.items()
+            ])
+            os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+            self._spill.seek(0)
+            rows = (json.loads(line) for line in self._spill)
+            writer = pyarrow.parquet.ParquetWriter(self._path, schema)
+            try:
+                while True:
+                    group = list(itertools.islice(rows, self._row_group_size))
+                    if not group:
+                        break
+                    self._write(writer, schema, group)
+            finally:
+                writer.close()
+        finally:
+            self._spill.close()
+
 
-exporters = {"csv": export_csv}
+def _partition_key(record):
+    """
+    Return the (test, month) partition of a record, from its test name and
+    the first available timestamp field.
+    """
+    test = record.get("TestName") or record.get("test_name") or "unknown"
+    month = "unknown"
+    for field in ("TestStartTime", "test_start_time", "datestamp",
+                  "Timestamp"):
+        value = record.get(field)
+        if isinstance(value, str) and re.match(r"\d{4}-\d{2}", value):
+            month = value[:7]
+            break
+    return str(test), month
+
+
+def export_parquet(path, data, partition=False,
+                   row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """
+    Export function for Parquet-format output files. Numbers are stored as
+    doubles and strings are dictionary-encoded, with a row group written for
+    every `row_group_size` records. The columns and their types are found
+    from every record, which are spilled to temporary files next to `path`
+    first. If `partition` is True, `path` is a directory of
+    test=<name>/month=<YYYY-MM>/part-0.parquet files.
+    """
+    if pyarrow is None:
+        raise ConvertException(
+            "Parquet output requires pyarrow, please install murakami with "
+            "the 'parquet' extra.")
+
+    spill_dir = os.path.dirname(os.path.abspath(path))
+    partitions = {}
+    try:
+        for record in data:
+            key = _partition_key(record) if partition else None
+            writer = partitions.get(key)
+            if writer is None:
+                target = path
+                if partition:
+                    target = os.path.join(path, "test=%s" % key[0],
+                                          "month=%s" % key[1],
+                                          "part-0.parquet")
+                writer = partitions[key] = _ParquetPartition(
+                    target, spill_dir, row_group_size)
+            writer.append(record)
+    finally:
+        for writer in partitions.values():
+            writer.close()
+
+
+exporters = {"csv": export_csv, "parquet": export_parquet}
 
 
 def main():
@@ -214,6 +934,22 @@ def main():
         choices=exporters.keys(),
         help="Set the output format.",
     )
+    parser.add(
+        "--schema-sample",
+        type=int,
+        dest="schema_sample",
+        default=0,
+        help="For csv output, take the header from the first N records "
+        "instead of first collecting the columns of every record.",
+    )
+    parser.add(
+        "--partition",
+        action="store_true",
+        dest="partition",
+        default=False,
+        help="For parquet output, write a directory partitioned by test name "
+        "and month.",
+    )
     parser.add(
         "-t",
         "--test",
@@ -236,6 +972,14 @@ def main():
         help=
         "An input filename pattern containing one or more of %%l (location type), %%n (network type), %%c (connection type), and %%d (datestamp).",
     )
+    parser.add(
+        "-s",
+        "--separator",
+        dest="separator",
+        default=DEFAULT_SEPARATOR,
+        help="The character separating fields in the filename pattern; only "
+        "%%d may contain it (default: '-').",
+    )
     parser.add(
         "-r",
         "--recurse",
@@ -244,11 +988,67 @@ def main():
         default=False,
         help="If the input is a directory, recursively search it for files.",
     )
+    parser.add(
+        "--prefix",
+        dest="prefix",
+        help="Only convert input files whose names start with this prefix.",
+    )
+    parser.add(
+        "--match-test",
+        action="store_true",
+        dest="match_test",
+        default=False,
+        help="Only convert input files whose names start with the name "
+        "Murakami gives the selected test's results.",
+    )
+    parser.add(
+        "--walkers",
+        type=int,
+        dest="walkers",
+        default=1,
+        help="Number of threads to walk input directories with when "
+        "recursing; files are then found in no particular order (default: 1).",
+    )
+    parser.add(
+        "-j",
+        "--jobs",
+        type=int,
+        dest="jobs",
+        default=1,
+        help="Number of worker processes to import files with, or 0 to use "
+        "every CPU (default: 1).",
+    )
+    parser.add(
+        "--unordered",
+        action="store_true",
+        dest="unordered",
+        default=False,
+        help="Write records in the order workers finish them rather than the "
+        "input order.",
+    )
+    parser.add(
+        "-m",
+        "--manifest",
+        dest="manifest",
+        help="Convert incrementally: skip input files recorded in this "
+        "manifest, and write the rest to a new timestamped partition of the "
+        "output path.",
+    )
+    parser.add(
+        "--manifest-hash",
+        action="store_true",
+        dest="manifest_hash",
+        default=False,
+        help="Also compare the content hash of input files whose size and "
+        "mtime are unchanged.",
+    )
     parser.add(
         "input",
         nargs="+",
         help=
-        "The input filename, directory, or pattern containing test results.",
+        "The input filename, directory, or pattern containing test results. "
+        "Files may be compressed with gzip (.gz) or zstd (.zst), or bundled "
+        "in tar archives.",
     )
     settings = parser.parse_args()
 
@@ -257,32 +1057,75 @@ def main():
         format="%(asctime)s %(filename)s:%(lineno)s %(levelname)s %(message)s",
     )
 
-    pathlist = []
-    for i in settings.input:
-        pathlist.append(glob.glob(i, recursive=settings.recurse))
+    if settings.partition and settings.format != "parquet":
+        parser.error("--partition is only supported for parquet output.")
+    if settings.pattern:
+        try:
+            compile_pattern(settings.pattern, settings.separator)
+        except ConvertException as ex:
+            parser.error(str(ex))
 
-    pathlist = list(set().union(*pathlist))
+    jobs = settings.jobs if settings.jobs > 0 else os.cpu_count()
+    errors = []
+    importer = tests.get(settings.test, DEFAULT_TEST)
+    prefix = settings.prefix
+    if prefix is None and settings.match_test:
+        prefix = TEST_PREFIXES.get(settings.test)
+    paths = discover(settings.input, settings.recurse, prefix,
+                     settings.walkers)
 
-    records = []
-    for path in pathlist:
-        importer = tests.get(settings.test, DEFAULT_TEST)
-        try:
-            contents = importer(path)
-        except Exception as ex:
-            print(ex)
-            continue
+    output = settings.output
+    manifest = None
+    if settings.manifest:
+        manifest = Manifest(settings.manifest, settings.manifest_hash)
+        output = partition_path(settings.output)
+        paths = manifest.filter(paths, errors)
+        first = next(paths, None)
+        if first is None:
+            manifest.close()
+            logger.info("No new or changed input files to convert.")
+            return
+        paths = itertools.chain([first], paths)
 
-        if settings.pattern:
-            pattern = extract_pattern(os.path.basename(path), settings.pattern)
-            if "l" in pattern:
-                contents["location"] = pattern["l"]
-            if "n" in pattern:
-                contents["network_type"] = pattern["n"]
-            if "c" in pattern:
-                contents["connection_type"] = pattern["c"]
-            if "d" in pattern:
-                contents["datestamp"] = pattern["d"]
-        records.append(contents)
+    records = import_records(paths,
+                             importer,
+                             jobs=jobs,
+                             ordered=not settings.unordered,
+                             errors=errors,
+                             prefix=prefix)
+    if settings.pattern:
+        records = annotate(records, settings.pattern, settings.separator)
 
     exporter = exporters.get(settings.format, DEFAULT_FORMAT)
-    exporter(settings.output, records)
+    if settings.partition:
+        exporter = functools.partial(exporter, partition=True)
+    if settings.schema_sample and settings.format == "csv":
+        exporter = functools.partial(exporter, sample=settings.schema_sample)
+    if manifest is None:
+        exporter(output, (contents for _, contents in records))
+    else:
+        # The partition only appears once it is complete and the manifest
+        # entries pointing at it are on disk.
+        written = [0]
+
+        def counted(records):
+            for _, contents in records:
+                written[0] += 1
+                yield contents
+
+        exporter(output + ".tmp", counted(records))
+        if written[0] and os.path.exists(output + ".tmp"):
+            manifest.record(output, errors)
+            manifest.close()
+            os.replace(output + ".tmp", output)
+            logger.info("Wrote new partition %s.", output)
+        else:
+            # Leave the inputs unrecorded, to be tried again next time.
+            manifest.close()
+            if os.path.exists(output + ".tmp"):
+                os.unlink(output + ".tmp")
+            logger.warning("No records were converted, so no partition was "
+                           "written.")
+
+    if errors:
+        logger.warning("%d input files could not be converted.", len(errors))
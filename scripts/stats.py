@@ -0,0 +1,394 @@
+"""
+Murakami test results converted with murakami-convert can be summarised with
+this utility script, which computes counts, means and quantiles of the
+throughput and latency fields for each location, day, or other grouping.
+"""
+
+import csv
+import logging
+import os
+import sys
+
+import configargparse
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.csv
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from scripts.convert import ConvertException
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METRICS = "DownloadValue,UploadValue,MinRTTValue"
+DEFAULT_GROUP_BY = "location,day"
+DEFAULT_QUANTILES = "0.1,0.5,0.9"
+
+# Multipliers normalising throughput to Mbit/s and times to milliseconds.
+UNITS = {
+    "bit/s": 1e-6,
+    "kbit/s": 1e-3,
+    "mbit/s": 1.0,
+    "gbit/s": 1e3,
+    "s": 1e3,
+    "ms": 1.0,
+    "us": 1e-3,
+}
+
+# Group keys derived from other columns: the columns to take them from, in
+# order of preference, and how many leading characters to keep.
+DERIVED_KEYS = {
+    "location": (("location", "MurakamiLocation"), None),
+    "network_type": (("network_type", "MurakamiNetworkType"), None),
+    "connection_type": (("connection_type", "MurakamiConnectionType"), None),
+    "test": (("TestName", "test_name"), None),
+    "day": (("TestStartTime", "test_start_time", "datestamp", "Timestamp"),
+            10),
+    "month": (("TestStartTime", "test_start_time", "datestamp", "Timestamp"),
+              7),
+}
+
+
+def unit_column(metric):
+    """Return the name of the column holding a metric's unit."""
+    if metric.endswith("Value"):
+        return metric[:-len("Value")] + "Unit"
+    return metric + "Unit"
+
+
+def _key_sources(key):
+    return DERIVED_KEYS.get(key, ((key, ), None))
+
+
+def _read_table(path, metrics, strings):
+    """Read the wanted columns of a Parquet or CSV file with pyarrow."""
+    if path.endswith(".parquet") or os.path.isdir(path):
+        dataset = pyarrow.parquet.ParquetDataset(path)
+        names = set(dataset.schema.names)
+        return dataset.read(
+            columns=[c for c in metrics + strings if c in names])
+    return pyarrow.csv.read_csv(
+        path,
+        convert_options=pyarrow.csv.ConvertOptions(
+            include_columns=metrics + strings,
+            include_missing_columns=True,
+            column_types=dict(
+                [(m, pyarrow.float64()) for m in metrics] +
+                [(s, pyarrow.dictionary(pyarrow.int32(), pyarrow.string()))
+                 for s in strings]),
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=True,
+        ))
+
+
+def _encode_chunk(chunk):
+    """Return the codes and labels of a dictionary-encoded Arrow array."""
+    if not pyarrow.types.is_dictionary(chunk.type):
+        chunk = pyarrow.compute.cast(chunk, pyarrow.string()).dictionary_encode()
+    labels = [None if v is None else str(v)
+              for v in chunk.dictionary.to_pylist()] + [None]
+    codes = chunk.indices.fill_null(len(labels) - 1)
+    return codes.to_numpy(zero_copy_only=False).astype(numpy.int64), labels
+
+
+def merge_codes(encoded):
+    """
+    Merge several (codes, labels) pairs into one, so that equal labels share
+    a code.
+    """
+    lookup = {}
+    merged = []
+    for codes, labels in encoded:
+        mapping = numpy.array([lookup.setdefault(l, len(lookup))
+                               for l in labels], dtype=numpy.int64)
+        merged.append(mapping[codes])
+    if not merged:
+        return numpy.zeros(0, dtype=numpy.int64), [None]
+    return numpy.concatenate(merged), list(lookup)
+
+
+def _load_arrow(paths, metrics, strings):
+    tables = [_read_table(p, metrics, strings) for p in paths]
+    columns = {}
+    for name in metrics:
+        columns[name] = numpy.concatenate([
+            pyarrow.compute.cast(t.column(name), pyarrow.float64()).to_numpy()
+            if name in t.column_names else numpy.full(t.num_rows, numpy.nan)
+            for t in tables
+        ] or [numpy.zeros(0)])
+    for name in strings:
+        encoded = []
+        for t in tables:
+            if name not in t.column_names:
+                encoded.append((numpy.zeros(t.num_rows, dtype=numpy.int64),
+                                [None]))
+                continue
+            encoded.extend(_encode_chunk(c) for c in t.column(name).chunks)
+        columns[name] = merge_codes(encoded)
+    return columns
+
+
+def encode(values):
+    """
+    Dictionary-encode a sequence of strings, returning an int64 array of
+    codes and the list of distinct values they index.
+    """
+    lookup = {}
+    codes = numpy.fromiter((lookup.setdefault(v, len(lookup)) for v in values),
+                           dtype=numpy.int64,
+                           count=len(values))
+    return codes, list(lookup)
+
+
+def _load_csv(paths, metrics, strings):
+    columns = {name: [] for name in metrics + strings}
+    for path in paths:
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                for name in metrics:
+                    try:
+                        columns[name].append(float(row.get(name)))
+                    except (TypeError, ValueError):
+                        columns[name].append(float("nan"))
+                for name in strings:
+                    columns[name].append(row.get(name) or None)
+    for name in metrics:
+        columns[name] = numpy.array(columns[name], dtype=numpy.float64)
+    for name in strings:
+        columns[name] = encode(columns[name])
+    return columns
+
+
+def load(paths, metrics, strings):
+    """
+    Load the metric columns of converter output files as float64 arrays, with
+    NaN for missing values, and the string columns as (codes, labels) pairs.
+    Parquet input requires pyarrow, which is also used for CSV if installed.
+    """
+    if pyarrow is not None:
+        return _load_arrow(paths, metrics, strings)
+    if any(p.endswith(".parquet") or os.path.isdir(p) for p in paths):
+        raise ConvertException("Reading Parquet files requires pyarrow.")
+    return _load_csv(paths, metrics, strings)
+
+
+def _relabel(column, relabel):
+    """Apply a function to the labels of an encoded column and re-encode."""
+    codes, labels = column
+    lookup = {}
+    mapping = numpy.array([lookup.setdefault(relabel(l), len(lookup))
+                           for l in labels], dtype=numpy.int64)
+    return mapping[codes], list(lookup)
+
+
+def _coalesce(columns, sources):
+    """Take the first non-missing value of the encoded source columns."""
+    codes, labels = columns[sources[0]]
+    for source in sources[1:]:
+        missing = numpy.array([l is None for l in labels], dtype=bool)[codes]
+        if not missing.any():
+            break
+        lookup = dict((l, i) for i, l in enumerate(labels))
+        other_codes, other_labels = columns[source]
+        mapping = numpy.array([
+            lookup.setdefault(l, len(lookup)) for l in other_labels
+        ], dtype=numpy.int64)
+        labels = list(lookup)
+        codes = numpy.where(missing, mapping[other_codes], codes)
+    return codes, labels
+
+
+def group_codes(columns, group_by, length):
+    """
+    Combine the group-by keys into a single code per row. Returns the codes
+    and a list with the tuple of key values for each code.
+    """
+    combined = numpy.zeros(length, dtype=numpy.int64)
+    key_labels = []
+    for key in group_by:
+        sources, prefix = _key_sources(key)
+        column = _coalesce(columns, sources)
+        if prefix is not None:
+            column = _relabel(column,
+                              lambda l: l[:prefix] if l is not None else None)
+        codes, labels = column
+        combined = combined * len(labels) + codes
+        key_labels.append(labels)
+    unique, inverse = numpy.unique(combined, return_inverse=True)
+
+    groups = []
+    for code in unique.tolist():
+        label = []
+        for labels in reversed(key_labels):
+            code, index = divmod(code, len(labels))
+            label.append(labels[index])
+        groups.append(tuple(reversed(label)))
+    return inverse.reshape(-1), groups
+
+
+def normalise(values, units):
+    """
+    Scale a metric to Mbit/s or milliseconds according to its encoded unit
+    column. Rows with an unknown or missing unit are left as they are.
+    """
+    codes, labels = units
+    factors = numpy.ones(len(labels))
+    for i, label in enumerate(labels):
+        if label is None:
+            continue
+        factor = UNITS.get(label.lower())
+        if factor is None:
+            logger.warning("Unknown unit %s, leaving values unscaled.", label)
+        else:
+            factors[i] = factor
+    return values * factors[codes]
+
+
+def grouped_stats(codes, values, groups, quantiles):
+    """
+    Compute the count, mean and quantiles of `values` for each of `groups`
+    group codes in a few vectorized passes, ignoring NaN values. Quantiles
+    are linearly interpolated, as numpy.quantile does.
+    """
+    present = ~numpy.isnan(values)
+    codes = codes[present]
+    values = values[present]
+
+    counts = numpy.bincount(codes, minlength=groups)
+    sums = numpy.bincount(codes, weights=values, minlength=groups)
+
+    # Sort by group, then value, with a single int64 sort of the group code
+    # combined with each value's rank; this is much faster than lexsort().
+    by_value = numpy.argsort(values)
+    rank = numpy.empty(len(values), dtype=numpy.int64)
+    rank[by_value] = numpy.arange(len(values))
+    keys = numpy.sort(codes * len(values) + rank)
+    ordered = values[by_value][keys % max(len(values), 1)]
+    starts = numpy.cumsum(counts) - counts
+    has_values = counts > 0
+
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        result = {"count": counts, "mean": sums / counts}
+    for q in quantiles:
+        position = starts + q * numpy.maximum(counts - 1, 0)
+        low = numpy.floor(position).astype(numpy.int64)
+        high = numpy.ceil(position).astype(numpy.int64)
+        fraction = position - low
+        quantile = numpy.full(groups, numpy.nan)
+        quantile[has_values] = (
+            ordered[low[has_values]] * (1 - fraction[has_values]) +
+            ordered[high[has_values]] * fraction[has_values])
+        result["p%g" % (q * 100)] = quantile
+    return result
+
+
+def summarise(paths, metrics, group_by, quantiles):
+    """
+    Yield a dict of group keys, metric name and statistics for every group
+    and metric in the given converter output files, ordered by group.
+    """
+    units = [unit_column(m) for m in metrics]
+    keys = list(dict.fromkeys(s for k in group_by for s in _key_sources(k)[0]))
+    columns = load(paths, metrics, list(dict.fromkeys(units + keys)))
+    codes, labels = group_codes(columns, group_by, len(columns[metrics[0]]))
+    order = sorted(range(len(labels)),
+                   key=lambda i: [(l is None, l or "") for l in labels[i]])
+
+    for metric, unit in zip(metrics, units):
+        values = normalise(columns[metric], columns[unit])
+        stats = grouped_stats(codes, values, len(labels), quantiles)
+        for i in order:
+            if not stats["count"][i]:
+                continue
+            row = dict(zip(group_by, labels[i]))
+            row["metric"] = metric
+            row.update((name, stat[i].item()) for name, stat in stats.items())
+            yield row
+
+
+def main():
+    """ The main function for the statistics script."""
+    if numpy is None:
+        sys.exit("murakami-stats requires numpy, please install murakami "
+                 "with the 'stats' extra.")
+
+    parser = configargparse.ArgParser(
+        auto_env_var_prefix="murakami_stats_",
+        description="Summary statistics for murakami-convert output files.",
+        ignore_unknown_config_file_keys=False,
+    )
+    parser.add(
+        "-l",
+        "--loglevel",
+        dest="loglevel",
+        default="INFO",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        help="Set the logging level",
+    )
+    parser.add(
+        "-m",
+        "--metrics",
+        dest="metrics",
+        default=DEFAULT_METRICS,
+        help="Comma-separated numeric columns to summarise (default: " +
+        DEFAULT_METRICS + ").",
+    )
+    parser.add(
+        "-g",
+        "--group-by",
+        dest="group_by",
+        default=DEFAULT_GROUP_BY,
+        help="Comma-separated columns to group by, or one of " +
+        ", ".join(DERIVED_KEYS) + " (default: " + DEFAULT_GROUP_BY + ").",
+    )
+    parser.add(
+        "-q",
+        "--quantiles",
+        dest="quantiles",
+        default=DEFAULT_QUANTILES,
+        help="Comma-separated quantiles to compute (default: " +
+        DEFAULT_QUANTILES + ").",
+    )
+    parser.add(
+        "-o",
+        "--output",
+        dest="output",
+        help="Path to output CSV file (default: stdout).",
+    )
+    parser.add(
+        "input",
+        nargs="+",
+        help="CSV or Parquet files written by murakami-convert.",
+    )
+    settings = parser.parse_args()
+
+    logging.basicConfig(
+        level=settings.loglevel,
+        format="%(asctime)s %(filename)s:%(lineno)s %(levelname)s %(message)s",
+    )
+
+    metrics = [m for m in settings.metrics.split(",") if m]
+    group_by = [g for g in settings.group_by.split(",") if g]
+    quantiles = [float(q) for q in settings.quantiles.split(",") if q]
+
+    output = open(settings.output, "w", newline="") if settings.output \
+        else sys.stdout
+    try:
+        writer = csv.DictWriter(
+            output,
+            fieldnames=group_by + ["metric", "count", "mean"] +
+            ["p%g" % (q * 100) for q in quantiles])
+        writer.writeheader()
+        for row in summarise(settings.input, metrics, group_by, quantiles):
+            writer.writerow(row)
+    finally:
+        if output is not sys.stdout:
+            output.close()
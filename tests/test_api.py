@@ -0,0 +1,62 @@
+import json
+
+import tornado.web
+from tornado.testing import AsyncHTTPTestCase
+
+from murakami.api import ResultBuffer, routes
+
+
+class TestResults(AsyncHTTPTestCase):
+    def get_app(self):
+        self.results = ResultBuffer(size=3)
+        for i in range(5):
+            self.results.add("ndt7", json.dumps({"Run": i}),
+                             "2020-01-0%dT00:00:00" % (i + 1))
+        self.results.add("ndt5", json.dumps({"Run": 0}), "2020-01-03T12:00:00")
+        return tornado.web.Application(routes(self.results))
+
+    def get_json(self, url):
+        response = self.fetch(url)
+        assert response.code == 200
+        return json.loads(response.body)
+
+    def test_ring_buffer_and_filters(self):
+        page = self.get_json("/results?test=ndt7")
+        assert page["total"] == 3
+        assert [r["result"]["Run"] for r in page["results"]] == [4, 3, 2]
+
+        page = self.get_json("/results?since=2020-01-03&until=2020-01-05")
+        assert [(r["test"], r["result"]["Run"]) for r in page["results"]] == [
+            ("ndt7", 3), ("ndt5", 0), ("ndt7", 2)]
+
+    def test_pagination(self):
+        page = self.get_json("/results?limit=2")
+        assert page["total"] == 4
+        assert len(page["results"]) == 2
+        assert page["next_offset"] == 2
+        page = self.get_json("/results?limit=2&offset=2")
+        assert len(page["results"]) == 2
+        assert "next_offset" not in page
+        assert self.fetch("/results?limit=x").code == 400
+
+    def test_etag(self):
+        response = self.fetch("/results")
+        etag = response.headers["Etag"]
+        response = self.fetch("/results", headers={"If-None-Match": etag})
+        assert response.code == 304
+
+        self.results.add("ndt7", json.dumps({"Run": 5}), "2020-01-06")
+        response = self.fetch("/results", headers={"If-None-Match": etag})
+        assert response.code == 200
+        assert response.headers["Etag"] != etag
+
+    def test_etag_changes_on_restart(self):
+        etag = self.fetch("/results").headers["Etag"]
+        # A restarted daemon's buffer, holding other results at the same
+        # version.
+        restarted = ResultBuffer(size=3)
+        for i in range(self.results.version):
+            restarted.add("ndt5", json.dumps({"Run": i}), "2020-02-01")
+        self.results.__dict__.update(restarted.__dict__)
+        response = self.fetch("/results", headers={"If-None-Match": etag})
+        assert response.code == 200
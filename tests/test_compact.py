@@ -0,0 +1,121 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("configargparse")
+
+from scripts import compact, convert  # noqa: E402
+
+
+def write_result(directory, name, download=100.0):
+    path = directory / name
+    path.write_text(json.dumps({
+        "TestName": "ndt7",
+        "DownloadValue": download,
+        "DownloadUnit": "Mbit/s",
+    }))
+    return str(path)
+
+
+def test_parse_filename():
+    assert compact.parse_filename(
+        "ndt7-home-wired-ethernet-2020-02-25T17:02:40.918022.jsonl") == (
+            "ndt7", "home-wired-ethernet", "2020-02-25")
+    assert compact.parse_filename(
+        "speedtest-cli-multi-stream-home-wired-ethernet-"
+        "2020-02-25T17:02:40.918022.jsonl") == (
+            "speedtest-cli-multi-stream", "home-wired-ethernet", "2020-02-25")
+    assert compact.parse_filename(
+        "Speedtest-cli-single-stream-2020-02-25T17:02:40.918022.jsonl") == (
+            "speedtest-cli-single-stream", "", "2020-02-25")
+    assert compact.parse_filename("notes.txt") is None
+
+
+def test_compact_groups(tmp_path):
+    paths = [
+        write_result(tmp_path, "ndt7-home-wired-ethernet-2020-02-25T0%d:00:00"
+                     ".000000.jsonl" % i, float(i)) for i in range(3)
+    ]
+    other_day = write_result(
+        tmp_path, "ndt7-home-wired-ethernet-2020-02-26T00:00:00.000000.jsonl")
+    today = write_result(
+        tmp_path, "ndt7-home-wired-ethernet-2020-03-01T00:00:00.000000.jsonl")
+
+    groups = compact.group_files(convert.discover([str(tmp_path)]),
+                                 before="2020-03-01")
+    assert len(groups) == 2
+    results = {key[3]: (result, error)
+               for key, result, error in compact.compact(groups, jobs=2)}
+    segment, files, records = results["2020-02-25"][0]
+    assert (files, records) == (3, 3)
+    assert os.path.basename(segment) == \
+        "ndt7-home-wired-ethernet-2020-02-25.tar.gz"
+    assert not any(os.path.exists(p) for p in paths + [other_day])
+    assert os.path.exists(today)
+
+    with open(segment + convert.SEGMENT_INDEX_SUFFIX) as f:
+        index = json.load(f)
+    assert index["records"] == 3
+    assert [m["name"] for m in index["members"]] == [
+        os.path.basename(p) for p in paths
+    ]
+
+    # The segments convert like the files they replace, and their indexes
+    # are not mistaken for results.
+    records = list(
+        convert.import_records(convert.discover([str(tmp_path)]),
+                               convert.import_ndt7))
+    assert sorted(r["DownloadValue"] for _, r in records) == [
+        0.0, 1.0, 2.0, 100.0, 100.0
+    ]
+
+
+def test_compact_keeps_originals_on_failure(tmp_path, monkeypatch):
+    paths = [
+        write_result(tmp_path, "ndt7-2020-02-25T0%d:00:00.000000.jsonl" % i)
+        for i in range(2)
+    ]
+
+    def truncate(path, index, hashes):
+        raise convert.ConvertException("%s: 1 of 2 members found." % path)
+
+    monkeypatch.setattr(compact, "_verify_segment", truncate)
+    groups = compact.group_files(paths)
+    [(key, result, error)] = compact.compact(groups)
+    assert result is None and "members found" in error
+    assert all(os.path.exists(p) for p in paths)
+    assert sorted(os.listdir(str(tmp_path))) == sorted(
+        os.path.basename(p) for p in paths)
+
+
+def test_compact_parallel_same_names(tmp_path):
+    # Results with no device fields share segment names across directories,
+    # and each group must get its own segment in a shared output directory.
+    paths = []
+    for directory in ("a", "b", "c"):
+        (tmp_path / directory).mkdir()
+        paths += [
+            write_result(tmp_path / directory,
+                         "ndt7-2020-02-25T00:00:%02d.000000.jsonl" % i)
+            for i in range(20)
+        ]
+    output = tmp_path / "out"
+    output.mkdir()
+    groups = compact.group_files(paths)
+    assert len(groups) == 3
+
+    results = [result for _, result, error in compact.compact(
+        groups, jobs=3, output=str(output)) if error is None]
+    assert len(results) == 3
+    assert len({segment for segment, _, _ in results}) == 3
+    assert sorted(os.listdir(str(output))) == sorted(
+        name for segment, _, _ in results
+        for name in (os.path.basename(segment),
+                     os.path.basename(segment) + convert.SEGMENT_INDEX_SUFFIX))
+    assert not any(os.path.exists(p) for p in paths)
+
+    records = list(
+        convert.import_records(convert.discover([str(output)]),
+                               convert.import_ndt7))
+    assert len(records) == 60
@@ -0,0 +1,29 @@
+import socket
+
+from murakami.connectivity import Precheck, parse_target
+
+
+def test_parse_target():
+    assert parse_target("example.com") == ("example.com", 443)
+    assert parse_target("example.com:53") == ("example.com", 53)
+    assert parse_target("[::1]:80") == ("::1", 80)
+    assert parse_target("::1") == ("::1", 443)
+
+
+def test_precheck():
+    with socket.socket() as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+        target = "127.0.0.1:%d" % server.getsockname()[1]
+        result = Precheck(target).check()
+        assert result["ok"]
+        assert result["connect_time"] < 0.8
+
+    # Nothing listens on the port any more.
+    result = Precheck(target).check()
+    assert not result["ok"]
+    assert result["step"] == "connect"
+
+    result = Precheck("murakami.invalid", timeout=0.5).check()
+    assert not result["ok"]
+    assert result["step"] == "dns"
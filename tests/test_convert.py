@@ -0,0 +1,273 @@
+import csv
+import json
+import os
+
+import pytest
+
+pytest.importorskip("configargparse")
+
+from scripts import convert  # noqa: E402
+
+
+def write_ndt7(path, download=100.0):
+    path.write_text(json.dumps({
+        "TestName": "ndt7",
+        "DownloadValue": download,
+        "DownloadUnit": "Mbit/s",
+    }))
+
+
+def test_discover_deduplicates(tmp_path):
+    for i in range(3):
+        write_ndt7(tmp_path / ("ndt7-%d.jsonl" % i))
+    pattern = str(tmp_path / "*.jsonl")
+    paths = list(convert.discover([pattern, pattern]))
+    assert len(paths) == 3
+
+
+def test_export_csv_streams_generator(tmp_path):
+    for i in range(3):
+        write_ndt7(tmp_path / ("ndt7-%d.jsonl" % i), download=float(i))
+    paths = convert.discover([str(tmp_path / "*.jsonl")])
+    records = convert.import_records(paths, convert.import_ndt7)
+    output = tmp_path / "out.csv"
+    convert.export_csv(str(output), (r for _, r in records))
+    with open(str(output)) as f:
+        rows = list(csv.DictReader(f))
+    assert sorted(float(r["DownloadValue"]) for r in rows) == [0.0, 1.0, 2.0]
+
+
+def test_import_records_parallel(tmp_path):
+    paths = []
+    for i in range(20):
+        write_ndt7(tmp_path / ("ndt7-%02d.jsonl" % i), download=float(i))
+        paths.append(str(tmp_path / ("ndt7-%02d.jsonl" % i)))
+    bad = tmp_path / "bad.jsonl"
+    bad.write_text("not json")
+    paths.insert(5, str(bad))
+
+    errors = []
+    records = list(convert.import_records(
+        paths, convert.import_ndt7, jobs=2, errors=errors, chunksize=3))
+    assert [r["DownloadValue"] for _, r in records] == [float(i) for i in range(20)]
+    assert [path for path, _ in errors] == [str(bad)]
+
+
+def test_extract_pattern():
+    pattern = convert.compile_pattern("ndt7-%l-%n-%c-%d.jsonl")
+    assert convert.extract_pattern(
+        "ndt7-baltimore-home-wired-2020-02-25T17:02:40.918022.jsonl",
+        pattern) == {
+            "l": "baltimore",
+            "n": "home",
+            "c": "wired",
+            "d": "2020-02-25T17:02:40.918022",
+        }
+    assert convert.extract_pattern("ndt5-a-b-c-d.jsonl", pattern) is None
+    with pytest.raises(convert.ConvertException):
+        convert.compile_pattern("%x.jsonl")
+
+
+def test_manifest_skips_converted(tmp_path):
+    for i in range(3):
+        write_ndt7(tmp_path / ("ndt7-%d.jsonl" % i))
+    pattern = str(tmp_path / "*.jsonl")
+    partition = tmp_path / "out-1.csv"
+    manifest = convert.Manifest(str(tmp_path / "manifest"))
+    assert len(list(manifest.filter(convert.discover([pattern])))) == 3
+    manifest.record(str(partition))
+    manifest.close()
+
+    # Entries are ignored until their partition exists.
+    manifest = convert.Manifest(str(tmp_path / "manifest"))
+    assert len(list(manifest.filter(convert.discover([pattern])))) == 3
+    manifest.record(str(partition))
+    manifest.close()
+    partition.write_text("")
+
+    write_ndt7(tmp_path / "ndt7-3.jsonl")
+    manifest = convert.Manifest(str(tmp_path / "manifest"), use_hash=True)
+    assert list(manifest.filter(convert.discover([pattern]))) == [
+        str(tmp_path / "ndt7-3.jsonl")]
+    manifest.close()
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_manifest_retries_failed_inputs(tmp_path, monkeypatch, fmt):
+    if fmt == "parquet":
+        pytest.importorskip("pyarrow")
+    bad = tmp_path / "ndt7-bad.jsonl"
+    bad.write_text("not json")
+    output = str(tmp_path / "out" / ("out." + fmt))
+    os.makedirs(os.path.dirname(output))
+    argv = ["murakami-convert", "-t", "ndt7", "-f", fmt, "-o", output,
+            "-m", str(tmp_path / "manifest"), str(bad)]
+    monkeypatch.setattr("sys.argv", argv)
+
+    convert.main()
+    assert os.listdir(os.path.dirname(output)) == []
+
+    # The failed file is tried again, and recorded once it converts.
+    write_ndt7(bad)
+    convert.main()
+    assert len(os.listdir(os.path.dirname(output))) == 1
+    manifest = convert.Manifest(str(tmp_path / "manifest"))
+    assert list(manifest.filter([str(bad)])) == []
+
+
+
+def test_manifest_retries_failed_members(tmp_path, monkeypatch):
+    import io
+    import tarfile
+
+    bundle = str(tmp_path / "bundle.tar")
+    with tarfile.open(bundle, "w") as archive:
+        for name, data in (("ndt7-good.jsonl", b'{"TestName": "ndt7"}'),
+                           ("ndt7-bad.jsonl", b"not json")):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    output = str(tmp_path / "out.csv")
+    monkeypatch.setattr("sys.argv", [
+        "murakami-convert", "-t", "ndt7", "-o", output, "-m",
+        str(tmp_path / "manifest"), bundle
+    ])
+
+    convert.main()
+    manifest = convert.Manifest(str(tmp_path / "manifest"))
+    assert list(manifest.filter([bundle])) == [bundle]
+
+def test_manifest_skips_vanished_inputs(tmp_path):
+    errors = []
+    manifest = convert.Manifest(str(tmp_path / "manifest"))
+    missing = str(tmp_path / "ndt7-gone.jsonl")
+    assert list(manifest.filter([missing], errors)) == []
+    assert errors[0][0] == missing
+
+
+def test_export_parquet(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    records = [{
+        "TestName": "ndt7",
+        "TestStartTime": "2020-0%d-25T17:02:40.918022" % (1 + i % 2),
+        "ServerName": "server-%d" % (i % 3),
+        "DownloadValue": i if i % 5 else None,
+    } for i in range(10)]
+
+    output = tmp_path / "out.parquet"
+    convert.export_parquet(str(output), iter(records), row_group_size=4)
+    table = pq.read_table(str(output))
+    assert table.num_rows == 10
+    assert pq.ParquetFile(str(output)).num_row_groups == 3
+    assert table.schema.field("DownloadValue").type == "double"
+    assert str(table.schema.field("ServerName").type).startswith("dictionary")
+
+    output = tmp_path / "partitioned"
+    convert.export_parquet(str(output), iter(records), partition=True)
+    assert pq.read_table(
+        str(output / "test=ndt7" / "month=2020-02" /
+            "part-0.parquet")).num_rows == 5
+
+
+
+def test_export_parquet_late_columns(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    records = [{"TestName": "speedtest", "ServerLatency": None}
+               for _ in range(4)]
+    records += [{"TestName": "speedtest", "ServerLatency": 12.5,
+                 "TestError": "timed out"}]
+
+    output = tmp_path / "out.parquet"
+    convert.export_parquet(str(output), iter(records), row_group_size=2)
+    table = pq.read_table(str(output))
+    assert table.schema.field("ServerLatency").type == "double"
+    assert table.column("ServerLatency").to_pylist()[-1] == 12.5
+    assert table.column("TestError").to_pylist() == [None] * 4 + [
+        "timed out"]
+    assert pq.ParquetFile(str(output)).num_row_groups == 3
+    assert os.listdir(str(tmp_path)) == ["out.parquet"]
+
+def test_export_csv_schema_union(tmp_path):
+    records = [
+        {"TestName": "ndt7", "DownloadValue": 1.0},
+        {"TestName": "ndt7", "DownloadError": "timeout"},
+        {"TestName": "ndt7", "UploadError": "timeout", "DownloadValue": 2.0},
+    ]
+    output = tmp_path / "out.csv"
+    convert.export_csv(str(output), iter(records))
+    with open(str(output)) as f:
+        reader = csv.DictReader(f)
+        rows = list(reader)
+    assert reader.fieldnames == [
+        "TestName", "DownloadValue", "DownloadError", "UploadError"]
+    assert rows[1]["DownloadError"] == "timeout"
+    assert rows[2]["UploadError"] == "timeout"
+
+    convert.export_csv(str(output), iter(records), sample=1)
+    with open(str(output)) as f:
+        reader = csv.DictReader(f)
+        assert len(list(reader)) == 3
+    assert reader.fieldnames == ["TestName", "DownloadValue"]
+
+
+def test_discover_directory(tmp_path):
+    for d in ("a", "a/b", "c"):
+        (tmp_path / d).mkdir()
+        for i in range(3):
+            write_ndt7(tmp_path / d / ("ndt7-%d.jsonl" % i))
+            write_ndt7(tmp_path / d / ("ndt5-%d.jsonl" % i))
+    root = str(tmp_path)
+    assert list(convert.discover([root])) == []
+    assert len(list(convert.discover([root], recurse=True))) == 18
+    for walkers in (1, 4):
+        paths = list(convert.discover([root], recurse=True, prefix="ndt7",
+                                      walkers=walkers))
+        assert len(paths) == 9
+        assert all(os.path.basename(p).startswith("ndt7") for p in paths)
+
+
+def test_discover_symlink_loop(tmp_path):
+    (tmp_path / "a").mkdir()
+    write_ndt7(tmp_path / "a" / "ndt7-0.jsonl")
+    os.symlink(str(tmp_path), str(tmp_path / "a" / "loop"))
+    for walkers in (1, 4):
+        paths = list(convert.discover([str(tmp_path)], recurse=True,
+                                      walkers=walkers))
+        assert [os.path.basename(p) for p in paths] == ["ndt7-0.jsonl"]
+
+
+def test_import_compressed_and_archived(tmp_path):
+    import gzip
+    import io
+    import tarfile
+
+    record = json.dumps({"TestName": "ndt7", "DownloadValue": 1.0}).encode()
+    with gzip.open(str(tmp_path / "ndt7-a-home-wired-1.jsonl.gz"), "wb") as f:
+        f.write(record)
+    with tarfile.open(str(tmp_path / "bundle.tar.gz"), "w:gz") as archive:
+        for name, data in (("ndt7-b-home-wired-2.jsonl", record),
+                           ("ndt7-c-home-wired-3.jsonl.gz",
+                            gzip.compress(record)),
+                           ("ndt5-d-home-wired-4.jsonl", record)):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+
+    paths = convert.discover([str(tmp_path)], prefix="ndt7")
+    records = convert.annotate(
+        convert.import_records(paths, convert.import_ndt7, prefix="ndt7"),
+        "ndt7-%l-%n-%c-%d.jsonl")
+    locations = sorted(r["location"] for _, r in records)
+    assert locations == ["a", "b", "c"]
+
+
+def test_invalid_pattern_is_rejected(tmp_path, monkeypatch):
+    output = str(tmp_path / "out.csv")
+    monkeypatch.setattr("sys.argv", [
+        "murakami-convert", "-t", "ndt7", "-o", output, "-p", "%q-%d",
+        str(tmp_path)
+    ])
+    with pytest.raises(SystemExit) as exc:
+        convert.main()
+    assert exc.value.code == 2
+    assert not os.path.exists(output)
@@ -0,0 +1,69 @@
+import threading
+
+from murakami.exporter import DeliveryLog, MurakamiExporter, content_hash
+
+
+def test_content_hash():
+    assert content_hash('{"a": 1}') == content_hash(b'{"a": 1}')
+    assert content_hash('{"a": 1}') != content_hash('{"a": 2}')
+
+
+def test_delivery_log_bounded(tmp_path):
+    log = DeliveryLog(path=str(tmp_path / "delivered.log"), size=3)
+    for i in range(5):
+        log.add(content_hash(str(i)))
+    assert len(log) == 3
+    assert content_hash("0") not in log
+    assert content_hash("4") in log
+
+
+def test_delivery_log_persisted(tmp_path):
+    path = str(tmp_path / "delivered.log")
+    log = DeliveryLog(path=path, size=2)
+    for i in range(10):
+        log.add(content_hash(str(i)))
+    reloaded = DeliveryLog(path=path, size=2)
+    assert content_hash("9") in reloaded
+    assert content_hash("8") in reloaded
+    assert content_hash("7") not in reloaded
+    with open(path) as f:
+        assert len(f.readlines()) <= 4
+
+
+def test_exporter_skips_delivered(tmp_path):
+    exporter = MurakamiExporter(
+        name="test",
+        config={"dedup_path": str(tmp_path / "delivered.log")})
+    assert not exporter._is_delivered("result")
+    exporter._mark_delivered("result")
+    assert exporter._is_delivered("result")
+
+    exporter = MurakamiExporter(name="test", config={"dedup": "false"})
+    exporter._mark_delivered("result")
+    assert not exporter._is_delivered("result")
+
+
+def test_delivery_log_threads(tmp_path):
+    path = str(tmp_path / "delivered.log")
+    log = DeliveryLog(path=path, size=50)
+    failures = []
+
+    def deliver(thread):
+        try:
+            for i in range(200):
+                digest = content_hash("%d-%d" % (thread, i))
+                log.add(digest)
+                digest in log
+        except Exception as exc:
+            failures.append(exc)
+
+    threads = [threading.Thread(target=deliver, args=(t, )) for t in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert failures == []
+    assert len(log) == 50
+    # The log on disk agrees with the one in memory.
+    reloaded = DeliveryLog(path=path, size=50)
+    assert list(reloaded._hashes) == list(log._hashes)
@@ -0,0 +1,60 @@
+import json
+import logging
+import os
+
+import pytest
+
+pytest.importorskip("paramiko")
+pytest.importorskip("scp")
+
+from benchmarks.standins import PASSWORD, SSHStandin, USERNAME  # noqa: E402
+from murakami.exporters.local import LocalExporter  # noqa: E402
+from murakami.exporters.scp import SCPExporter  # noqa: E402
+
+
+@pytest.fixture
+def ssh(tmp_path):
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+    with SSHStandin(str(tmp_path / "ssh"), stall=0.2, seed=0) as standin:
+        yield standin
+
+
+def scp_exporter(ssh, tmp_path):
+    return SCPExporter(name="scp", config={
+        "target": "127.0.0.1:/results",
+        "port": ssh.port,
+        "username": USERNAME,
+        "password": PASSWORD,
+        "dedup_path": str(tmp_path / "delivered-scp.log"),
+    })
+
+
+@pytest.mark.parametrize("fault", ["error_rate", "drop_rate"])
+def test_scp_failure_is_retried_later(ssh, tmp_path, fault):
+    exporter = scp_exporter(ssh, tmp_path)
+    data = json.dumps({"TestName": "ndt7"})
+
+    setattr(ssh, fault, 1.0)
+    exporter.push("ndt7", data, "2020-02-25T17:02:40.918022")
+    assert ssh.received == 0
+    assert ssh.errors + ssh.drops == 1
+    # A failed push is not recorded as delivered, so it is sent again.
+    assert not exporter._is_delivered(data)
+
+    setattr(ssh, fault, 0.0)
+    exporter.push("ndt7", data, "2020-02-25T17:02:40.918022")
+    assert ssh.received == 1
+    assert exporter._is_delivered(data)
+
+
+def test_local_failure_is_not_marked_delivered(tmp_path):
+    exporter = LocalExporter(name="local", config={
+        "path": str(tmp_path / "missing"),
+        "dedup_path": str(tmp_path / "delivered-local.log"),
+    })
+    exporter.push("ndt7", "{}", "2020-02-25T17:02:40.918022")
+    assert not exporter._is_delivered("{}")
+
+    os.makedirs(str(tmp_path / "missing"))
+    exporter.push("ndt7", "{}", "2020-02-25T17:02:40.918022")
+    assert exporter._is_delivered("{}")
@@ -0,0 +1,78 @@
+import threading
+
+from murakami.exportqueue import ExportQueue
+
+
+class FakeExporter:
+    def __init__(self, name):
+        self.name = name
+
+
+def test_pushes_held_while_busy():
+    pushed = []
+    sent = threading.Event()
+
+    def push(exporter, test_name, data, timestamp):
+        pushed.append((exporter.name, test_name))
+        if len(pushed) == 3:
+            sent.set()
+
+    queue = ExportQueue(push, quiet=0.05)
+    scp = FakeExporter("scp")
+    queue.push(scp, "ndt7")
+    assert pushed == [("scp", "ndt7")]
+
+    queue.busy()
+    queue.push(scp, "ndt5")
+    queue.idle()
+    # Another run starts within the quiet window, so nothing is sent yet.
+    queue.busy()
+    queue.push(scp, "dash")
+    assert len(queue) == 2 and len(pushed) == 1
+
+    queue.idle()
+    assert sent.wait(5)
+    assert pushed[1:] == [("scp", "ndt5"), ("scp", "dash")]
+    assert len(queue) == 0
+
+
+class RecordingExporter(FakeExporter):
+    def __init__(self, name, remote, log):
+        super().__init__(name)
+        self.remote = remote
+        self.log = log
+
+    def push(self, test_name="", data=None, timestamp=None):
+        self.log.append((self.name, test_name))
+
+
+def test_server_defers_remote_exports():
+    from murakami.server import MurakamiServer
+
+    server = MurakamiServer(tests_per_day=0, config={},
+                            export_policy="deferred", export_quiet=0.05)
+    log = []
+    server._exporters = {
+        "local": RecordingExporter("local", False, log),
+        "scp": RecordingExporter("scp", True, log),
+    }
+
+    class Runner:
+        title = "ndt7"
+
+        def start_test(self):
+            server._call_exporters("ndt7", "{}")
+            # Local exports are not held back.
+            assert log == [("local", "ndt7")]
+            return "{}"
+
+    server._runners["ndt7"] = Runner()
+    server._call_runners()
+    run = server._runs.runs()[0]
+    assert run.wait(5)
+    assert run.errors == {}
+    for _ in range(100):
+        if len(log) == 2:
+            break
+        threading.Event().wait(0.01)
+    assert log == [("local", "ndt7"), ("scp", "ndt7")]
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import socket
+import time
+
+from tornado.testing import AsyncTestCase, gen_test
+
+from murakami.runners.latency import LatencyProbe
+
+
+class EchoServer(asyncio.DatagramProtocol):
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.transport.sendto(data, addr)
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestLatencyProbe(AsyncTestCase):
+    @gen_test
+    async def test_probes_and_rollups(self):
+        loop = asyncio.get_event_loop()
+        server = await asyncio.start_server(lambda r, w: w.close(),
+                                            "127.0.0.1", 0)
+        tcp_port = server.sockets[0].getsockname()[1]
+        echo, _ = await loop.create_datagram_endpoint(
+            EchoServer, local_addr=("127.0.0.1", 0))
+        udp_port = echo.get_extra_info("sockname")[1]
+
+        exported = []
+        probe = LatencyProbe(
+            config={
+                "targets": "127.0.0.1:%d, 127.0.0.1:%d" % (tcp_port,
+                                                           closed_port()),
+                "udp_targets": ["127.0.0.1:%d" % udp_port],
+                "interval": 3600,
+                "timeout": 0.5,
+            },
+            data_cb=lambda **kwargs: exported.append(kwargs),
+            location="lab",
+        )
+        for _ in range(5):
+            await probe.probe()
+        probe.roll_up(now=time.time() + 60)
+
+        rollups = json.loads(probe.start_test())["Rollups"]
+        by_target = {(r["Protocol"], r["Target"]): r for r in rollups}
+        tcp = by_target[("tcp", "127.0.0.1:%d" % tcp_port)]
+        assert tcp["Sent"] == tcp["Received"] == 5
+        assert tcp["LossRate"] == 0
+        assert 0 < tcp["MinRTTValue"] <= tcp["MedianRTTValue"] <= tcp[
+            "P95RTTValue"]
+        udp = by_target[("udp", "127.0.0.1:%d" % udp_port)]
+        assert udp["Received"] == 5
+        refused = [r for r in rollups if r["Received"] == 0]
+        assert len(refused) == 1
+        assert refused[0]["LossRate"] == 1
+        assert refused[0]["MedianRTTValue"] is None
+
+        probe.teardown()
+        for _ in range(50):
+            if exported:
+                break
+            await asyncio.sleep(0.01)
+        assert exported[0]["test_name"] == "latency"
+        result = json.loads(exported[0]["data"])
+        assert result["MurakamiLocation"] == "lab"
+        assert len(result["Rollups"]) == 3
+        assert json.loads(probe.start_test())["Rollups"] == []
+
+        server.close()
+        echo.close()
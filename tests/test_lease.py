@@ -0,0 +1,157 @@
+import asyncio
+import os
+import threading
+import time
+
+import tornado.web
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop
+
+from murakami.api import ResultBuffer, routes
+from murakami.lease import (Backoff, FileLease, HTTPLease, LeaseTable,
+                            from_url)
+from murakami.trigger import RunQueue
+
+
+def test_file_lease(tmp_path):
+    path = str(tmp_path / "murakami.lock")
+    first = FileLease(path, "device-1", ttl=60)
+    second = FileLease(path, "device-2", ttl=60)
+
+    assert first.acquire()
+    assert not second.acquire()
+    assert first.renew()
+    second.release()
+    assert not second.acquire()
+    first.release()
+    assert second.acquire()
+
+    # An expired lease is taken over.
+    second.ttl = -1
+    assert second.renew()
+    assert first.acquire()
+    assert not second.renew()
+
+
+def test_file_lease_takeover_race(tmp_path):
+    path = str(tmp_path / "murakami.lock")
+    expired = FileLease(path, "device-1", ttl=-1)
+    assert expired.acquire()
+    stale = expired._read()
+
+    # device-2 takes the lease over while device-3 still holds the expired
+    # lease it read earlier.
+    second = FileLease(path, "device-2", ttl=60)
+    third = FileLease(path, "device-3", ttl=60)
+    assert second.acquire()
+    third._read = lambda: stale
+    assert not third.acquire()
+    assert second._read()["holder"] == "device-2"
+    assert second.renew()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["murakami.lock"]
+
+
+def test_file_lease_uses_volume_clock(tmp_path, monkeypatch):
+    path = str(tmp_path / "murakami.lock")
+    first = FileLease(path, "device-1", ttl=60)
+    second = FileLease(path, "device-2", ttl=60)
+    assert first.acquire()
+
+    # device-2's clock is an hour ahead, which does not expire the lease.
+    monkeypatch.setattr(time, "time", lambda now=time.time: now() + 3600)
+    assert not second.acquire()
+    # It expires by the volume's clock once it goes unrenewed.
+    written = os.stat(path).st_mtime - 120
+    os.utime(path, (written, written))
+    assert second.acquire()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["murakami.lock"]
+
+
+def test_from_url(tmp_path):
+    assert isinstance(from_url("http://murakami.local/leases/site", "a"),
+                      HTTPLease)
+    assert from_url("file://%s/lock" % tmp_path, "a").path == "%s/lock" % (
+        tmp_path)
+
+
+class LeaseService:
+    """The lease service, run on its own IOLoop in a thread."""
+    def __init__(self):
+        self.table = LeaseTable()
+        started = threading.Event()
+
+        def serve():
+            asyncio.set_event_loop(asyncio.new_event_loop())
+            self.loop = IOLoop.current()
+            app = tornado.web.Application(routes(ResultBuffer(),
+                                                 leases=self.table))
+            self.server = HTTPServer(app)
+            self.server.listen(0, "127.0.0.1")
+            self.port = list(self.server._sockets.values())[0].getsockname()[1]
+            started.set()
+            self.loop.start()
+
+        self.thread = threading.Thread(target=serve, daemon=True)
+        self.thread.start()
+        started.wait(5)
+
+    def stop(self):
+        self.loop.add_callback(self.loop.stop)
+        self.thread.join(5)
+
+
+def test_http_lease():
+    service = LeaseService()
+    try:
+        url = "http://127.0.0.1:%d/leases/site" % service.port
+        first = HTTPLease(url, "device-1", ttl=60)
+        second = HTTPLease(url, "device-2", ttl=60)
+        assert first.acquire()
+        assert not second.acquire()
+        first.release()
+        assert second.acquire()
+    finally:
+        service.stop()
+
+
+class Runner:
+    def __init__(self, title, active):
+        self.title = title
+        self.active = active
+        self.overlaps = 0
+
+    def start_test(self):
+        with self.active["lock"]:
+            self.active["count"] += 1
+            if self.active["count"] > 1:
+                self.overlaps += 1
+        time.sleep(0.05)
+        with self.active["lock"]:
+            self.active["count"] -= 1
+
+
+def test_devices_take_turns():
+    service = LeaseService()
+    try:
+        url = "http://127.0.0.1:%d/leases/site" % service.port
+        active = {"count": 0, "lock": threading.Lock()}
+        devices = []
+        for i in range(3):
+            runner = Runner("ndt7", active)
+            queue = RunQueue({"ndt7": runner},
+                             lease=HTTPLease(url, "device-%d" % i, ttl=60),
+                             backoff=Backoff(base=0.01, maximum=0.05))
+            devices.append((runner, queue))
+        runs = [queue.request() for _ in range(2) for _, queue in devices]
+        for run in runs:
+            assert run.wait(10)
+        assert sum(runner.overlaps for runner, _ in devices) == 0
+    finally:
+        service.stop()
+
+
+def test_unreachable_lease_runs_anyway():
+    active = {"count": 0, "lock": threading.Lock()}
+    queue = RunQueue({"ndt7": Runner("ndt7", active)},
+                     lease=HTTPLease("http://127.0.0.1:1/leases/site", "a"))
+    assert queue.request().wait(10)
@@ -0,0 +1,96 @@
+import os
+import sys
+import threading
+
+import pytest
+
+from murakami.priority import ClientPriority, parse_cpus
+import murakami.priority as priority_module
+import murakami.utils as utils
+
+
+def test_parse_cpus():
+    assert parse_cpus("0-1,3") == [0, 1, 3]
+    assert parse_cpus([2, 2, 1]) == [1, 2]
+    with pytest.raises(ValueError):
+        parse_cpus(",")
+
+
+def test_invalid_options_are_ignored():
+    priority = ClientPriority({"cpu_affinity": "1024", "ionice_class": "x"})
+    assert priority.command(["true"]) == ["true"]
+    fields = priority.fields()
+    assert fields["MurakamiClientCPUs"] is None
+    assert fields["MurakamiClientIOClass"] is None
+
+
+@pytest.mark.skipif(os.geteuid() != 0, reason="needs to raise priorities")
+def test_client_runs_with_priority():
+    cpu = min(os.sched_getaffinity(0))
+    priority = ClientPriority({
+        "cpu_affinity": str(cpu),
+        "nice": 5,
+        "ionice_class": "best-effort",
+        "ionice_level": 7,
+        "daemon_nice": 10,
+    })
+
+    # A daemon thread to be lowered while the client runs.
+    seen = {}
+    ready = threading.Event()
+    done = threading.Event()
+
+    def daemon_thread():
+        seen["tid"] = priority_module._thread_id()
+        ready.set()
+        done.wait(5)
+
+    thread = threading.Thread(target=daemon_thread)
+    thread.start()
+    ready.wait(5)
+    before = os.getpriority(os.PRIO_PROCESS, seen["tid"])
+    output = utils.run_client([
+        sys.executable, "-c",
+        "import os; print(os.nice(0), sorted(os.sched_getaffinity(0)), "
+        "os.getpriority(os.PRIO_PROCESS, %d))" % seen["tid"]
+    ], priority=priority)
+    after = os.getpriority(os.PRIO_PROCESS, seen["tid"])
+    done.set()
+    thread.join()
+
+    assert output.stdout.split(" ", 1) == ["5", "[%d] 10\n" % cpu]
+    assert before == after
+    fields = utils.resource_fields(utils.load_average(), output)
+    assert fields["MurakamiClientCPUs"] == str(cpu)
+    assert fields["MurakamiClientNice"] == 5
+    assert fields["MurakamiClientIOClass"] == "best-effort"
+    assert fields["MurakamiClientIOLevel"] == 7
+    assert fields["MurakamiDaemonNice"] == 10
+
+
+@pytest.mark.skipif(os.geteuid() != 0, reason="needs to raise priorities")
+def test_daemon_lowered_without_native_id(monkeypatch):
+    # Before Python 3.8 the client thread's id comes from /proc instead.
+    monkeypatch.setattr(priority_module, "_get_native_id", None)
+    priority = ClientPriority({"daemon_nice": 10})
+    seen = {}
+
+    def client_thread():
+        before = os.getpriority(os.PRIO_PROCESS, 0)
+        with priority.lowered_daemon():
+            seen["client"] = os.getpriority(os.PRIO_PROCESS, 0) == before
+            seen["daemon"] = os.getpriority(os.PRIO_PROCESS, os.getpid())
+
+    thread = threading.Thread(target=client_thread)
+    thread.start()
+    thread.join()
+    assert seen == {"client": True, "daemon": 10}
+
+
+def test_daemon_not_lowered_without_thread_id(monkeypatch, caplog):
+    monkeypatch.setattr(priority_module, "_thread_id", lambda: None)
+    priority = ClientPriority({"daemon_nice": 19})
+    before = os.getpriority(os.PRIO_PROCESS, os.getpid())
+    with priority.lowered_daemon():
+        assert os.getpriority(os.PRIO_PROCESS, os.getpid()) == before
+    assert "not lowering" in caplog.text
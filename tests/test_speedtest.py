@@ -0,0 +1,80 @@
+import json
+import subprocess
+
+import murakami.runners.speedtest as speedtest_runner
+from murakami.runners.speedtest import SpeedtestClient
+from murakami.runners.speedtestsingle import SpeedtestSingleClient
+
+SUMMARY = {
+    "download": 9.5e7,
+    "upload": 1.2e7,
+    "ping": 21.3,
+    "server": {"url": "http://speedtest.example.net/upload.php",
+               "name": "Baltimore, MD", "id": "1234", "latency": 21.3},
+    "timestamp": "2020-01-01T00:00:00.000000Z",
+    "bytes_sent": 1000,
+    "bytes_received": 2000,
+    "share": None,
+    "client": {"ip": "192.0.2.1", "isp": "Example ISP", "country": "US"},
+}
+
+
+class FakeResults:
+    def __init__(self, client, opener, secure):
+        pass
+
+    def dict(self):
+        return SUMMARY
+
+
+class FakeSpeedtest:
+    instances = 0
+
+    def __init__(self):
+        FakeSpeedtest.instances += 1
+        self.config = {"client": {}}
+        self._opener = self._secure = None
+
+    def get_servers(self):
+        pass
+
+    def get_best_server(self):
+        pass
+
+    def download(self, threads=None):
+        pass
+
+    def upload(self, threads=None, pre_allocate=True):
+        pass
+
+
+class FakeModule:
+    Speedtest = FakeSpeedtest
+    SpeedtestResults = FakeResults
+    SpeedtestException = Exception
+
+
+def test_inprocess_mode_reuses_config(monkeypatch):
+    monkeypatch.setattr(speedtest_runner, "speedtest", FakeModule)
+    monkeypatch.setattr(speedtest_runner, "_session",
+                        speedtest_runner._Session())
+    config = {"mode": "inprocess"}
+
+    multi = json.loads(SpeedtestClient(config=config).start_test())
+    single = json.loads(SpeedtestSingleClient(config=config).start_test())
+    assert FakeSpeedtest.instances == 1
+
+    expected = SpeedtestClient._parse_summary(
+        subprocess.CompletedProcess([], 0, stdout=json.dumps(SUMMARY)))
+    for result in (multi, single):
+        assert {k: result[k] for k in expected} == expected
+    assert multi["TestName"] == "speedtest-cli-multi-stream"
+    assert single["TestName"] == "speedtest-cli-single-stream"
+    assert multi["MurakamiClientUserTime"] is not None
+
+
+def test_failed_summary_has_error():
+    summary = SpeedtestClient._parse_summary(
+        subprocess.CompletedProcess([], 1, stdout="", stderr="no servers"))
+    assert summary["TestError"] == "no servers"
+    assert summary["DownloadValue"] is None
@@ -0,0 +1,34 @@
+from collections import ChainMap
+import json
+import os
+
+from murakami.state import DynamicState
+
+
+def test_nested_changes_are_written_behind(tmp_path):
+    path = str(tmp_path / "config.json")
+    state = DynamicState(path, delay=60)
+    config = ChainMap(state, {"tests": {"ndt7": {"enabled": True}}})
+
+    config["tests"] = {}
+    config["tests"]["ndt7"] = {}
+    config["tests"]["ndt7"]["enabled"] = "n"
+    config["tests"]["ndt7"]["enabled"] = "y"
+    assert config["tests"]["ndt7"].get("enabled") == "y"
+    assert not os.path.exists(path)
+
+    state.flush()
+    with open(path) as f:
+        assert json.load(f) == {"tests": {"ndt7": {"enabled": "y"}}}
+
+
+def test_reloads_when_file_changes(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"tests": {"ndt7": {"enabled": "y"}}}))
+    state = DynamicState(str(path))
+    runner_config = state["tests"]["ndt7"]
+    assert runner_config["enabled"] == "y"
+
+    path.write_text(json.dumps({"tests": {"ndt7": {"enabled": "no"}}}))
+    os.utime(str(path), ns=(0, 0))
+    assert runner_config["enabled"] == "no"
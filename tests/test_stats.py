@@ -0,0 +1,60 @@
+import pytest
+
+numpy = pytest.importorskip("numpy")
+pytest.importorskip("configargparse")
+
+from scripts import convert, stats  # noqa: E402
+
+
+def test_grouped_stats_matches_numpy():
+    rng = numpy.random.RandomState(0)
+    codes = rng.randint(0, 4, size=1000)
+    values = rng.exponential(100, size=1000)
+    values[::7] = numpy.nan
+    result = stats.grouped_stats(codes, values, 5, [0.1, 0.5, 0.95])
+    for group in range(4):
+        expected = values[(codes == group) & ~numpy.isnan(values)]
+        assert result["count"][group] == len(expected)
+        assert result["mean"][group] == pytest.approx(expected.mean())
+        for q in (0.1, 0.5, 0.95):
+            assert result["p%g" % (q * 100)][group] == pytest.approx(
+                numpy.quantile(expected, q))
+    assert result["count"][4] == 0
+
+
+def test_summarise_normalises_units(tmp_path):
+    records = [{
+        "MurakamiLocation": "baltimore",
+        "TestStartTime": "2020-02-25T17:02:40.918022",
+        "DownloadValue": 100.0,
+        "DownloadUnit": "Mbit/s",
+    }, {
+        "MurakamiLocation": "baltimore",
+        "TestStartTime": "2020-02-25T18:02:40.918022",
+        "DownloadValue": 300e6,
+        "DownloadUnit": "Bit/s",
+    }, {
+        "MurakamiLocation": "corciano",
+        "TestStartTime": "2020-02-26T18:02:40.918022",
+        "DownloadValue": 50.0,
+        "DownloadUnit": "Mbit/s",
+    }]
+    output = tmp_path / "out.csv"
+    convert.export_csv(str(output), iter(records))
+    rows = list(stats.summarise([str(output)], ["DownloadValue"],
+                                ["location", "day"], [0.5]))
+    assert rows == [{
+        "location": "baltimore",
+        "day": "2020-02-25",
+        "metric": "DownloadValue",
+        "count": 2,
+        "mean": 200.0,
+        "p50": 200.0,
+    }, {
+        "location": "corciano",
+        "day": "2020-02-26",
+        "metric": "DownloadValue",
+        "count": 1,
+        "mean": 50.0,
+        "p50": 50.0,
+    }]
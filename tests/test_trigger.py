@@ -0,0 +1,108 @@
+import json
+import threading
+
+import pytest
+import tornado.web
+from tornado.testing import AsyncHTTPTestCase
+
+from murakami.api import ResultBuffer, routes
+from murakami.errors import RunnerError
+from murakami.lease import Backoff
+from murakami.trigger import DONE, RunQueue
+
+
+class FakeRunner:
+    def __init__(self, title, fail=False):
+        self.title = title
+        self.fail = fail
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+        self.started = threading.Event()
+
+    def start_test(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        if self.fail:
+            raise RunnerError(self.title, "client missing")
+        return json.dumps({"TestName": self.title})
+
+
+def test_requests_are_coalesced():
+    runners = {"ndt5": FakeRunner("ndt5"), "ndt7": FakeRunner("ndt7")}
+    runners["ndt7"].release.clear()
+    queue = RunQueue(runners)
+
+    running = queue.request(["ndt7"])
+    runners["ndt7"].started.wait(5)
+    # Covered by the run in progress.
+    assert queue.request(["ndt7"]) is running
+    # Not covered, so queued; later requests are merged into it.
+    queued = queue.request(["ndt5"])
+    assert queued is not running
+    assert queue.request() is queued
+    assert queue.request(["ndt5"]) is queued
+    assert sorted(queued.runners) == ["ndt5", "ndt7"]
+    assert queued.requests == 3
+
+    runners["ndt7"].release.set()
+    assert queued.wait(5)
+    assert running.status == queued.status == DONE
+    assert runners["ndt7"].calls == 2
+    assert runners["ndt5"].calls == 1
+    assert queued.as_dict()["results"]["ndt5"] == {"TestName": "ndt5"}
+    assert queue.runs() == [queued, running]
+
+
+def test_errors_and_unknown_runners():
+    queue = RunQueue({"dash": FakeRunner("dash", fail=True)})
+    with pytest.raises(KeyError):
+        queue.request(["ndt7"])
+    run = queue.request()
+    assert run.wait(5)
+    assert run.errors == {"dash": "client missing"}
+
+
+class TestRunsAPI(AsyncHTTPTestCase):
+    def get_app(self):
+        self.runs = RunQueue({"ndt7": FakeRunner("ndt7")})
+        return tornado.web.Application(routes(ResultBuffer(), self.runs))
+
+    def test_trigger_and_poll(self):
+        response = self.fetch("/runs?test=ndt7", method="POST", body="")
+        assert response.code == 202
+        run = json.loads(response.body)
+        assert response.headers["Location"] == "/runs/" + run["id"]
+        self.runs.get(run["id"]).wait(5)
+
+        response = self.fetch(response.headers["Location"])
+        assert json.loads(response.body)["results"] == {
+            "ndt7": {"TestName": "ndt7"}}
+        assert self.fetch("/runs/abc123").code == 404
+        assert self.fetch("/runs?test=x", method="POST", body="").code == 404
+
+
+class FakePrecheck:
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+
+    def check(self):
+        ok = self.outcomes.pop(0)
+        return {"ok": ok, "target": "example.com", "step": None if ok else
+                "dns", "error": None if ok else "lookup failed"}
+
+
+def test_offline_runs_are_deferred():
+    runner = FakeRunner("ndt7")
+    offline = []
+    queue = RunQueue({"ndt7": runner},
+                     precheck=FakePrecheck([False, False, True]),
+                     precheck_backoff=Backoff(0.01, 0.02),
+                     offline_cb=lambda *args: offline.append(args))
+    run = queue.request()
+    assert run.wait(5)
+    assert runner.calls == 1
+    assert run.deferrals == 2
+    assert [check["step"] for _, check, _ in offline] == ["dns", "dns"]
+    assert all(r is run and delay <= 0.02 for r, _, delay in offline)
@@ -0,0 +1,37 @@
+import subprocess
+import sys
+
+import pytest
+
+import murakami.utils as utils
+
+
+def test_run_client_collects_rusage():
+    output = utils.run_client([
+        sys.executable, "-c",
+        "import sys, time\n"
+        "end = time.process_time() + 0.2\n"
+        "while time.process_time() < end: pass\n"
+        "print('{\"ok\": true}'); print('oops', file=sys.stderr)"
+    ])
+    assert output.returncode == 0
+    assert output.stdout == '{"ok": true}\n'
+    assert output.stderr == "oops\n"
+    assert output.rusage.ru_utime + output.rusage.ru_stime >= 0.15
+    assert output.rusage.ru_maxrss > 0
+
+    fields = utils.resource_fields((0.5, 0.25, 0.125), output)
+    assert fields["MurakamiLoadAverage1"] == 0.5
+    assert fields["MurakamiClientUserTime"] == output.rusage.ru_utime
+    assert fields["MurakamiClientMaxRSS"] == output.rusage.ru_maxrss
+
+
+def test_run_client_return_codes():
+    output = utils.run_client(
+        [sys.executable, "-c", "import os; os.kill(os.getpid(), 9)"])
+    assert output.returncode == -9
+    with pytest.raises(subprocess.CalledProcessError):
+        utils.run_client([sys.executable, "-c", "exit(3)"], check=True)
+    fields = utils.resource_fields((None, None, None), None)
+    assert fields["MurakamiClientSystemTime"] is None
+    assert fields["MurakamiClientNice"] is None